@@ -1,15 +1,32 @@
+from functools import lru_cache
 import importlib
 import json
+import logging
 import re
 import traceback
 
+from db.executor import DBExecutor, SyncConnection
 from util import init_logger, deep_clone
 
 _LOGGER = init_logger(__name__)
+_SERIALIZED_RE = re.compile(r'^\$([a-zA-Z0-9,\._]+)~(.+)$')
+
+
+@lru_cache(maxsize=256)
+def _import_class(sclassname):
+    try:
+        classname = sclassname.split(',')
+        foo = importlib.import_module(classname[0])
+        return getattr(foo, classname[1])
+    except Exception:
+        _LOGGER.debug(f'get_class({sclassname}) Exception {traceback.format_exc()}')
+        return None
 
 
 class SerializableDBObj(object):
 
+    __slots__ = ()
+
     # cls.__columns__
 
     # __create_table_query__
@@ -23,6 +40,8 @@ class SerializableDBObj(object):
     __wherejoin__ = None
     __joinclass__ = None
     __load_order__ = None
+    # _db_orig: DB values of the update columns when loaded or saved
+    __track_changes__ = True
 
     @classmethod
     def fullname(o):
@@ -42,12 +61,9 @@ class SerializableDBObj(object):
     @classmethod
     def get_class(cls, sclassname):
         if sclassname:
-            try:
-                classname = sclassname.split(',')
-                foo = importlib.import_module(classname[0])
-                return getattr(foo, classname[1])
-            except Exception:
-                _LOGGER.debug(f'get_class({sclassname}) Exception {traceback.format_exc()}')
+            rv = _import_class(sclassname)
+            if rv:
+                return rv
         return cls
 
     @classmethod
@@ -57,84 +73,161 @@ class SerializableDBObj(object):
             strcol += f'{tablename}.{t} AS {hasprefix}{t},'
         return strcol[0:-1]
 
+    @classmethod
+    def get_db_cache(cls):
+        cache = cls.__dict__.get('__db_cache__')
+        if cache is None:
+            cache = cls.build_db_cache()
+        return cache
+
+    @classmethod
+    def build_db_cache(cls):
+        select = order = None
+        if cls.__columns__:
+            select = f'SELECT {cls.select_string()} FROM {cls.__table__} AS P'
+            order = ''
+            if cls.__load_order__:
+                order = ' ORDER BY ' + ','.join([f'{k} {i}' for k, i in cls.__load_order__.items()])
+        cache = dict(
+            select=select,
+            order=order,
+            insert=dict(),
+            update=dict(),
+            cols=dict(),
+            fields=dict())
+        setattr(cls, '__db_cache__', cache)
+        return cache
+
+    @classmethod
+    def get_field_info(cls, key):
+        fields = cls.get_db_cache()['fields']
+        info = fields.get(key)
+        if info is None:
+            fln = cls.fld(key)
+            info = fields[key] = (fln, cls.resolve_setter(fln), cls.is_json_field(fln))
+        return info
+
+    @classmethod
+    def resolve_setter(cls, fln):
+        return getattr(cls, f'_set_{fln}', None)
+
+    @classmethod
+    def get_columns_info(cls, cols):
+        colsd = cls.get_db_cache()['cols']
+        info = colsd.get(cols)
+        if info is None:
+            info = colsd[cols] = tuple([(t, cls.fld(t), cls.is_json_field(cls.fld(t))) for t in cols])
+        return info
+
     @classmethod
     async def load1m(cls, db, rowid=None, **kwargs):
+        """Load the objects and their items (__joinclass__ rows): two queries."""
+        if isinstance(db, DBExecutor):
+            return await db.run_coro(cls.load1m, rowid=rowid, **kwargs)
         pls = await cls.loadbyid(db, rowid=rowid, **kwargs)
-        if cls.__wherejoin__ and cls.__joinclass__:
+        if cls.__wherejoin__ and cls.__joinclass__ and pls:
+            joincls = SerializableDBObj.get_class(cls.__joinclass__)
+            cond, subs, _ = cls.where_clause(rowid, kwargs)
+            cache = joincls.get_db_cache()
+            query = f'{cache["select"]} WHERE P.{cls.__wherejoin__} IN '\
+                f'(SELECT P.{cls.__id__} FROM {cls.__table__} AS P{cond}){cache["order"]}'
+            _LOGGER.debug('Querying %s (pars=%s)', query, subs)
+            items = dict()
+            for it in await joincls.rows_to_objects(await db.execute(query, subs)):
+                key = it.f(cls.__wherejoin__)
+                lst = items.get(key)
+                if lst is None:
+                    items[key] = [it]
+                else:
+                    lst.append(it)
             for p in pls:
-                cond = {cls.__wherejoin__: p.rowid}
-                pls2 = await SerializableDBObj.get_class(cls.__joinclass__).loadbyid(db, rowid=None, **cond)
-                p.set_items(pls2)
+                p.set_items(items.get(p.rowid, []))
         return pls
 
     @classmethod
-    async def loadbyid(cls, db, rowid=None, **kwargs):
-        pls = []
-        strcol = cls.select_string()
-        query = f'''
-            SELECT {strcol}
-            FROM {cls.__table__} AS P
-        '''
-
-        if rowid is not None:
-            kwargs[cls.__id__] = rowid
+    def where_clause(cls, rowid, kwargs):
         cond = ''
         subs = ()
-        order = ''
-        if cls.__load_order__:
-            order = ' ORDER BY '
-            for k, i in cls.__load_order__.items():
-                order += f'{k} {i},'
-            order = order[0:-1]
+        order = None
+        if rowid is not None:
+            kwargs = dict(kwargs)
+            kwargs[cls.__id__] = rowid
         for k, i in kwargs.items():
             if k == 'order':
                 order = f' ORDER BY {i}'
             else:
                 cond += f" {'WHERE' if not cond else 'AND'} P.{k}=? "
                 subs += (i,)
-        query += cond + order
-        _LOGGER.debug(f'Querying {query} (pars={subs})')
-        cursor = await db.execute(query, subs)
+        return cond, subs, order
+
+    @classmethod
+    async def rows_to_objects(cls, cursor):
+        pls = []
+        classes = dict()
         async for row in cursor:
             keys = row.keys()
             clname = row['classname'] if 'classname' in keys else None
-            pl = cls.get_class(clname)(dbitem=row)
-            _LOGGER.debug("%s %s" % (cls.__name__, str(pl)))
+            clrow = classes.get(clname)
+            if clrow is None:
+                clrow = classes[clname] = cls.get_class(clname)
+            pl = clrow(dbitem=row)
+            if pl.__track_changes__:
+                pl._db_orig = {c: row[c] for c in pl.__update_columns__ or pl.__columns__}
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("%s %s" % (cls.__name__, str(pl)))
             pls.append(pl)
         return pls
 
+    @classmethod
+    async def loadbyid(cls, db, rowid=None, **kwargs):
+        if isinstance(db, DBExecutor):
+            return await db.run_coro(cls.loadbyid, rowid=rowid, **kwargs)
+        cache = cls.get_db_cache()
+        cond, subs, order = cls.where_clause(rowid, kwargs)
+        query = cache['select'] + cond + (cache['order'] if order is None else order)
+        _LOGGER.debug('Querying %s (pars=%s)', query, subs)
+        return await cls.rows_to_objects(await db.execute(query, subs))
+
     @classmethod
     def fld(cls, key):
-        return key if key not in cls.__columns2field__ else cls.__columns2field__[key]
+        return cls.__columns2field__.get(key, key)
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             return self.rowid is not None and self.rowid == other.rowid
 
     def __str__(self):
-        return str(vars(self))
+        return str(self.get_vars())
+
+    def get_vars(self):
+        dct = vars(self)
+        if '_db_orig' in dct:
+            dct = dict(dct)
+            del dct['_db_orig']
+        return dct
 
     def set_items(self, items):
         self.items = items
 
     def clone(self):
-        dct = deep_clone(vars(self))
+        dct = deep_clone(self.get_vars())
         cl = self.__class__()
         cl.process_kwargs(dct)
         return cl
 
     def _set_single_field(self, key, val):
-        fln = self.fld(key)
-        if self.is_json_field(fln) and isinstance(val, str):
-            v = json.loads(val) if val else None
-        else:
-            v = val
-        try:
-            setmethod = getattr(self, f'_set_{fln}')
-            setmethod(v)
-        except Exception:
-            # _LOGGER.debug(f'SetMethod not found for {fln} ({traceback.format_exc()})')
-            setattr(self, fln, v)
+        fln, setmethod, isjson = self.get_field_info(key)
+        if isjson and isinstance(val, str):
+            val = json.loads(val) if val else None
+        if setmethod:
+            try:
+                setmethod(self, val)
+                return
+            except Exception:
+                # a setter that cannot handle the value (e.g. a DB row)
+                # does not abort the load: the raw value is kept
+                pass
+        setattr(self, fln, val)
 
     def process_kwargs(self, dbitem):
         if dbitem:
@@ -151,13 +244,9 @@ class SerializableDBObj(object):
             if i in ks:
                 del kwargs[i]
         self.process_kwargs(kwargs)
-        for c in self.__columns__:
-            f = self.fld(c)
-            try:
-                getattr(self, f)
-            except AttributeError:
+        for _, f, _ in self.get_columns_info(self.__columns__):
+            if not hasattr(self, f):
                 setattr(self, f, None)
-                # _LOGGER.debug(f'Set {self.__class__.__name__}.{f} ({c}) = None')
         setattr(self, 'rowid', getattr(self, self.__id__))
 
     def get_id(self):
@@ -171,13 +260,19 @@ class SerializableDBObj(object):
     def set_update_columns(cls):
         if cls.__update_columns__ is None:
             cls.__update_columns__ = cls.__columns__
+        cache = cls.build_db_cache()
+        cls.get_columns_info(cls.__columns__)
+        cls.get_columns_info(cls.__update_columns__)
+        for c in cls.__columns__:
+            cls.get_field_info(c)
+        return cache
 
     @staticmethod
     def is_serialized_str(s):
-        return isinstance(s, str) and re.search(r'^\$([a-zA-Z0-9,\._]+)~(.+)$', s)
+        return isinstance(s, str) and s[0:1] == '$' and _SERIALIZED_RE.search(s)
 
     def serialize(self):
-        dct = dict(vars(self))
+        dct = dict(self.get_vars())
         for d, k in dct.copy().items():
             if isinstance(k, SerializableDBObj):
                 dct[d] = k.serialize()
@@ -192,10 +287,7 @@ class SerializableDBObj(object):
         self._set_single_field(name, val)
 
     def _f(self, name, typetuple=None):
-        try:
-            a = getattr(self, self.fld(name))
-        except AttributeError:
-            a = None
+        a = getattr(self, self.fld(name), None)
         return None if typetuple and (a is None or not isinstance(a, typetuple)) else a
 
     def f(self, name, typetuple=None):
@@ -222,27 +314,33 @@ class SerializableDBObj(object):
                 if dct:
                     for d, k in dct.copy().items():
                         if d.startswith('items'):
-                            _LOGGER.debug(f'Items arr {k}')
+                            _LOGGER.debug('Items arr %s', k)
                             items2 = []
                             for it in k:
                                 items2.append(SerializableDBObj.deserialize(it))
                             dct[d] = items2
-                        else:
+                        elif isinstance(k, str) and k[0:1] == '$':
                             dct[d] = SerializableDBObj.deserialize(k, k)
-                    _LOGGER.debug(f'Deserialized {dct}')
+                    _LOGGER.debug('Deserialized %s', dct)
                     cl = SerializableDBObj.get_class(rer.group(1))()
                     cl.process_kwargs(dct)
                     return cl
             # else:
             #     _LOGGER.debug(f'Invalid serialized str {jsons}')
-        except Exception:
-            _LOGGER.error(f'Deserialize error {traceback.format_exc()}')
+        except Exception as ex:
+            _LOGGER.error(f'Deserialize error {ex!r}')
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug(traceback.format_exc())
         return rv
 
-    def is_json_field(sel, fln):
+    @classmethod
+    def is_json_field(cls, fln):
         return fln.find('settings') >= 0 or fln.find('conf') >= 0
 
     async def delete(self, db, commit=True):
+        if isinstance(db, DBExecutor):
+            # with commit, the unit is also rolled back when it raises
+            return await db.run_coro(self.delete, commit, commit=commit)
         rv = False
         if self.rowid:
             async with db.cursor() as cursor:
@@ -255,58 +353,325 @@ class SerializableDBObj(object):
             await db.commit()
         return rv
 
-    async def to_db(self, db, commit=True):
+    def get_db_values(self, cols):
         values = []
         colnames = []
-        strcol = ''
-        key = self.rowid
-        cols = self.__columns__ if key is None else self.__update_columns__
-        for t in cols:
-            v = self.f(t)
+        for t, fln, isjson in self.get_columns_info(cols):
+            v = getattr(self, fln, None)
             if v is not None:
-                fln = self.fld(t)
-                if self.is_json_field(fln) and not isinstance(v, str):
+                if isjson and not isinstance(v, str):
                     v = json.dumps(v) if v else None
                 values.append(v)
                 colnames.append(t)
-                strcol += '?,' if key is None else f'{t}=?,'
-        strcol = strcol[0:-1]
+        return colnames, values
+
+    @classmethod
+    def insert_query(cls, colnames):
+        queries = cls.get_db_cache()['insert']
+        key = tuple(colnames)
+        query = queries.get(key)
+        if query is None:
+            query = queries[key] =\
+                f'INSERT OR IGNORE into {cls.__table__} ({",".join(colnames)}) VALUES ({",".join("?" * len(colnames))})'
+        return query
+
+    @classmethod
+    def update_query(cls, colnames):
+        queries = cls.get_db_cache()['update']
+        key = tuple(colnames)
+        query = queries.get(key)
+        if query is None:
+            strcol = ','.join([f'{t}=?' for t in colnames])
+            query = queries[key] = f'UPDATE {cls.__table__} SET {strcol} WHERE {cls.__id__}=?'
+        return query
+
+    def get_dirty_values(self, orig=None):
+        """Update columns (and their values) that differ from orig.
+
+        orig (by default the values captured when the object was loaded or
+        last saved) maps column names to their DB values: without it every
+        column is dirty.
+        """
+        colnames, values = self.get_db_values(self.__update_columns__ or self.__columns__)
+        if orig is None:
+            orig = getattr(self, '_db_orig', None)
+            if orig is None:
+                return colnames, values
+        dirtyc = []
+        dirtyv = []
+        for c, v in zip(colnames, values):
+            if c not in orig or orig[c] != v:
+                dirtyc.append(c)
+                dirtyv.append(v)
+        return dirtyc, dirtyv
+
+    def get_db_orig(self):
+        if self.__track_changes__:
+            colnames, values = self.get_db_values(self.__update_columns__ or self.__columns__)
+            return dict(zip(colnames, values))
+        return None
+
+    def set_db_orig(self, orig=None):
+        if self.__track_changes__:
+            self._db_orig = self.get_db_orig() if orig is None else orig
+
+    async def to_db(self, db, commit=True):
+        """Save the object (and its items) in the DB.
+
+        The new DB values (and the ids of the inserted objects) are
+        collected while saving and only become the objects' originals once
+        every statement succeeded (and was committed, when commit is True):
+        on failure the inserted objects get back a None id.
+        """
+        if isinstance(db, DBExecutor):
+            return await db.run_coro(self.to_db, commit, commit=commit)
+        saved = []
+        inserted = []
+        rv = False
+        try:
+            rv = await self._to_db(db, saved, inserted)
+            if commit:
+                if rv:
+                    await db.commit()
+                else:
+                    await db.rollback()
+        except Exception:
+            rv = False
+            if commit:
+                # the statements already run would be committed by the next unit
+                try:
+                    await db.rollback()
+                except Exception:
+                    _LOGGER.warning(f'Rollback error {traceback.format_exc()}')
+            raise
+        finally:
+            if rv:
+                for obj, orig in saved:
+                    obj.set_db_orig(orig)
+            else:
+                for obj in inserted:
+                    obj.set_id(None)
+        return rv
+
+    async def _to_db(self, db, saved, inserted):
+        key = self.rowid
         if key:
-            async with db.cursor() as cursor:
-                values.append(key)
-                query = f'UPDATE {self.__table__} SET {strcol} WHERE {self.__id__}=?'
-                _LOGGER.debug(f'Updating: {query} (par={values})')
-                await cursor.execute(query, tuple(values))
-                if cursor.rowcount <= 0:
-                    return False
+            colnames, values = self.get_dirty_values()
+            # nothing changed since it was loaded: no query at all
+            if colnames:
+                async with db.cursor() as cursor:
+                    values.append(key)
+                    query = self.update_query(colnames)
+                    _LOGGER.debug('Updating: %s (par=%s)', query, values)
+                    await cursor.execute(query, tuple(values))
+                    if cursor.rowcount <= 0:
+                        return False
         else:
+            colnames, values = self.get_db_values(self.__columns__)
             async with db.cursor() as cursor:
-                query = f'INSERT OR IGNORE into {self.__table__} ({",".join(colnames)}) VALUES ({strcol})'
-                _LOGGER.debug(f'Inserting: {query} (par={values})')
+                query = self.insert_query(colnames)
+                _LOGGER.debug('Inserting: %s (par=%s)', query, values)
                 await cursor.execute(query, tuple(values))
                 if cursor.rowcount <= 0:
                     return False
                 self.set_id(cursor.lastrowid)
+                inserted.append(self)
+        saved.append((self, self.get_db_orig()))
         if self.__wherejoin__:
-            items = self.f('items')
-            if items is None:
-                items = []
-            cond = {self.__wherejoin__: self.rowid}
-            _LOGGER.debug(f'Rowid = {self.rowid}')
-            itemsold = await SerializableDBObj.get_class(self.__joinclass__).loadbyid(db, rowid=None, **cond)
-            for it in itemsold:
-                if it not in items:
-                    rv = await it.delete(db, commit=False)
-                    if not rv:
-                        _LOGGER.warning(f'Failed to save {query}')
-                        return False
-            for it in items:
-                it._set_single_field(self.__wherejoin__, self.rowid)
-                rv = await it.to_db(db, commit=False)
-                _LOGGER.debug(f'Saving item[{rv}] {it}')
-                if not rv:
+            return await self.items_to_db(db, saved, inserted)
+        return True
+
+    async def items_to_db(self, db, saved, inserted):
+        """Save the items diffing them with the ones in the DB.
+
+        Removed items are deleted, changed ones updated and new ones
+        inserted, each with one executemany: unchanged items are skipped.
+        The saved items (with their new DB values) are appended to saved
+        and the inserted ones to inserted (see to_db).
+
+        With a SyncConnection (the DBExecutor writer thread, the only
+        connection that writes) the ids of the new items are assigned from
+        max(_id) so that they can all go in one executemany. Other
+        connections may have concurrent writers: the new items are inserted
+        one by one and get the lastrowid.
+        """
+        items = self.f('items')
+        if items is None:
+            items = []
+        joincls = SerializableDBObj.get_class(self.__joinclass__)
+        _LOGGER.debug(f'Rowid = {self.rowid}')
+        # raw rows: building the old objects would cost more than the save
+        cols = joincls.__update_columns__ or joincls.__columns__
+        query = f'SELECT {joincls.__id__},{",".join(cols)} FROM {joincls.__table__} WHERE {self.__wherejoin__}=?'
+        itemsold = dict()
+        async with db.execute(query, (self.rowid,)) as cursor:
+            async for row in cursor:
+                itemsold[row[0]] = {c: row[i] for i, c in enumerate(cols, 1)}
+        inserts = []
+        updates = dict()
+        nested = []
+        for it in items:
+            it._set_single_field(self.__wherejoin__, self.rowid)
+            if it.rowid is None:
+                inserts.append(it)
+            else:
+                old = itemsold.pop(it.rowid, None)
+                if old is None:
+                    _LOGGER.warning(f'Failed to save {it}: not an item of {self.rowid}')
+                    return False
+                colnames, values = it.get_dirty_values(old)
+                if colnames:
+                    values.append(it.rowid)
+                    updates.setdefault(it.update_query(colnames), []).append(tuple(values))
+                saved.append((it, it.get_db_orig()))
+            if it.__wherejoin__:
+                nested.append(it)
+        async with db.cursor() as cursor:
+            if itemsold:
+                query = f'DELETE FROM {joincls.__table__} WHERE {joincls.__id__}=?'
+                _LOGGER.debug(f'Deleting: {query} (par={list(itemsold.keys())})')
+                await cursor.executemany(query, [(r,) for r in itemsold.keys()])
+                if cursor.rowcount < len(itemsold):
+                    _LOGGER.warning(f'Failed to delete items of {self.rowid}')
+                    return False
+            for query, rows in updates.items():
+                _LOGGER.debug('Updating: %s (%d items)', query, len(rows))
+                await cursor.executemany(query, rows)
+                if cursor.rowcount < len(rows):
                     _LOGGER.warning(f'Failed to save {query}')
                     return False
-        if commit:
-            await db.commit()
+            if inserts and isinstance(db, SyncConnection):
+                # ids are assigned here so that one executemany can insert them all
+                await cursor.execute(f'SELECT max({joincls.__id__}) FROM {joincls.__table__}')
+                row = await cursor.fetchone()
+                nextid = (row[0] or 0) + 1
+                queries = dict()
+                for it in inserts:
+                    it.set_id(nextid)
+                    inserted.append(it)
+                    nextid += 1
+                    colnames, values = it.get_db_values(it.__columns__)
+                    queries.setdefault(it.insert_query(colnames), []).append(tuple(values))
+                for query, rows in queries.items():
+                    _LOGGER.debug('Inserting: %s (%d items)', query, len(rows))
+                    await cursor.executemany(query, rows)
+                    if cursor.rowcount < len(rows):
+                        _LOGGER.warning(f'Failed to save {query}')
+                        return False
+            else:
+                for it in inserts:
+                    colnames, values = it.get_db_values(it.__columns__)
+                    query = it.insert_query(colnames)
+                    _LOGGER.debug('Inserting: %s (par=%s)', query, values)
+                    await cursor.execute(query, tuple(values))
+                    if cursor.rowcount <= 0:
+                        _LOGGER.warning(f'Failed to save {it}')
+                        return False
+                    it.set_id(cursor.lastrowid)
+                    inserted.append(it)
+            for it in inserts:
+                saved.append((it, it.get_db_orig()))
+        for it in nested:
+            if not await it.items_to_db(db, saved, inserted):
+                return False
         return True
+
+
+class CompactDBObj(SerializableDBObj):
+    """Base class for high rate records (device samples).
+
+    Fields are declared in ``__fields__`` as ``(name, code)`` pairs, where
+    code is the ``struct`` format char of the field ('q' for integers, 'd'
+    for floats) or 'j' for JSON encoded values. Subclasses must declare
+    ``__slots__`` from ``__fields__``: there is no per instance ``__dict__``
+    and fields not listed in the schema (e.g. device info fields) are kept
+    in a small ``_extra`` dict that is only allocated when needed.
+    """
+
+    __slots__ = ('rowid', '_extra')
+    __track_changes__ = False
+    __fields__ = ()
+    __field_set__ = frozenset(__slots__)
+    __field_order__ = __slots__
+    # key -> get_field_info(key), looked up without the classmethod calls
+    __field_info__ = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        order = []
+        for c in reversed(cls.__mro__):
+            for f in c.__dict__.get('__slots__', ()):
+                if f not in order:
+                    order.append(f)
+        cls.__field_order__ = tuple(order)
+        cls.__field_set__ = frozenset(order)
+        cls.__field_info__ = dict()
+
+    def __init__(self, dbitem=None, **kwargs):
+        # every slot starts as None so that reads never fall back to
+        # __getattr__ (which is only there for the _extra fields)
+        for f in self.__field_order__:
+            setattr(self, f, None)
+        if dbitem:
+            self.process_kwargs(dbitem)
+            ks = dbitem.keys()
+            for i in kwargs.copy():
+                if i in ks:
+                    del kwargs[i]
+        if kwargs:
+            self.process_kwargs(kwargs)
+        self.rowid = getattr(self, self.__id__)
+
+    def __getattr__(self, name):
+        # slots can be unset here (pickle and copy build the object without
+        # __init__): reading self._extra would call __getattr__ again
+        try:
+            extra = object.__getattribute__(self, '_extra')
+        except AttributeError:
+            extra = None
+        if extra and name in extra:
+            return extra[name]
+        raise AttributeError(f'{self.__class__.__name__} has no attribute {name}')
+
+    def _set_single_field(self, key, val):
+        info = self.__field_info__.get(key)
+        if info is None:
+            info = self.__field_info__[key] = self.get_field_info(key)
+        fln, setmethod, isjson = info
+        if isjson and isinstance(val, str):
+            val = json.loads(val) if val else None
+        if setmethod:
+            try:
+                setmethod(self, val)
+                return
+            except Exception:
+                pass
+        setattr(self, fln, val)
+
+    @classmethod
+    def resolve_setter(cls, fln):
+        setmethod = super(CompactDBObj, cls).resolve_setter(fln)
+        if setmethod or fln in cls.__field_set__:
+            return setmethod
+
+        def set_extra(self, val):
+            if self._extra is None:
+                self._extra = {fln: val}
+            else:
+                self._extra[fln] = val
+        return set_extra
+
+    def get_vars(self):
+        dct = dict()
+        for f in self.__field_order__:
+            if f != '_extra':
+                v = getattr(self, f)
+                if v is not None:
+                    dct[f] = v
+        if self._extra:
+            dct.update(self._extra)
+        return dct
+
+    @classmethod
+    def schema_slots(cls, fields):
+        return tuple([f for f, _ in fields])
@@ -0,0 +1,252 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath
+from time import perf_counter
+from urllib.request import pathname2url
+
+from util import init_logger
+
+_LOGGER = init_logger(__name__)
+
+
+class _Done(object):
+    """Awaitable and async context manager of an already computed value."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __await__(self):
+        if False:
+            yield
+        return self.value
+
+    async def __aenter__(self):
+        return self.value
+
+    async def __aexit__(self, *args):
+        await self.value.close()
+
+
+class SyncCursor(object):
+    """aiosqlite like cursor over a sqlite3 cursor: nothing is awaited."""
+
+    __slots__ = ('cursor',)
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    async def execute(self, query, parameters=()):
+        self.cursor.execute(query, parameters)
+        return self
+
+    async def executemany(self, query, parameters):
+        self.cursor.executemany(query, parameters)
+        return self
+
+    async def fetchone(self):
+        return self.cursor.fetchone()
+
+    async def fetchmany(self, size=None):
+        return self.cursor.fetchmany(size) if size else self.cursor.fetchmany()
+
+    async def fetchall(self):
+        return self.cursor.fetchall()
+
+    async def close(self):
+        self.cursor.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        row = self.cursor.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+
+class SyncConnection(object):
+    """aiosqlite like connection over a sqlite3 connection.
+
+    Passed by DBExecutor.run_coro to the async DB methods
+    (SerializableDBObj.to_db, loadbyid, migrate...): their awaits complete
+    immediately, so they run to the end in the DB thread.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @property
+    def row_factory(self):
+        return self.conn.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self.conn.row_factory = factory
+
+    @property
+    def total_changes(self):
+        return self.conn.total_changes
+
+    @property
+    def in_transaction(self):
+        return self.conn.in_transaction
+
+    def execute(self, query, parameters=()):
+        return _Done(SyncCursor(self.conn.execute(query, parameters)))
+
+    async def executemany(self, query, parameters):
+        return SyncCursor(self.conn.executemany(query, parameters))
+
+    def cursor(self):
+        return _Done(SyncCursor(self.conn.cursor()))
+
+    async def commit(self):
+        self.conn.commit()
+
+    async def rollback(self):
+        self.conn.rollback()
+
+
+def drive(fun, conn, *args, **kwargs):
+    coro = fun(conn, *args, **kwargs)
+    try:
+        coro.send(None)
+    except StopIteration as ex:
+        return ex.value
+    coro.close()
+    raise RuntimeError(f'{fun} awaited something that is not a DB operation')
+
+
+class DBExecutor(object):
+    """Thread(s) owning the sqlite3 connections of the service.
+
+    run(fun, *args) ships a whole unit of work (e.g. insert the samples,
+    update the session, commit) to a DB thread, where it is called
+    synchronously as fun(conn, *args) with the sqlite3 connection: the
+    caller awaits one future, i.e. one thread hop, instead of one per
+    execute, fetch and commit as with aiosqlite. With commit=True the unit
+    is committed when fun returns and rolled back when it raises.
+
+    run_coro(fun, *args) does the same for the async DB methods written for
+    aiosqlite, that get a SyncConnection. SerializableDBObj.loadbyid,
+    load1m, to_db and delete take this path by themselves when they are
+    given a DBExecutor. The objects are modified in the DB thread while the
+    caller waits for the result.
+
+    The writer has one thread. With readonly=True there can be more
+    (workers), each with its own read only connection opened on first use:
+    in WAL mode they read the last committed data without blocking the
+    writer, nor being blocked by it. pragmas (name -> value) are set on
+    every new connection.
+    """
+
+    def __init__(self, file, loop=None, workers=1, readonly=False, pragmas=None):
+        self.file = file
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.workers = workers if readonly else 1
+        self.readonly = readonly
+        self.pragmas = pragmas if pragmas else dict()
+        self.executor = None
+        self.local = threading.local()
+        self.conns = []
+        self.lock = threading.Lock()
+        self.stats = dict(runs=0, errors=0, busy=0.0, max_busy=0.0)
+
+    def get_stats(self):
+        return dict(self.stats, connections=len(self.conns))
+
+    async def connect(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='dbro' if self.readonly else 'db')
+        try:
+            await self.loop.run_in_executor(self.executor, self._connection)
+        except Exception:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            raise
+        return self
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f'file:{pathname2url(abspath(self.file))}?mode=ro',
+                                       uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.file, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for key, val in self.pragmas.items():
+                conn.execute(f'PRAGMA {key} = {val}')
+            self.local.conn = conn
+            self.local.aconn = SyncConnection(conn)
+            with self.lock:
+                self.conns.append(conn)
+        return conn
+
+    def _call(self, fun, coro, args, kwargs, commit):
+        stats = self.stats
+        start = perf_counter()
+        conn = self._connection()
+        try:
+            if coro:
+                rv = drive(fun, self.local.aconn, *args, **kwargs)
+            else:
+                rv = fun(conn, *args, **kwargs)
+            if commit:
+                conn.commit()
+            return rv
+        except Exception:
+            stats['errors'] += 1
+            if commit and conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            busy = perf_counter() - start
+            stats['busy'] += busy
+            if busy > stats['max_busy']:
+                stats['max_busy'] = busy
+
+    def _submit(self, fun, coro, args, kwargs, commit):
+        if not self.executor:
+            raise RuntimeError(f'DB {self.file} is not connected')
+        self.stats['runs'] += 1
+        return self.loop.run_in_executor(self.executor, self._call, fun, coro, args, kwargs, commit)
+
+    def run(self, fun, *args, commit=False, **kwargs):
+        return self._submit(fun, False, args, kwargs, commit)
+
+    def run_coro(self, fun, *args, commit=False, **kwargs):
+        return self._submit(fun, True, args, kwargs, commit)
+
+    def commit(self):
+        return self.run(sqlite3.Connection.commit)
+
+    def _close(self):
+        self.executor.shutdown(wait=True)
+        for conn in self.conns:
+            conn.close()
+
+    async def close(self):
+        if self.executor:
+            # units already queued are run before closing
+            await self.loop.run_in_executor(None, self._close)
+            self.executor = None
+            self.conns = []
+            _LOGGER.debug(f'DB {self.file} closed: {self.stats}')
@@ -1,8 +1,25 @@
-from db import SerializableDBObj
+from db import CompactDBObj
 
 
-class HRDeviceOutput(SerializableDBObj):
+class HRDeviceOutput(CompactDBObj):
     __table__ = 'hrdeviceSV'
+    __fields__ = (
+        ('_id', 'q'),
+        ('timeRms', 'q'),
+        ('timeRAbsms', 'q'),
+        ('pulse', 'q'),
+        ('joule', 'q'),
+        ('worn', 'q'),
+        ('nBeatsR', 'q'),
+        ('intervals_conf', 'j'),
+        ('session', 'q'),
+        ('jouleMn', 'd'),
+        ('pulseMn', 'd'),
+        ('timeR', 'q'),
+        ('updates', 'q'),
+        ('info_blname', 'j')
+    )
+    __slots__ = CompactDBObj.schema_slots(__fields__)
     __columns2field__ = {
         'ctimems': 'timeRms',
         'ctimeabsms': 'timeRAbsms',
@@ -1,8 +1,34 @@
-from db import SerializableDBObj
+from db import CompactDBObj
 
 
-class KeiserM3iOutput(SerializableDBObj):
+class KeiserM3iOutput(CompactDBObj):
     __table__ = 'keiserSV'
+    __fields__ = (
+        ('_id', 'q'),
+        ('time', 'q'),
+        ('timeR', 'q'),
+        ('timeRms', 'q'),
+        ('timeRAbsms', 'q'),
+        ('distance', 'd'),
+        ('distanceR', 'd'),
+        ('calorie', 'q'),
+        ('speed', 'd'),
+        ('pulse', 'q'),
+        ('rpm', 'q'),
+        ('watt', 'q'),
+        ('incline', 'q'),
+        ('session', 'q'),
+        ('pulseMn', 'd'),
+        ('rpmMn', 'd'),
+        ('speedMn', 'd'),
+        ('wattMn', 'd'),
+        ('updates', 'q'),
+        ('info_firmware', 'q'),
+        ('info_software', 'q'),
+        ('info_systemid', 'q'),
+        ('info_blname', 'j')
+    )
+    __slots__ = CompactDBObj.schema_slots(__fields__)
     __columns2field__ = {
         'otime': 'time',
         'ctime': 'timeR',
@@ -40,6 +40,10 @@ _SETCOLOR_WARNING = SetColor('Warning', 'colmin', '_set_colmin')
 _SETCOLOR_OK = SetColor('OK', 'colmax', '_set_colmax')
 
 
+def _esc(s):
+    return s.replace('%', '%%')
+
+
 class LabelFormatter(SerializableDBObj, abc.ABC):
     __table__ = 'label'
     __columns__ = (
@@ -114,6 +118,38 @@ class LabelFormatter(SerializableDBObj, abc.ABC):
             self.classname = self.fullname()
         self.wrappers = []
 
+    def __setattr__(self, key, value):
+        super(LabelFormatter, self).__setattr__(key, value)
+        if key != '_compiled':
+            self.__dict__['_compiled'] = None
+
+    def get_vars(self):
+        dct = dict(vars(self))
+        dct.pop('_compiled', None)
+        dct.pop('_db_orig', None)
+        return dct
+
+    def get_compiled(self):
+        c = self.__dict__.get('_compiled')
+        if c is None:
+            c = self._compiled = dict(wrap=dict())
+            self.compile(c)
+        return c
+
+    def compile(self, c):
+        """Fill c with what does not depend on the formatted values.
+
+        Called on first use after any change of the formatter attributes.
+        """
+        pre = self.get_pre()
+        c['pre'] = pre
+        c['pre_plain'] = self.wrap(pre, 0)
+        c['pre_col'] = self.wrap(f'[color={self.col}]{pre}[/color]', 0) if self.col else c['pre_plain']
+        if self.col and self.colerror:
+            c['timeout'] = c['pre_col'] + self.wrap(f'[color={self.colerror}]{self.timeout}[/color]', 5, pref='error')
+        else:
+            c['timeout'] = c['pre_plain'] + self.wrap(self.timeout, 5, pref='error')
+
     def _set_colerror(self, colerror):
         self._set_setting_field(colerror=colerror)
 
@@ -149,9 +185,26 @@ class LabelFormatter(SerializableDBObj, abc.ABC):
         else:
             tagend = ''
         self.wrappers.append(dict(tag=tag, tagend=tagend, val=val, flag=flag, pre=pre, post=post))
+        self._compiled = None
         return self
 
+    def wrap_parts(self, idxtowrap, pref='norm'):
+        wraps = self.get_compiled()['wrap']
+        key = (idxtowrap, pref)
+        parts = wraps.get(key)
+        if parts is None:
+            parts = wraps[key] = self._wrap_parts(idxtowrap, pref)
+        return parts
+
     def wrap(self, stringtowrap, idxtowrap, pref='norm'):
+        head, tail = self.wrap_parts(idxtowrap, pref)
+        return head + stringtowrap + tail
+
+    def wrap_template(self, template, idxtowrap, pref='norm'):
+        head, tail = self.wrap_parts(idxtowrap, pref)
+        return _esc(head) + template + _esc(tail)
+
+    def _wrap_parts(self, idxtowrap, pref):
         sret = ''
         flagtowrap = 1 << idxtowrap
         for w in self.wrappers:
@@ -169,11 +222,11 @@ class LabelFormatter(SerializableDBObj, abc.ABC):
                                 tag = tag.replace(f'%{repid}%', repstr)
                         sret += tag
                 sret += w["pre"]
-        sret += stringtowrap
+        tail = ''
         for w in reversed(self.wrappers):
             if w["flag"] & flagtowrap:
-                sret += (w["post"] + w["tagend"])
-        return sret
+                tail += (w["post"] + w["tagend"])
+        return sret, tail
 
     def change_fields(self, *args, **kwargs):
         if args:
@@ -212,11 +265,7 @@ class LabelFormatter(SerializableDBObj, abc.ABC):
         return f'[color={col}]{txt}[/color]'
 
     def set_timeout(self):
-        if self.col and self.colerror:
-            return self.wrap(f'[color={self.col}]{self.get_pre()}[/color]', 0) +\
-                self.wrap(f'[color={self.colerror}]{self.timeout}[/color]', 5, pref='error')
-        else:
-            return self.wrap(self.get_pre(), 0) + self.wrap(self.timeout, 5, pref='error')
+        return self.get_compiled()['timeout']
 
     def reset(self):
         self.order = None
@@ -245,33 +294,43 @@ class LabelFormatter(SerializableDBObj, abc.ABC):
         self.order = order
 
     @staticmethod
-    def get_fields(fldnamelst, obj):
-        if not isinstance(obj, object) or obj is not None:
-            rv = []
-            _LOGGER.debug(f'flds={fldnamelst} obj={obj}')
-            for i in fldnamelst:
-                extract_time = False
-                if i.startswith('%t'):
-                    extract_time = True
-                    i = i[2:]
-                if i in obj:
-                    if extract_time:
-                        tm = obj[i]
-                        hrs = tm // 3600
-                        tm -= hrs * 3600
-                        mins = tm // 60
-                        tm -= mins * 60
-                        secs = tm % 60
-                        rv.append(hrs)
-                        rv.append(mins)
-                        rv.append(secs)
-                    else:
-                        rv.append(obj[i])
-                else:
+    def compile_fields(fldnamelst):
+        # '%tname' fields are expanded to hours, minutes and seconds
+        return tuple([(i[2:], True) if i.startswith('%t') else (i, False) for i in fldnamelst])
+
+    @staticmethod
+    def extract_fields(extractors, obj):
+        if obj is None:
+            return None
+        rv = []
+        if isinstance(obj, SerializableDBObj):
+            getf = obj._f
+            for i, extract_time in extractors:
+                v = getf(i)
+                if v is None:
                     return None
-            return tuple(rv)
+                if extract_time:
+                    hrs, tm = divmod(v, 3600)
+                    mins, secs = divmod(tm, 60)
+                    rv.extend((hrs, mins, secs))
+                else:
+                    rv.append(v)
         else:
-            return None
+            for i, extract_time in extractors:
+                if i not in obj:
+                    return None
+                v = obj[i]
+                if extract_time:
+                    hrs, tm = divmod(v, 3600)
+                    mins, secs = divmod(tm, 60)
+                    rv.extend((hrs, mins, secs))
+                else:
+                    rv.append(v)
+        return tuple(rv)
+
+    @staticmethod
+    def get_fields(fldnamelst, obj):
+        return LabelFormatter.extract_fields(LabelFormatter.compile_fields(fldnamelst), obj)
 
 
 class SimpleFormatter(LabelFormatter):
@@ -281,9 +340,17 @@ class SimpleFormatter(LabelFormatter):
     def _set_format_str(self, format_str):
         self._set_setting_field(format_str=format_str)
 
+    def compile(self, c):
+        super(SimpleFormatter, self).compile(c)
+        if not self.col:
+            c['template'] = _esc(c['pre_plain']) + self.wrap_template(self.format_str, 1)
+        else:
+            c['template'] = _esc(c['pre_col']) +\
+                self.wrap_template(f'[color={_esc(self.col)}]{self.format_str}[/color]', 1)
+
     def format(self, *args, **kwargs):
         if args:
-            s = self.format_str % args
+            return self.get_compiled()['template'] % args
         elif kwargs:
             s = self.format_str.format(**kwargs)
         else:
@@ -303,12 +370,19 @@ class SimpleFieldFormatter(SimpleFormatter):
     def _set_fields(self, fields):
         self._set_setting_field(fields=fields)
 
+    def compile(self, c):
+        super(SimpleFieldFormatter, self).compile(c)
+        c['fields'] = self.compile_fields(self.fields)
+
     def format(self, fitobj, *args, **kwargs):
-        flds = self.get_fields(self.fields, fitobj)
+        c = self.get_compiled()
+        flds = self.extract_fields(c['fields'], fitobj)
         if flds is None:
-            return self.set_timeout()
-        else:
+            return c['timeout']
+        elif args or kwargs:
             return super(SimpleFieldFormatter, self).format(*flds, *args, **kwargs)
+        else:
+            return c['template'] % flds
 
 
 class TimeFieldFormatter(SimpleFieldFormatter):
@@ -349,32 +423,30 @@ class DoubleFormatter(LabelFormatter):
                     Warning=_SETCOLOR_WARNING,
                     Error=_SETCOLOR_ERROR)
 
+    def compile(self, c):
+        super(DoubleFormatter, self).compile(c)
+        col = _esc(self.col) if self.col else self.col
+        for pre, col2 in (('norm', self.col), ('max', self.colmax), ('min', self.colmin)):
+            if not col2 or not col:
+                c[pre] = _esc(c['pre_plain']) +\
+                    self.wrap_template(self.f1, 1, pref=pre) +\
+                    self.wrap_template(f'({self.f2})', 2) +\
+                    self.wrap_template(_esc(self.post), 4)
+            else:
+                c[pre] = _esc(c['pre_col']) +\
+                    self.wrap_template(f'[color={_esc(col2)}]{self.f1}[/color] ', 1) +\
+                    self.wrap_template(f'[color={col}]([/color][color={col}]{self.f2}[/color][color={col}])[/color]', 2) +\
+                    self.wrap_template(f'[color={col}]{_esc(self.post)}[/color]', 4)
+
     def format(self, v1, v2, *args, **kwargs):
         if v1 is None or v2 is None:
             return self.set_timeout()
+        elif v1 == v2:
+            return self.get_compiled()['norm'] % (v1, v2)
+        elif v1 > v2:
+            return self.get_compiled()['max'] % (v1, v2)
         else:
-            col1 = self.col
-            s1 = self.f1 % v1
-            s2 = self.f2 % v2
-            if v1 is None or v1 == v2:
-                col2 = self.col
-                pre = 'norm'
-            elif v1 > v2:
-                col2 = self.colmax
-                pre = 'max'
-            else:
-                col2 = self.colmin
-                pre = 'min'
-            if not col1 or not col2 or not self.col:
-                return self.wrap(self.get_pre(), 0) +\
-                    self.wrap(f'{s1}', 1, pref=pre) +\
-                    self.wrap(f'({s2})', 2) +\
-                    self.wrap(self.post, 4)
-            else:
-                return self.wrap(f'[color={self.col}]{self.get_pre()}[/color]', 0) +\
-                    self.wrap(f'[color={col2}]{s1}[/color] ', 1) +\
-                    self.wrap(f'[color={self.col}]([/color][color={col1}]{s2}[/color][color={self.col}])[/color]', 2) +\
-                    self.wrap(f'[color={self.col}]{self.post}[/color]', 4)
+            return self.get_compiled()['min'] % (v1, v2)
 
 
 class DoubleFieldFormatter(DoubleFormatter):
@@ -384,8 +456,12 @@ class DoubleFieldFormatter(DoubleFormatter):
     def _set_fields(self, fields):
         self._set_setting_field(fields=fields)
 
+    def compile(self, c):
+        super(DoubleFieldFormatter, self).compile(c)
+        c['fields'] = self.compile_fields(self.fields)
+
     def format(self, fitobj, *args, **kwargs):
-        flds = self.get_fields(self.fields, fitobj)
+        flds = self.extract_fields(self.get_compiled()['fields'], fitobj)
         if flds is None:
             return self.set_timeout()
         else:
@@ -453,6 +529,10 @@ class StateFormatter(LabelFormatter):
     def _set_colmax(self, colmax):
         self._set_setting_field(colmax=colmax)
 
+    def compile(self, c):
+        super(StateFormatter, self).compile(c)
+        c['states'] = dict()
+
     def format(self, v1, *args, **kwargs):
         if not isinstance(v1, int):
             v1 = self.get_fields(['state'], v1)
@@ -460,6 +540,13 @@ class StateFormatter(LabelFormatter):
                 return self.set_timeout()
             else:
                 v1 = v1[0]
+        states = self.get_compiled()['states']
+        txt = states.get(v1)
+        if txt is None:
+            txt = states[v1] = self.format_state(v1)
+        return txt
+
+    def format_state(self, v1):
         pref = 'min'
         if v1 == DEVSTATE_INVALIDSTEP:
             col1 = self.colerror
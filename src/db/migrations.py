@@ -0,0 +1,118 @@
+import glob
+import importlib
+import inspect
+from os.path import basename, dirname, isfile, join, splitext
+from time import time
+import traceback
+
+from db import SerializableDBObj
+from util import init_logger
+
+_LOGGER = init_logger(__name__)
+
+PRAGMA_DEFAULTS = dict(
+    journal_mode='WAL',
+    synchronous='NORMAL',
+    # negative: KiB
+    cache_size=-8000,
+    mmap_size=32 * 1024 * 1024)
+
+
+def get_table_classes():
+    """Import every module of the db package and return its table classes."""
+    classes = []
+    modules = glob.glob(join(dirname(__file__), "*.py*"))
+    pls = [splitext(basename(f))[0] for f in modules if isfile(f)]
+    for x in pls:
+        try:
+            m = importlib.import_module(f"db.{x}")
+            for _, cla in inspect.getmembers(m, inspect.isclass):
+                if getattr(cla, '__create_table_query__', None) and cla not in classes:
+                    classes.append(cla)
+        except Exception:
+            _LOGGER.warning(traceback.format_exc())
+    return classes
+
+
+def get_loaded_table_classes(cls=SerializableDBObj):
+    """Table classes already imported (no module is imported)."""
+    classes = []
+    for c in cls.__subclasses__():
+        if c.__create_table_query__:
+            classes.append(c)
+        classes.extend(get_loaded_table_classes(c))
+    return classes
+
+
+async def create_tables(db):
+    done = set()
+    for cla in get_table_classes():
+        query = cla.__create_table_query__
+        if query not in done:
+            done.add(query)
+            await db.execute(query)
+
+
+CREATE_INDEXES = (
+    'create index if not exists keiserSV_session on keiserSV(session)',
+    'create index if not exists hrdeviceSV_session on hrdeviceSV(session)',
+    'create index if not exists label_view on label(view)',
+    'create index if not exists label_device on label(device)',
+    'create index if not exists session_user on session(user)',
+    'create index if not exists session_device on session(device)'
+)
+
+
+async def create_indexes(db):
+    for query in CREATE_INDEXES:
+        await db.execute(query)
+
+
+# (version, description, coroutine function run with the connection):
+# append new steps, never change the applied ones
+MIGRATIONS = (
+    (1, 'tables', create_tables),
+    (2, 'foreign key and history indexes', create_indexes),
+)
+
+
+async def get_schema_version(db):
+    await db.execute(
+        '''
+        create table if not exists schema_version
+            (version integer primary key,
+            description text,
+            applied integer not null);
+        ''')
+    async with db.execute('SELECT max(version) FROM schema_version') as cursor:
+        row = await cursor.fetchone()
+    return row[0] or 0
+
+
+async def migrate(db):
+    """Bring the schema to the last version: returns the version."""
+    version = await get_schema_version(db)
+    for step, description, fun in MIGRATIONS:
+        if step > version:
+            _LOGGER.info(f'Migrating DB schema to {step} ({description})')
+            await fun(db)
+            await db.execute('INSERT INTO schema_version (version, description, applied) VALUES (?, ?, ?)',
+                             (step, description, int(time() * 1000)))
+            await db.commit()
+            version = step
+    for cla in get_loaded_table_classes():
+        cla.set_update_columns()
+    return version
+
+
+async def set_pragmas(db, journal_mode=None, synchronous=None, cache_size=None, mmap_size=None):
+    # foreign_keys, synchronous, cache_size and mmap_size are per connection
+    await db.execute('PRAGMA foreign_keys = ON')
+    if journal_mode:
+        await db.execute(f'PRAGMA journal_mode = {journal_mode}')
+    if synchronous:
+        await db.execute(f'PRAGMA synchronous = {synchronous}')
+    if cache_size:
+        await db.execute(f'PRAGMA cache_size = {int(cache_size)}')
+    if mmap_size is not None:
+        await db.execute(f'PRAGMA mmap_size = {int(mmap_size)}')
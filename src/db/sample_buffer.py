@@ -0,0 +1,107 @@
+import asyncio
+from time import time
+import traceback
+
+from db.executor import DBExecutor
+from util import init_logger
+from util.timer import Timer
+
+_LOGGER = init_logger(__name__)
+
+
+class SampleBuffer(object):
+    MAX_SAMPLES = 50
+    MAX_AGE = 30.0
+    # samples kept while the DB keeps failing (0: no limit). With a limit
+    # the oldest samples are dropped: the only case where samples are lost
+    MAX_BUFFERED = 0
+
+    def __init__(self, db, max_samples=MAX_SAMPLES, max_age=MAX_AGE, max_buffered=MAX_BUFFERED):
+        self.db = db
+        self.max_samples = max_samples
+        self.max_age = max_age
+        self.max_buffered = max(max_buffered, max_samples) if max_buffered > 0 else 0
+        self.samples = []
+        self.first_time = 0
+        self.age_timer = None
+        self.n_flushed = 0
+        self.n_dropped = 0
+        self.lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def get_buffered(self):
+        return len(self.samples)
+
+    def add(self, obj):
+        colnames, values = obj.get_db_values(obj.__columns__)
+        self.samples.append((obj.__class__, tuple(colnames), tuple(values)))
+        if len(self.samples) == 1:
+            self.first_time = time()
+            self.arm_timer()
+        else:
+            self.trim()
+        return len(self.samples) >= self.max_samples or time() - self.first_time >= self.max_age
+
+    def arm_timer(self):
+        if self.max_age > 0 and not self.age_timer:
+            self.age_timer = Timer(self.max_age, self.flush_by_timer)
+
+    def trim(self):
+        n = len(self.samples) - self.max_buffered if self.max_buffered else 0
+        if n > 0:
+            del self.samples[0:n]
+            self.n_dropped += n
+            _LOGGER.warning(f'Sample buffer full: {n} oldest samples dropped (total {self.n_dropped})')
+
+    @staticmethod
+    async def insert_groups(db, groups):
+        for (cls, colnames), rows in groups.items():
+            await db.executemany(cls.insert_query(colnames), rows)
+
+    async def flush_by_timer(self):
+        self.age_timer = None
+        await self.flush()
+
+    async def flush(self, commit=True):
+        async with self.lock:
+            if self.age_timer:
+                self.age_timer.cancel()
+                self.age_timer = None
+            samples = self.samples
+            if not samples:
+                return 0
+            self.samples = []
+            groups = dict()
+            for cls, colnames, values in samples:
+                key = (cls, colnames)
+                if key in groups:
+                    groups[key].append(values)
+                else:
+                    groups[key] = [values]
+            try:
+                if isinstance(self.db, DBExecutor):
+                    # inserts and commit: one unit of work in the DB thread
+                    await self.db.run_coro(SampleBuffer.insert_groups, groups, commit=commit)
+                else:
+                    try:
+                        await SampleBuffer.insert_groups(self.db, groups)
+                        if commit:
+                            await self.db.commit()
+                    except Exception:
+                        # the groups already inserted would be inserted again by the retry
+                        if commit:
+                            await self.db.rollback()
+                        raise
+            except Exception:
+                _LOGGER.error(f'Flush error ({len(samples)} samples kept): {traceback.format_exc()}')
+                self.samples[0:0] = samples
+                self.trim()
+                self.first_time = time()
+                # a device that sends no more samples still gets a retry
+                self.arm_timer()
+                return 0
+            self.n_flushed += len(samples)
+            _LOGGER.debug(f'Flushed {len(samples)} samples (total {self.n_flushed})')
+            return len(samples)
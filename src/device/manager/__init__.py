@@ -21,6 +21,7 @@ from util.const import (COMMAND_CONFIRM, COMMAND_DELDEVICE, COMMAND_DEVICEFIT,
                         DEVSTATE_INVALIDSTEP, DEVSTATE_SEARCHING,
                         DEVSTATE_UNINIT, DI_BLNAME, MSG_COMMAND_TIMEOUT,
                         MSG_CONNECTION_STATE_INVALID, MSG_DB_SAVE_ERROR)
+from util.sample_pipeline import SamplePipeline
 from util.timer import Timer
 
 
@@ -55,6 +56,7 @@ class GenericDeviceManager(BluetoothDispatcher, abc.ABC):
                                               'timeout': '---'})
     __pre_action__ = None
     __info_fields__ = ()
+    __pipeline_policy__ = SamplePipeline.POLICY_DROP_OLDEST
 
     @staticmethod
     def is_connected_state_s(st):
@@ -178,6 +180,28 @@ class GenericDeviceManager(BluetoothDispatcher, abc.ABC):
             self.simulator_needs_reset = True
             self.last_session = None
 
+    def put_sample(self, obj):
+        if not self.pipeline:
+            self.pipeline = SamplePipeline(self.step,
+                                           policy=self.__pipeline_policy__,
+                                           merge=self.merge_samples,
+                                           name=self.device.get_alias(),
+                                           loop=self.loop)
+        self.pipeline.put(obj)
+
+    def merge_samples(self, old, new):
+        for key, val in old.get_vars().items():
+            if new._f(key) is None:
+                new.s(key, val)
+        return new
+
+    def get_pipeline_stats(self):
+        stats = self.pipeline.get_stats() if self.pipeline else dict()
+        if self.simulator:
+            # samples waiting for the next DB flush
+            stats['buffered'] = self.simulator.get_buffered()
+        return stats
+
     async def step(self, obj):
         st = None
         try:
@@ -264,6 +288,8 @@ class GenericDeviceManager(BluetoothDispatcher, abc.ABC):
             self.dispatch('on_command_handle', COMMAND_SAVEDEVICE, CONFIRM_FAILED_2)
 
     async def on_command_deldevice_async(self, device, *args, sender=None, **kwargs):
+        # the device is stopped: its consumer task is not needed any more
+        await self.stop_samples()
         rv = await device.remove(self.db)
         if rv:
             self.oscer.send_device(COMMAND_CONFIRM, self._uid, CONFIRM_OK, device, dest=sender)
@@ -435,6 +461,30 @@ class GenericDeviceManager(BluetoothDispatcher, abc.ABC):
             (fromv != DEVSTATE_DISCONNECTING or rea != DEVREASON_REQUESTED)\
                 and self.simulator:
             self.simulator.set_offsets()
+        if tov == DEVSTATE_DISCONNECTED and self.simulator:
+            Timer(0, self.flush_samples)
+
+    async def flush_samples(self):
+        if self.pipeline:
+            await self.pipeline.drain()
+        _LOGGER.info(f'Pipeline stats: {self.get_pipeline_stats()}')
+        if self.simulator:
+            return await self.simulator.flush()
+        return 0
+
+    async def stop_samples(self):
+        """Process the queued samples, save the buffered ones and stop the pipeline.
+
+        Returns False when samples are still buffered (the DB flush failed):
+        calling it again retries the flush.
+        """
+        try:
+            await self.flush_samples()
+        finally:
+            if self.pipeline:
+                self.pipeline.stop()
+                self.pipeline = None
+        return not self.simulator or not self.simulator.get_buffered()
 
     def on_command_handle(self, command, exitv, *args):
         _LOGGER.debug(f'Handled command {command}: {exitv}')
@@ -502,6 +552,7 @@ class GenericDeviceManager(BluetoothDispatcher, abc.ABC):
         self.loop = loop
         self.simulator_needs_reset = True
         self.simulator = None
+        self.pipeline = None
         self.last_session = None
         self.info_fields = dict.fromkeys(self.__info_fields__, 'N/A')
 
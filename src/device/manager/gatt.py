@@ -1,4 +1,5 @@
 from functools import partial
+import logging
 import traceback
 
 from device.manager import GenericDeviceManager
@@ -59,25 +60,41 @@ class GattDeviceManager(GenericDeviceManager):
         super(GattDeviceManager, self).__init__(*args, **kwargs)
         self.read_once_characteristics = self.get_read_once_characteristics()
         self.notify_characteristics = self.get_notify_characteristics()
+        self.read_once_table = dict()
+        self.notify_table = dict()
         self.disconnect_reason = DEVREASON_REQUESTED
         self.operation_timer = None
+        self.operation_timeout_handler = partial(self.inner_disconnect, reason=DEVREASON_TIMEOUT)
         self.found_device = None
 
     def on_services(self, status, services):
         self.loop.call_soon_threadsafe(self.on_services_loop, status, services)
 
+    @staticmethod
+    def get_characteristic_key(characteristic):
+        # the instance id (attribute handle) is the same for all the
+        # objects representing a characteristic of the connected device
+        try:
+            return characteristic.getInstanceId()
+        except AttributeError:
+            return UuidBundle(None, characteristic).key()
+
     def on_services_loop(self, status, services):
         if status == GATT_SUCCESS:
             _LOGGER.info(f'Serv disc dict {services}')
+            self.read_once_table.clear()
+            self.notify_table.clear()
             for _, chinfo in self.read_once_characteristics.items():
                 for suid, sdict in services.items():
                     if suid == chinfo.service and chinfo.characteristic in sdict:
                         ch = sdict[chinfo.characteristic]
+                        self.read_once_table[self.get_characteristic_key(ch)] = chinfo
                         self.read_characteristic(ch)
             for _, chinfo in self.notify_characteristics.items():
                 for suid, sdict in services.items():
                     if suid == chinfo.service and chinfo.characteristic in sdict:
                         ch = sdict[chinfo.characteristic]
+                        self.notify_table[self.get_characteristic_key(ch)] = chinfo
                         self.enable_notifications(ch)
             if self.notify_characteristics:
                 self.operation_timer_init(10)
@@ -97,12 +114,28 @@ class GattDeviceManager(GenericDeviceManager):
                 return True
         return False
 
+    @staticmethod
+    def call_handler_from_table(characteristic, table, searchdict):
+        # resolved in on_services_loop: fall back to the uuid search for
+        # characteristics not seen there
+        sk = table.get(GattDeviceManager.get_characteristic_key(characteristic))
+        if sk is None:
+            return GattDeviceManager.call_handler_from_characteristic(characteristic, searchdict)
+        if sk.handler:
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug('%04d:%04d -> %s' % (sk.service_id, sk.characteristic_id, str(characteristic.getValue())))
+            try:
+                sk.handler(characteristic, uuid=sk)
+            except Exception:
+                _LOGGER.error(f'Characteristic {"%04d:%04d" % (sk.service_id, sk.characteristic_id)} handler error {traceback.format_exc()}')
+        return True
+
     def on_characteristic_read(self, characteristic, status):
         self.loop.call_soon_threadsafe(self.on_characteristic_read_loop, characteristic, status)
 
     def on_characteristic_read_loop(self, characteristic, status):
         if status == GATT_SUCCESS:
-            self.call_handler_from_characteristic(characteristic, self.read_once_characteristics)
+            self.call_handler_from_table(characteristic, self.read_once_table, self.read_once_characteristics)
         else:
             _LOGGER.debug('Failed to read characteristic')
 
@@ -110,7 +143,7 @@ class GattDeviceManager(GenericDeviceManager):
         self.loop.call_soon_threadsafe(self.on_characteristic_changed_loop, characteristic)
 
     def on_characteristic_changed_loop(self, characteristic):
-        self.call_handler_from_characteristic(characteristic, self.notify_characteristics)
+        self.call_handler_from_table(characteristic, self.notify_table, self.notify_characteristics)
         self.operation_timer_init(10)
 
     def on_connection_state_change(self, status, state):
@@ -129,12 +162,15 @@ class GattDeviceManager(GenericDeviceManager):
                 self.set_state(DEVSTATE_DISCONNECTED, DEVREASON_OPERATION_ERROR)
 
     def operation_timer_init(self, timeout=False, handler=None):
-        if self.operation_timer:
-            self.operation_timer.cancel()
         if timeout:
             if not handler:
-                handler = partial(self.inner_disconnect, reason=DEVREASON_TIMEOUT)
-            self.operation_timer = Timer(timeout, handler)
+                handler = self.operation_timeout_handler
+            if self.operation_timer:
+                self.operation_timer.rearm(timeout, handler)
+            else:
+                self.operation_timer = Timer(timeout, handler)
+        elif self.operation_timer:
+            self.operation_timer.cancel()
 
     def get_scan_filters(self, scanning_for_new_devices=False):
         if not scanning_for_new_devices:
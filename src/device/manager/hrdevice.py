@@ -10,7 +10,7 @@ from util.const import (DI_FIRMWARE, DI_SOFTWARE,
                         BluetoothGattCharacteristic, BluetoothGattService,
                         GattUtils)
 from util import init_logger
-from util.timer import Timer
+from util.sample_pipeline import SamplePipeline
 
 _LOGGER = init_logger(__name__)
 
@@ -89,6 +89,13 @@ class HRDeviceManager(GattDeviceManager):
                        DI_FIRMWARE,
                        DI_SOFTWARE,
                        '_new_')
+    # beat intervals of merged samples must not be lost
+    __pipeline_policy__ = SamplePipeline.POLICY_MERGE
+
+    def merge_samples(self, old, new):
+        if old.intervals_conf:
+            new.intervals_conf = old.intervals_conf + (new.intervals_conf or [])
+        return super(HRDeviceManager, self).merge_samples(old, new)
 
     def set_info_field_c(self, characteristic, uuid=None, field=DI_MODEL):
         data = characteristic.getValue()
@@ -196,4 +203,4 @@ class HRDeviceManager(GattDeviceManager):
             self.info_fields['_new_'] = False
             hro.process_kwargs(self.info_fields)
         _LOGGER.debug(f'hro Parse result {hro}')
-        Timer(0, partial(self.step, hro))
+        self.put_sample(hro)
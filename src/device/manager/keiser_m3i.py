@@ -1,4 +1,4 @@
-from functools import partial
+import struct
 
 from db.keiser_m3i_output import KeiserM3iOutput
 from db.label_formatter import (DoubleFieldFormatter, SimpleFieldFormatter,
@@ -13,6 +13,7 @@ from util.const import (DEVREASON_REQUESTED, DEVREASON_TIMEOUT,
                         DEVSTATE_SEARCHING, DI_FIRMWARE, DI_SOFTWARE,
                         DI_SYSTEMID, DI_BLNAME)
 from util import init_logger
+from util.bluetooth_dispatcher import ScanMultiplexer
 from util.timer import Timer
 
 _LOGGER = init_logger(__name__)
@@ -103,6 +104,13 @@ class KeiserM3iDeviceManager(GenericDeviceManager):
         fields=['%ttime', 'distance', 'speed', 'rpm', 'watt', 'calorie']
     )
     __pre_action__ = EnableBluetooth
+    # advertisement data after major and minor: data type, machine id, rpm,
+    # pulse, watt, kcal, minutes, seconds, distance and (minor >= 0x21) gear.
+    # For every major: (lowest minor, layout) from the newest layout
+    __adv_layouts__ = {
+        0x06: ((0x21, struct.Struct('<BBHHHHBBHB')),
+               (0x00, struct.Struct('<BBHHHHBBH')))
+    }
     RESCAN_TIMEOUT = 900
 
     @staticmethod
@@ -123,6 +131,9 @@ class KeiserM3iDeviceManager(GenericDeviceManager):
         _LOGGER.info(f'Rescan timeout = {self.rescan_timeout}')
         self.force_rescan_timer = None
         self.found_timer = None
+        self.scanner = None
+        self.last_adv = None
+        self.adv_stats = dict(adverts=0, suppressed=0)
         self.disconnect_reason = DEVREASON_REQUESTED
 
     def get_scan_settings(self, scanning_for_new_devices=False):
@@ -167,10 +178,13 @@ class KeiserM3iDeviceManager(GenericDeviceManager):
         return ss + (f'RSSI {rssi}' if rssi else '')
 
     def found_timer_init(self, timeout=False):
-        if self.found_timer:
-            self.found_timer.cancel()
-            self.found_timer = None
-        if timeout:
+        if not timeout:
+            if self.found_timer:
+                self.found_timer.cancel()
+                self.found_timer = None
+        elif self.found_timer:
+            self.found_timer.rearm(timeout)
+        else:
             self.found_timer = Timer(timeout, self.set_disconnected)
 
     async def set_disconnected(self):
@@ -180,7 +194,7 @@ class KeiserM3iDeviceManager(GenericDeviceManager):
             self.rescan_timer_init()
             self.disconnect_reason = DEVREASON_TIMEOUT
             self.set_state(DEVSTATE_DISCONNECTING, self.disconnect_reason)
-            self.stop_scan()
+            self.scan_unsubscribe()
 
     def rescan_timer_init(self, timeout=False):
         if self.force_rescan_timer:
@@ -195,20 +209,38 @@ class KeiserM3iDeviceManager(GenericDeviceManager):
         _LOGGER.info(f'Rescan timer done: state={self.state}')
         if self.state == DEVSTATE_CONNECTING:
             self.rescan_timer_init()
-            self.stop_scan()
+            self.scan_unsubscribe()
         elif self.is_connected_state():
-            self.stop_scan()
+            # the other bikes may have asked for it already
+            self.scanner.rescan()
+            self.rescan_timer_init(self.rescan_timeout)
+
+    def scan_subscribe(self):
+        # bikes share one scan: adverts are routed here by address
+        if not self.scanner:
+            self.scanner = ScanMultiplexer.get(self.loop)
+        self.scanner.subscribe(self.device.get_address(),
+                               self.main_loop_on_device,
+                               on_scan_started=self.on_scan_started,
+                               on_scan_completed=self.on_scan_completed,
+                               settings=self.get_scan_settings(),
+                               filters=self.get_scan_filters())
+
+    def scan_unsubscribe(self):
+        if not self.scanner or not self.scanner.unsubscribe(self.device.get_address()):
+            self.loop.call_soon(self.on_scan_completed)
 
     def inner_disconnect(self):
         self.rescan_timer_init()
         self.found_timer_init()
         self.disconnect_reason = DEVREASON_REQUESTED
-        self.stop_scan()
+        self.scan_unsubscribe()
 
     def inner_connect(self):
+        self.last_adv = None
         self.rescan_timer_init(30)
         self.found_timer_init()
-        self.start_scan(self.get_scan_settings(), self.get_scan_filters())
+        self.scan_subscribe()
 
     def on_scan_completed(self):
         super(KeiserM3iDeviceManager, self).on_scan_completed()
@@ -217,51 +249,62 @@ class KeiserM3iDeviceManager(GenericDeviceManager):
         elif self.state == DEVSTATE_CONNECTING:
             self.set_state(DEVSTATE_DISCONNECTED, DEVREASON_TIMEOUT)
         elif self.is_connected_state():
-            self.start_scan(self.get_scan_settings(), self.get_scan_filters())
+            self.scan_subscribe()
             self.rescan_timer_init(self.rescan_timeout)
 
-    def parse_adv(self, arr):
+    @staticmethod
+    def adv_bytes(arr):
+        if isinstance(arr, bytes):
+            return arr
+        try:
+            return bytes(arr)
+        except ValueError:
+            # signed java bytes
+            return bytes([x & 0xFF for x in arr])
+
+    @classmethod
+    def get_adv_layout(cls, mayor, minor, size):
+        for minmin, layout in cls.__adv_layouts__.get(mayor, ()):
+            if minor >= minmin and size >= layout.size:
+                return layout
+        return None
+
+    @classmethod
+    def parse_adv(cls, arr):
         if len(arr) < 4 or len(arr) > 19:
             return False
+        arr = cls.adv_bytes(arr)
         index = 0
         if arr[index] == 2 and arr[index + 1] == 1:
             index += 2
-        mayor = self.u8_le(arr, index)
-        index += 1
-        minor = self.u8_le(arr, index)
-        index += 1
-        if mayor == 0x06 and len(arr) > index + 13:
-            k3 = KeiserM3iOutput()
-            dt = self.u8_le(arr, index)
-            if dt == 0 or dt >= 128 or dt <= 227:
-                k3.s(DI_FIRMWARE, mayor)
-                k3.s(DI_SOFTWARE, minor)
-                k3.s(DI_SYSTEMID, self.u8_le(arr, index + 1))
-            k3.s('orpm', self.u16_le(arr, index + 2))  # / 10;
-            k3.s('opul', self.u16_le(arr, index + 4))  # / 10;
-            # Power in Watts
-            k3.s('owatt', self.u16_le(arr, index + 6))
-            # Energy as KCal ("energy burned")
-            k3.s('ocal', self.u16_le(arr, index + 8))
-            # Time in Seconds (broadcast as minutes and seconds)
-            time = self.u8_le(arr, index + 10) * 60
-            time += self.u8_le(arr, index + 11)
-            k3.s('otime', time)
-            dist = self.u16_le(arr, index + 12)
-            if (dist & 32768):
-                dist = (dist & 0x7FFF) / 10.0
-            else:
-                dist = dist / 10.0 * 1.60934
-            if minor >= 0x21 and len(arr) > (index + 14):
-                # Raw Gear Value
-                inc = self.u8_le(arr, index + 14)
-            else:
-                inc = 0
-            k3.s('odist', dist)
-            k3.s('oinc', inc)
-            return k3
-        else:
+        mayor = arr[index]
+        minor = arr[index + 1]
+        index += 2
+        layout = cls.get_adv_layout(mayor, minor, len(arr) - index)
+        if not layout:
             return None
+        fields = layout.unpack_from(arr, index)
+        dt, systemid, rpm, pulse, watt, cal, mins, secs, dist = fields[:9]
+        k3 = KeiserM3iOutput()
+        if dt == 0 or dt >= 128 or dt <= 227:
+            k3.info_firmware = mayor
+            k3.info_software = minor
+            k3.info_systemid = systemid
+        k3.rpm = rpm  # / 10;
+        k3.pulse = pulse  # / 10;
+        # Power in Watts
+        k3.watt = watt
+        # Energy as KCal ("energy burned")
+        k3.calorie = cal
+        # Time in Seconds (broadcast as minutes and seconds)
+        k3.time = mins * 60 + secs
+        if (dist & 32768):
+            k3.distance = (dist & 0x7FFF) / 10.0
+        else:
+            k3.distance = dist / 10.0 * 1.60934
+        # Raw Gear Value
+        k3.incline = fields[9] if len(fields) > 9 else 0
+        return k3
 
     def process_found_device(self, device, connectobj=None):
         super(KeiserM3iDeviceManager, self).process_found_device(device, connectobj)
@@ -273,7 +316,15 @@ class KeiserM3iDeviceManager(GenericDeviceManager):
                     self.rescan_timer_init(self.rescan_timeout)
                 if self.state != DEVSTATE_SEARCHING and self.state != DEVSTATE_DISCONNECTING:
                     self.found_timer_init(5)
-                    k3 = self.parse_adv(device.advertisement)
+                    self.adv_stats['adverts'] += 1
+                    adv = self.adv_bytes(device.advertisement)
+                    if adv == self.last_adv:
+                        # the bike broadcasts the same payload many times:
+                        # it is alive but there is no new sample
+                        self.adv_stats['suppressed'] += 1
+                        return
+                    self.last_adv = adv
+                    k3 = self.parse_adv(adv)
                     _LOGGER.debug(f'k3 Parse result {k3}')
                     if k3:
-                        Timer(0, partial(self.step, k3))
+                        self.put_sample(k3)
@@ -3,6 +3,7 @@ import logging
 from time import time
 import traceback
 
+from db.sample_buffer import SampleBuffer
 from db.session import Session
 from kivy.event import EventDispatcher
 from util import init_logger
@@ -30,6 +31,7 @@ class DeviceSimulator(abc.ABC, EventDispatcher):
         super(DeviceSimulator, self).__init__()
         self.db = db
         self.deviceid = deviceid
+        self.sample_buffer = SampleBuffer(db, **{k: kwargs[k] for k in ('max_samples', 'max_age', 'max_buffered') if k in kwargs})
         if on_session:
             self.bind(on_session=on_session)
         self.reset(conf, user)
@@ -50,11 +52,9 @@ class DeviceSimulator(abc.ABC, EventDispatcher):
                     await self.session.to_db(self.db, True)
                 self.nUpdates = self.nUpdates + 1
                 try:
-                    commit = nowms - self.last_commit > 30000
                     obj.session = self.session.rowid
-                    await obj.to_db(self.db, commit)
-                    if commit:
-                        self.last_commit = nowms
+                    if self.sample_buffer.add(obj):
+                        await self.sample_buffer.flush()
                 except Exception:
                     self.error(f'Commit error: {traceback.format_exc()}')
                 obj.s('updates', self.nUpdates)
@@ -63,6 +63,12 @@ class DeviceSimulator(abc.ABC, EventDispatcher):
             self.error(f'Step error: {traceback.format_exc()}')
             return DEVSTATE_INVALIDSTEP
 
+    async def flush(self):
+        return await self.sample_buffer.flush()
+
+    def get_buffered(self):
+        return self.sample_buffer.get_buffered()
+
     def log(self, s, level=logging.DEBUG):
         _LOGGER.log(level, "%s: %s" % (self.__class__.__name__, s))
 
@@ -84,5 +90,4 @@ class DeviceSimulator(abc.ABC, EventDispatcher):
         self.session = None
         self.lastUpdateTime = 0
         self.main_session_id = 0
-        self.last_commit = 0
         self.inner_reset(conf, user)
@@ -51,6 +51,7 @@ from util.const import (COMMAND_CONNECT, COMMAND_CONNECTORS, COMMAND_DELUSER,
                         COMMAND_PRINTMSG, COMMAND_CONFIRM, COMMAND_QUERY,
                         COMMAND_SAVEUSER, COMMAND_SAVEVIEW, COMMAND_STOP,
                         CONFIRM_FAILED_3, CONFIRM_OK, MSG_COMMAND_TIMEOUT)
+from util.format_dispatcher import FormatDispatcher
 from util.osc_comunication import OSCManager
 from util.timer import Timer
 from util.velocity_tcp import TcpClient
@@ -193,11 +194,26 @@ class MyTabs(MDTabs):
         super(MyTabs, self).__init__(*args, **kwargs)
         self.tab_list = []
         self.current_tab = None
+        self.items_by_key = dict()
+        self.items_by_type = dict()
 
     def format(self, devobj, **kwargs):
+        ViewPlayWidget.format_index(self.items_by_key, self.items_by_type, devobj, **kwargs)
+
+    def get_format_keys(self):
+        return self.items_by_type
+
+    def update_format_index(self):
+        by_key = dict()
+        by_type = dict()
         for tb in self.tab_list:
             if isinstance(tb, ViewPlayWidget):
-                tb.format(devobj, **kwargs)
+                for k, lst in tb.items_by_key.items():
+                    by_key.setdefault(k, []).extend(lst)
+                for k, lst in tb.items_by_type.items():
+                    by_type.setdefault(k, []).extend(lst)
+        self.items_by_key = by_key
+        self.items_by_type = by_type
 
     def new_view_list(self, views):
         set_tab = True
@@ -240,6 +256,7 @@ class MyTabs(MDTabs):
                 idx = 0
             if idx >= 0:
                 self.simulate_tab_switch(idx)
+            self.update_format_index()
 
     def simulate_tab_switch(self, idx):
         if idx < len(self.tab_list):
@@ -277,6 +294,7 @@ class MyTabs(MDTabs):
                 self.remove_widget(oldtab)
             else:
                 oldtab.set_view(view)
+                self.update_format_index()
         elif view and not view.active:
             return
         else:
@@ -287,6 +305,7 @@ class MyTabs(MDTabs):
             self.carousel.index = len(self.tab_list) - 1
             tab.tab_label.state = "down"
             tab.tab_label.on_release()
+            self.update_format_index()
 
     def on_tab_switch(self, tab, label, text):
         super(MyTabs, self).on_tab_switch(tab, label, text)
@@ -858,12 +877,12 @@ class MainApp(MDApp):
 
     def on_command_connectors_confirm(self, *args, timeout=False):
         if not timeout and args[0] != CONFIRM_OK:
-            self.all_format = [self.root.ids.id_tabcont.format, TcpClient.format]
+            self.all_format = [self.gui_format, self.connector_format]
             Timer(0, partial(TcpClient.init_connectors_async, self.loop, self.connectors_info))
         else:
-            self.all_format = [self.root.ids.id_tabcont.format]\
+            self.all_format = [self.gui_format]\
                 if not self.velocity_tabs else\
-                [self.root.ids.id_tabcont.format, TcpClient.format]
+                [self.gui_format, self.connector_format]
         self.on_osc_init_ok_cmd_next(
             COMMAND_LISTVIEWS
             if not timeout else
@@ -1110,6 +1129,13 @@ class MainApp(MDApp):
                 register_topmost(Window, self.title)
         Window.bind(on_keyboard=self._on_keyboard)
         self.set_screen_on(True)
+        self.gui_format = FormatDispatcher(self.root.ids.id_tabcont.format,
+                                           fps=self.get_fps('gui_fps'),
+                                           keys=self.root.ids.id_tabcont.get_format_keys,
+                                           loop=self.loop)
+        self.connector_format = FormatDispatcher(TcpClient.format,
+                                                 fps=self.get_fps('connector_fps'),
+                                                 loop=self.loop)
         for vt in self.velocity_tabs:
             self.root.ids.id_tabcont.add_widget(vt)
         if self.check_host_port_config('frontend') and self.check_host_port_config('backend') and\
@@ -1196,6 +1222,8 @@ class MainApp(MDApp):
                            {'notify_screen_on': '0' if platform == 'android' else '-1',
                             'notify_every_ms': '0' if platform == 'android' else '-1',
                             'query_timeout': 100,
+                            'gui_fps': 10,
+                            'connector_fps': 4,
                             'screenon': '0'})
         self.db_path = db_dir()
         self.connectors_path = join(self.db_path, 'connectors')
@@ -1209,6 +1237,8 @@ class MainApp(MDApp):
         self.current_user = None
         self.connectors_info = []
         self.all_format = []
+        self.gui_format = None
+        self.connector_format = None
         self.velocity_tabs = []
         self.notify_timeout = True
         self.users = []
@@ -1265,7 +1295,17 @@ class MainApp(MDApp):
                     title="Query Timeout",
                     desc="Stop waiting query results after (s)",
                     section="misc",
-                    key="query_timeout")]
+                    key="query_timeout"),
+               dict(type="numeric",
+                    title="Views refresh rate (fps)",
+                    desc="Max device data updates per second on views: 0 unlimited",
+                    section="misc",
+                    key="gui_fps"),
+               dict(type="numeric",
+                    title="Connectors refresh rate (fps)",
+                    desc="Max device data updates per second sent to connectors: 0 unlimited",
+                    section="misc",
+                    key="connector_fps")]
         if platform == 'android':
             lst.extend([dict(type='bool',
                              title='Keep Screen on',
@@ -1319,6 +1359,12 @@ class MainApp(MDApp):
             return False
         return True
 
+    def get_fps(self, key):
+        try:
+            return float(self.config.get('misc', key))
+        except Exception:
+            return 0
+
     def check_other_config(self):
         try:
             to = int(self.config.get("bluetooth", "connect_secs"))
@@ -1420,6 +1466,12 @@ class MainApp(MDApp):
                                 int(self.config.get('misc', 'notify_every_ms')))
         elif section == 'misc' and key == 'query_timeout':
             return
+        elif section == 'misc' and key == 'gui_fps':
+            if self.gui_format:
+                self.gui_format.set_fps(self.get_fps(key))
+        elif section == 'misc' and key == 'connector_fps':
+            if self.connector_format:
+                self.connector_format.set_fps(self.get_fps(key))
         elif self.check_host_port_config('frontend') and self.check_host_port_config('backend') and\
                 self.check_other_config():
             if self.oscer:
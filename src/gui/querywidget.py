@@ -125,6 +125,8 @@ class QueryWidget(Screen):
                 txt += f'Row changes: {result["rowcount"]}\n'
             txt += f'DB changes before/after: {result["changes_before"]} / {result["changes_after"]}\n'
             txt += f'Total rows in result: {len(result["rows"])}\n'
+            if result.get('truncated'):
+                txt += 'Result truncated: row limit reached\n'
             if result['cols']:
                 txt += f'cols: %s\n' % ("\t".join(result["cols"]))
             if len(result["rows"]):
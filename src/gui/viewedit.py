@@ -134,12 +134,16 @@ class ViewPlayWidget(BoxLayout, MDTabsBase):
             del kwargs['view']
         else:
             self.view = None
+        self.items_by_key = dict()
+        self.items_by_type = dict()
         super(ViewPlayWidget, self).__init__(*args, **kwargs)
         self.set_view(self.view)
 
     def set_view(self, view):
         self.view = view
         self.text = view.name
+        self.items_by_key = dict()
+        self.items_by_type = dict()
         try:
             for i in range(len(self.ids.id_formatters.children) - 1, -1, -1):
                 fi = self.ids.id_formatters.children[i]
@@ -150,13 +154,30 @@ class ViewPlayWidget(BoxLayout, MDTabsBase):
                 fi = FormatterItem(formatter=f)
                 _LOGGER.debug(f'Adding formatter {fi.formatter.get_title()}')
                 self.ids.id_formatters.add_widget(fi)
+                self.items_by_key.setdefault((f.device, f.type), []).append(fi)
+                self.items_by_type.setdefault(f.type, []).append(fi)
             _LOGGER.debug(f'-1={self.view} 0={self.view is view} 3={id(self.view)} 4={id(view)}')
         except Exception:
             _LOGGER.error(f'On view error {traceback.format_exc()}')
 
+    @staticmethod
+    def format_index(items_by_key, items_by_type, devobj, **kwargs):
+        if devobj:
+            devid = devobj.get_id()
+            for types, obj in kwargs.items():
+                lst = items_by_key.get((devid, types))
+                if lst:
+                    for fi in lst:
+                        fi.format_value(obj)
+        else:
+            for types, obj in kwargs.items():
+                lst = items_by_type.get(types)
+                if lst:
+                    for fi in lst:
+                        fi.format_value(obj)
+
     def format(self, devobj, **kwargs):
-        for fi in self.ids.id_formatters.children:
-            fi.format(devobj, **kwargs)
+        self.format_index(self.items_by_key, self.items_by_type, devobj, **kwargs)
 
 
 class FormatterItem(TwoLineListItem):
@@ -173,21 +194,25 @@ class FormatterItem(TwoLineListItem):
         self.formatter2gui()
 
     def rearm_fomat_timer(self):
-        if self.timer_format:
+        if self.formatter.timeouttime > 0:
+            if self.timer_format:
+                self.timer_format.rearm(self.formatter.timeouttime)
+            else:
+                self.timer_format = Timer(self.formatter.timeouttime, self.set_timeout)
+        elif self.timer_format:
             self.timer_format.cancel()
             self.timer_format = None
-        if self.formatter.timeouttime > 0:
-            self.timer_format = Timer(self.formatter.timeouttime, self.set_timeout)
 
     def set_timeout(self):
         self.secondary_text = self.formatter.set_timeout()
 
     def format(self, devobj, **kwargs):
         f = self.formatter
-        txt = ''
-        for types, obj in kwargs.items():
-            if (not devobj or devobj.get_id() == f.device) and types == f.type:
-                txt = f.format(obj)
+        if f.type in kwargs and (not devobj or devobj.get_id() == f.device):
+            self.format_value(kwargs[f.type])
+
+    def format_value(self, obj):
+        txt = self.formatter.format(obj)
         if txt:
             if self.player:
                 self.rearm_fomat_timer()
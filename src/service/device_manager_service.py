@@ -1,17 +1,18 @@
 import argparse
 import asyncio
-import glob
 import json
 import os
 import re
+import sqlite3
 import traceback
 from functools import partial
-from os.path import basename, dirname, exists, isfile, join, splitext
-from time import time
+from os.path import dirname, exists, join
+from time import perf_counter, time
 
-import aiosqlite
 from db.device import Device
+from db.executor import DBExecutor
 from db.label_formatter import StateFormatter
+from db.migrations import PRAGMA_DEFAULTS, migrate, set_pragmas
 from db.user import User
 from db.view import View
 from util import find_devicemanager_classes, get_verbosity, init_logger
@@ -33,7 +34,7 @@ from util.const import (COMMAND_CONFIRM, COMMAND_CONNECT, COMMAND_CONNECTORS,
                         MSG_TYPE_DEVICE_UNKNOWN, MSG_WAITING_FOR_CONNECTING,
                         PRESENCE_REQUEST_ACTION, PRESENCE_RESPONSE_ACTION)
 from util.osc_comunication import OSCManager
-from util.velocity_tcp import TcpClient
+from util.velocity_tcp import RenderBackend, TcpClient
 from util.timer import Timer
 
 _LOGGER = None
@@ -77,16 +78,12 @@ class DeviceNotiication(object):
                 nowms - self.last_notify_ms >= notify_every_ms:
             self.current_formatter = f
             self.last_notify_ms = nowms
-            txt = ''
-            for types, obj in kwargs.items():
-                if types == f.type:
-                    txt = f.format(obj)
-                    if txt:
-                        break
+            txt = f.format(kwargs[f.type]) if f.type in kwargs else ''
             if txt:
                 if self.timer:
-                    self.timer.cancel()
-                self.timer = Timer(timeout, self.clear)
+                    self.timer.rearm(timeout)
+                else:
+                    self.timer = Timer(timeout, self.clear)
                 self._notify(txt)
 
     def _notify(self, txt):
@@ -107,6 +104,14 @@ class DeviceManagerService(object):
     def __init__(self, **kwargs):
         self.debug_params = dict()
         self.addit_params = dict()
+        self.render_backend = ''
+        self.render_workers = 1
+        self.query_readers = 2
+        self.query_max_rows = 50000
+        self.query_timeout = 30.0
+        self.flush_retry = 3
+        self.flush_retry_secs = 1.0
+        self.db_pragmas = dict(PRAGMA_DEFAULTS)
         for key, val in kwargs.items():
             mo = re.search('^debug_([^_]+)_(.+)', key)
             if mo:
@@ -116,10 +121,13 @@ class DeviceManagerService(object):
                 self.debug_params[kk] = ll
             elif key.startswith('ab_'):
                 self.addit_params[key[3:]] = val
+            elif key.startswith('db_') and key[3:] in PRAGMA_DEFAULTS:
+                self.db_pragmas[key[3:]] = val
             else:
                 setattr(self, key, val)
         _LOGGER.debug(f'Addit params for DM {self.addit_params} AND {self.debug_params}')
         self.db = None
+        self.db_readers = None
         self.oscer = None
         self.notification_formatter_info = dict()
         self.connectors_format = False
@@ -474,24 +482,55 @@ class DeviceManagerService(object):
                 on_state_transition=self.on_event_state_transition)
             self.oscer.send(COMMAND_CONFIRM, CONFIRM_OK, uid, dest=sender)
 
+    @staticmethod
+    def db_query_unit(conn, txt, result, max_rows=0, timeout=0):
+        # runs in a DB thread: sqlite aborts the query when the handler returns True
+        if timeout > 0:
+            deadline = perf_counter() + timeout
+            conn.set_progress_handler(lambda: perf_counter() > deadline, 1000)
+        cursor = conn.cursor()
+        try:
+            result['changes_before'] = conn.total_changes
+            cursor.execute(txt)
+            lst = result['rows']
+            result['rowcount'] = cursor.rowcount
+            result['lastrowid'] = cursor.lastrowid
+            result['changes_after'] = conn.total_changes
+            if max_rows > 0:
+                rows = cursor.fetchmany(max_rows + 1)
+                if len(rows) > max_rows:
+                    del rows[max_rows:]
+                    result['truncated'] = True
+            else:
+                rows = cursor
+            for row in rows:
+                if not result['cols']:
+                    result['cols'] = list(row.keys())
+                item = ''
+                for r in result['cols']:
+                    item += f'\t{row[r]}'
+                lst.append(item.strip())
+        finally:
+            cursor.close()
+            if timeout > 0:
+                conn.set_progress_handler(None, 1000)
+
     async def db_query_single(self, txt):
-        result = dict(error='', rows=[], cols=[], rowcount=0, changes=0, lastrowid=-1)
+        result = dict(error='', rows=[], cols=[], rowcount=0, changes=0, lastrowid=-1, truncated=False)
+        limits = (self.query_max_rows, self.query_timeout)
         try:
-            async with self.db.cursor() as cursor:
-                result['changes_before'] = self.db.total_changes
-                await cursor.execute(txt)
-                lst = result['rows']
-                result['rowcount'] = cursor.rowcount
-                result['lastrowid'] = cursor.lastrowid
-                result['changes_after'] = self.db.total_changes
-                async for row in cursor:
-                    if not result['cols']:
-                        result['cols'] = list(row.keys())
-                    item = ''
-                    for r in result['cols']:
-                        item += f'\t{row[r]}'
-                    lst.append(item.strip())
-            await self.db.commit()
+            done = False
+            if self.db_readers:
+                # reads do not wait for (nor delay) the sample writes
+                try:
+                    await self.db_readers.run(DeviceManagerService.db_query_unit, txt, result, *limits)
+                    done = True
+                except sqlite3.OperationalError as ex:
+                    if str(ex).find('readonly') < 0:
+                        raise
+            if not done:
+                # statements that write go to the primary connection
+                await self.db.run(DeviceManagerService.db_query_unit, txt, result, *limits, commit=True)
         except Exception as ex:
             result['error'] = str(ex)
             _LOGGER.error(f'Query Error {traceback.format_exc()}')
@@ -515,10 +554,8 @@ class DeviceManagerService(object):
             self.oscer.send(COMMAND_CONFIRM, CONFIRM_FAILED_1, MSG_DB_SAVE_ERROR % self.db_fname, do_split=True, dest=sender)
         elif not txt:
             self.oscer.send(COMMAND_CONFIRM, CONFIRM_FAILED_2, MSG_INVALID_PARAM, do_split=True, dest=sender)
-        elif self.devicemanagers_all_stopped():
-            Timer(0, partial(self.db_query, txt, sender=None))
         else:
-            self.oscer.send(COMMAND_CONFIRM, CONFIRM_FAILED_2, MSG_CONNECTION_STATE_INVALID, do_split=True, dest=sender)
+            Timer(0, partial(self.db_query, txt, sender=None))
 
     def on_command_loglevel(self, level, notify_screen_on, notify_every_ms, *args, sender=None, **kwargs):
         init_logger(__name__, level)
@@ -604,6 +641,7 @@ class DeviceManagerService(object):
                 nm = cls.__pre_action__.__name__
                 if nm not in self.devicemanagers_pre_actions:
                     self.devicemanagers_pre_actions[nm] = cls.__pre_action__
+        TcpClient.set_render_backend(self.render_backend, workers=self.render_workers, loop=self.loop)
         await self.init_db(self.db_fname)
         await self.load_db()
         await self.init_osc()
@@ -766,29 +804,27 @@ class DeviceManagerService(object):
                 Timer(0, partial(self.start_remaining_connection_operations, bytimer=False))
 
     async def init_db(self, file):
-        self.db = await aiosqlite.connect(file)
-        if not isinstance(self.db, aiosqlite.Connection):
+        try:
+            self.db = await DBExecutor(file, loop=self.loop).connect()
+        except Exception:
+            _LOGGER.error(f'DB open error {traceback.format_exc()}')
             self.db = None
         else:
-            self.db.row_factory = aiosqlite.Row
-            modules = glob.glob(join(dirname(__file__), "..", "db", "*.py*"))
-            pls = [splitext(basename(f))[0] for f in modules if isfile(f)]
-            import importlib
-            import inspect
-            for x in pls:
+            try:
+                await self.db.run_coro(set_pragmas, **self.db_pragmas)
+                version = await self.db.run_coro(migrate)
+                _LOGGER.info(f'DB schema version {version}')
+            except Exception:
+                _LOGGER.warning(traceback.format_exc())
+            await self.db.commit()
+            if self.query_readers > 0:
+                pragmas = {k: self.db_pragmas[k] for k in ('cache_size', 'mmap_size') if self.db_pragmas.get(k) is not None}
                 try:
-                    m = importlib.import_module(f"db.{x}")
-                    clsmembers = inspect.getmembers(m, inspect.isclass)
-                    for cla in clsmembers:
-                        query = getattr(cla[1], '__create_table_query__')
-                        if query:
-                            # _LOGGER.debug(f'Executing query {query}')
-                            await self.db.execute(query)
-                            cla[1].set_update_columns()
-                    await self.db.execute('PRAGMA foreign_keys = ON')
+                    self.db_readers = await DBExecutor(file, loop=self.loop, workers=self.query_readers,
+                                                       readonly=True, pragmas=pragmas).connect()
                 except Exception:
-                    _LOGGER.warning(traceback.format_exc())
-            await self.db.commit()
+                    _LOGGER.warning(f'DB readers open error {traceback.format_exc()}')
+                    self.db_readers = None
 
     def on_bluetooth_disabled(self, inst, wasdisabled, ok):
         self.undo_enable_operations()
@@ -804,14 +840,30 @@ class DeviceManagerService(object):
 
     async def uninit_db(self):
         if self.db:
+            for _, dm in self.devicemanagers_by_uid.items():
+                # the DB is closed next: the buffered samples get some retries
+                for i in range(self.flush_retry + 1):
+                    try:
+                        if await dm.stop_samples():
+                            break
+                    except Exception:
+                        _LOGGER.warning(f'Flush error for {dm.get_uid()}: {traceback.format_exc()}')
+                    if i < self.flush_retry:
+                        await asyncio.sleep(self.flush_retry_secs)
+                else:
+                    _LOGGER.error(f'Samples of {dm.get_uid()} not saved: {dm.get_pipeline_stats()}')
             await self.db.commit()
             await self.db.close()
+        if self.db_readers:
+            await self.db_readers.close()
+            self.db_readers = None
 
     async def stop(self):
         self.undo_enable_operations()
         await self.stop_event.wait()
         self.oscer.uninit()
         await self.uninit_db()
+        TcpClient.set_render_backend('')
         if self.android:
             self.br.stop()
         self.stop_service()
@@ -847,7 +899,19 @@ def main():
         parser.add_argument('--connect_retry', type=int, help='connect retry', required=False, default=10)
         parser.add_argument('--connect_secs', type=int, help='connect secs', required=False, default=5)
         parser.add_argument('--db_fname', required=False, help='DB file path', default=join(dirname(__file__), '..', 'maindb.db'))
+        parser.add_argument('--db_journal_mode', required=False, help='SQLite journal mode', default=PRAGMA_DEFAULTS['journal_mode'])
+        parser.add_argument('--db_synchronous', required=False, help='SQLite synchronous', default=PRAGMA_DEFAULTS['synchronous'])
+        parser.add_argument('--db_cache_size', type=int, help='SQLite cache_size (negative: KiB)', required=False, default=PRAGMA_DEFAULTS['cache_size'])
+        parser.add_argument('--db_mmap_size', type=int, help='SQLite mmap_size (bytes)', required=False, default=PRAGMA_DEFAULTS['mmap_size'])
+        parser.add_argument('--query_readers', type=int, help='Read only connections for the queries (0: none)', required=False, default=2)
+        parser.add_argument('--query_max_rows', type=int, help='Max rows per query (0: no limit)', required=False, default=50000)
+        parser.add_argument('--query_timeout', type=float, help='Max time per query (s, 0: no limit)', required=False, default=30.0)
+        parser.add_argument('--flush_retry', type=int, help='Sample flush retries at shutdown', required=False, default=3)
+        parser.add_argument('--flush_retry_secs', type=float, help='Sample flush retry interval (s)', required=False, default=1.0)
         parser.add_argument('--verbose', required=False, default="INFO")
+        parser.add_argument('--render_backend', required=False, help='Render templates in a worker pool',
+                            choices=('',) + RenderBackend.BACKENDS, default='')
+        parser.add_argument('--render_workers', type=int, help='Render workers', required=False, default=1)
         argall = parser.parse_known_args()
         args = dict(vars(argall[0]))
         args['undo_info'] = dict()
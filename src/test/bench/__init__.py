@@ -0,0 +1,12 @@
+import time
+
+
+def timeit(fun, n, *args, **kwargs):
+    start = time.perf_counter()
+    for _ in range(n):
+        fun(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def report(name, n, told, tnew):
+    print(f'{name}: old {n / told:.0f}/s new {n / tnew:.0f}/s (x{told / tnew:.2f})')
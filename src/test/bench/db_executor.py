@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from os.path import join
+
+import aiosqlite
+from aiosqlite.core import Connection
+from db.executor import DBExecutor
+from db.keiser_m3i_output import KeiserM3iOutput
+from db.migrations import migrate, set_pragmas
+from device.simulator.keiser_m3i import KeiserM3iDeviceSimulator
+from test.bench.sample_memory import keiser_sample
+
+
+class BenchUser(object):
+    def get_id(self):
+        return 1
+
+
+async def add_owners(db):
+    # the session rows reference them
+    await db.execute("INSERT INTO user (_id, name, weight, height, birthday, male) VALUES (1, 'U', 70, 175, 0, 1)")
+    await db.execute("INSERT INTO device (_id, address, name, alias, type) "
+                     "VALUES (1, '00:11:22:33:44:55', 'M3', 'M3', 'keiserm3i')")
+
+
+class HopCounter(object):
+    # every aiosqlite call goes through Connection._execute: one thread hop each
+    def __init__(self):
+        self.hops = 0
+        self.execute = Connection._execute
+        counter = self
+
+        async def _execute(self, fn, *args, **kwargs):
+            counter.hops += 1
+            return await counter.execute(self, fn, *args, **kwargs)
+
+        Connection._execute = _execute
+
+    def restore(self):
+        Connection._execute = self.execute
+
+
+async def open_aiosqlite(fname, counter):
+    db = await aiosqlite.connect(fname)
+    db.row_factory = aiosqlite.Row
+    await set_pragmas(db, journal_mode='WAL', synchronous='NORMAL')
+    await migrate(db)
+    await add_owners(db)
+    await db.commit()
+    return db, lambda: counter.hops
+
+
+async def open_executor(fname, counter):
+    db = await DBExecutor(fname).connect()
+    await db.run_coro(set_pragmas, journal_mode='WAL', synchronous='NORMAL')
+    await db.run_coro(migrate)
+    await db.run_coro(add_owners, commit=True)
+    return db, lambda: db.stats['runs']
+
+
+async def measure(opener, fname, steps, max_samples):
+    counter = HopCounter()
+    db, get_hops = await opener(fname, counter)
+    try:
+        sim = KeiserM3iDeviceSimulator(db, 1, dict(buffer=5), BenchUser(), max_samples=max_samples, max_age=3600)
+        samples = [keiser_sample(KeiserM3iOutput, i) for i in range(steps)]
+        hops = get_hops()
+        lat = []
+        for obj in samples:
+            start = time.perf_counter()
+            await sim.step(obj)
+            lat.append(time.perf_counter() - start)
+        await sim.flush()
+        hops = get_hops() - hops
+    finally:
+        await db.close()
+        counter.restore()
+    lat.sort()
+    return hops, sum(lat) / len(lat), lat[len(lat) * 99 // 100], lat[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--steps', type=int, help='Simulator steps', default=2000)
+    parser.add_argument('-m', '--max_samples', type=int, help='Samples per flush', default=10)
+    args = parser.parse_args()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, opener in (('aiosqlite', open_aiosqlite), ('executor', open_executor)):
+            fname = join(tmpdir, f'{name}.db')
+            hops, mean, p99, worst = loop.run_until_complete(measure(opener, fname, args.steps, args.max_samples))
+            print(f'{name}: {args.steps} steps {hops} hops ({hops / args.steps:.2f}/step) '
+                  f'latency mean {mean * 1e6:.0f}us p99 {p99 * 1e6:.0f}us max {worst * 1e6:.0f}us')
+            os.remove(fname)
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
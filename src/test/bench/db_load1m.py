@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from os.path import join
+
+import aiosqlite
+from db import SerializableDBObj
+from db.label_formatter import DoubleFieldFormatter, SimpleFieldFormatter
+from db.view import View
+
+
+async def legacy_load1m(db, rowid=None, cls=View, **kwargs):
+    # one children query per parent, as SerializableDBObj.load1m used to do
+    pls = await cls.loadbyid(db, rowid=rowid, **kwargs)
+    if cls.__wherejoin__ and cls.__joinclass__:
+        for p in pls:
+            cond = {cls.__wherejoin__: p.rowid}
+            pls2 = await SerializableDBObj.get_class(cls.__joinclass__).loadbyid(db, rowid=None, **cond)
+            p.set_items(pls2)
+    return pls
+
+
+class CountingDB(object):
+    def __init__(self, db):
+        self.db = db
+        self.queries = 0
+
+    def execute(self, *args, **kwargs):
+        self.queries += 1
+        return self.db.execute(*args, **kwargs)
+
+
+def label_sample(view, i):
+    if i % 2:
+        lf = SimpleFieldFormatter(name=f'L{i}', format_str='%d', fields=['rpm'], example_conf=dict(rpm=60), orderd=i)
+    else:
+        lf = DoubleFieldFormatter(name=f'L{i}', f1='%d', f2='%d', fields=['rpm', 'rpmMn'],
+                                  example_conf=dict(rpm=60, rpmMn=55), orderd=i)
+    lf.view = view
+    return lf
+
+
+def fill(fname, views, labels):
+    db = sqlite3.connect(fname)
+    for cls in (View, SimpleFieldFormatter):
+        db.execute(cls.__create_table_query__)
+    for v in range(1, views + 1):
+        db.execute('INSERT INTO view (_id, name, active) VALUES (?, ?, ?)', (v, f'View{v}', 0))
+        for i in range(labels):
+            lf = label_sample(v, i)
+            colnames, values = lf.get_db_values(lf.__columns__)
+            db.execute(lf.insert_query(colnames), tuple(values))
+    db.commit()
+    db.close()
+
+
+async def measure(fname, fun, n):
+    db = await aiosqlite.connect(fname)
+    db.row_factory = aiosqlite.Row
+    cdb = CountingDB(db)
+    start = time.perf_counter()
+    for _ in range(n):
+        views = await fun(cdb)
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return elapsed / n, cdb.queries // n, views
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-v', '--views', type=int, help='Views', default=50)
+    parser.add_argument('-l', '--labels', type=int, help='Labels per view', default=30)
+    parser.add_argument('-n', '--loads', type=int, help='Loads', default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = join(tmpdir, 'bench.db')
+        fill(fname, args.views, args.labels)
+        loop = asyncio.new_event_loop()
+        told, qold, vold = loop.run_until_complete(measure(fname, legacy_load1m, args.loads))
+        tnew, qnew, vnew = loop.run_until_complete(measure(fname, View.load1m, args.loads))
+        loop.close()
+        assert [[str(it) for it in v.items] for v in vold] == [[str(it) for it in v.items] for v in vnew]
+        print(f'{args.views} views x {args.labels} labels: old {told * 1000:.1f}ms ({qold} queries) '
+              f'new {tnew * 1000:.1f}ms ({qnew} queries) (x{told / tnew:.2f})')
+        os.remove(fname)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from os.path import join
+
+import aiosqlite
+from db import SerializableDBObj
+from db.view import View
+from test.bench.db_load1m import fill
+
+
+async def legacy_to_db(obj, db, commit=True):
+    # every item updated or inserted with its own query, as SerializableDBObj.to_db used to do
+    cols = obj.__update_columns__ if obj.rowid else obj.__columns__
+    colnames, values = obj.get_db_values(cols)
+    async with db.cursor() as cursor:
+        if obj.rowid:
+            values.append(obj.rowid)
+            await cursor.execute(obj.update_query(colnames), tuple(values))
+            if cursor.rowcount <= 0:
+                return False
+        else:
+            await cursor.execute(obj.insert_query(colnames), tuple(values))
+            if cursor.rowcount <= 0:
+                return False
+            obj.set_id(cursor.lastrowid)
+    if obj.__wherejoin__:
+        joincls = SerializableDBObj.get_class(obj.__joinclass__)
+        itemsold = await joincls.loadbyid(db, rowid=None, **{obj.__wherejoin__: obj.rowid})
+        ids = [it.rowid for it in obj.f('items')]
+        for it in itemsold:
+            if it.rowid not in ids:
+                await db.execute(f'DELETE FROM {joincls.__table__} WHERE {joincls.__id__}=?', (it.rowid,))
+        for it in obj.f('items'):
+            it._set_single_field(obj.__wherejoin__, obj.rowid)
+            if not await legacy_to_db(it, db, commit=False):
+                return False
+    if commit:
+        await db.commit()
+    return True
+
+
+class CountingCursor(object):
+    def __init__(self, ctx, counter):
+        self.ctx = ctx
+        self.cursor = None
+        self.counter = counter
+
+    async def __aenter__(self):
+        self.cursor = await self.ctx.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        return await self.ctx.__aexit__(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    async def execute(self, *args):
+        self.counter.queries += 1
+        return await self.cursor.execute(*args)
+
+    async def executemany(self, *args):
+        self.counter.queries += 1
+        return await self.cursor.executemany(*args)
+
+
+class CountingDB(object):
+    def __init__(self, db):
+        self.db = db
+        self.queries = 0
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def execute(self, *args, **kwargs):
+        self.queries += 1
+        return self.db.execute(*args, **kwargs)
+
+    def cursor(self):
+        return CountingCursor(self.db.cursor(), self)
+
+
+async def measure(fname, fun, n, color):
+    db = await aiosqlite.connect(fname)
+    db.row_factory = aiosqlite.Row
+    cdb = CountingDB(db)
+    view = (await View.load1m(db, rowid=1))[0]
+    elapsed = 0
+    for i in range(n):
+        # one label edited per save, as the label editor does
+        lbl = view.items[i % len(view.items)]
+        lbl.background = f'#{i % 256:02x}{color:02x}00ff'
+        start = time.perf_counter()
+        rv = await fun(view, cdb)
+        elapsed += time.perf_counter() - start
+        assert rv
+    await db.close()
+    return elapsed / n, cdb.queries / n
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-l', '--labels', type=int, help='Labels of the view', default=100)
+    parser.add_argument('-n', '--saves', type=int, help='Saves', default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = join(tmpdir, 'bench.db')
+        fill(fname, 1, args.labels)
+        loop = asyncio.new_event_loop()
+        told, qold = loop.run_until_complete(measure(fname, legacy_to_db, args.saves, 1))
+        tnew, qnew = loop.run_until_complete(measure(fname, View.to_db, args.saves, 2))
+        loop.close()
+        print(f'{args.labels} labels, one edited per save: old {told * 1000:.2f}ms ({qold:.0f} queries) '
+              f'new {tnew * 1000:.2f}ms ({qnew:.0f} queries) (x{told / tnew:.2f})')
+        os.remove(fname)
+
+
+if __name__ == '__main__':
+    main()
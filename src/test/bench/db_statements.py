@@ -0,0 +1,118 @@
+import argparse
+import json
+import sqlite3
+
+from db import SerializableDBObj
+from db.keiser_m3i_output import KeiserM3iOutput
+from db.label_formatter import DoubleFieldFormatter, SimpleFieldFormatter
+from test.bench import report, timeit
+
+
+def legacy_set_single_field(self, key, val):
+    fln = self.fld(key)
+    if self.is_json_field(fln) and isinstance(val, str):
+        v = json.loads(val) if val else None
+    else:
+        v = val
+    try:
+        setmethod = getattr(self, f'_set_{fln}')
+        setmethod(v)
+    except Exception:
+        setattr(self, fln, v)
+
+
+def legacy_insert(obj, cursor):
+    values = []
+    colnames = []
+    strcol = ''
+    for t in obj.__columns__:
+        v = obj.f(t)
+        if v is not None:
+            fln = obj.fld(t)
+            if obj.is_json_field(fln) and not isinstance(v, str):
+                v = json.dumps(v) if v else None
+            values.append(v)
+            colnames.append(t)
+            strcol += '?,'
+    strcol = strcol[0:-1]
+    cursor.execute(f'INSERT OR IGNORE into {obj.__table__} ({",".join(colnames)}) VALUES ({strcol})', tuple(values))
+
+
+def new_insert(obj, cursor):
+    colnames, values = obj.get_db_values(obj.__columns__)
+    cursor.execute(obj.insert_query(colnames), tuple(values))
+
+
+def legacy_load(cls, cursor):
+    strcol = ''
+    for t in cls.__columns__:
+        strcol += f'P.{t} AS {t},'
+    query = f'SELECT {strcol[0:-1]} FROM {cls.__table__} AS P'
+    if cls.__load_order__:
+        order = ' ORDER BY '
+        for k, i in cls.__load_order__.items():
+            order += f'{k} {i},'
+        query += order[0:-1]
+    rv = []
+    for row in cursor.execute(query):
+        keys = row.keys()
+        clname = row['classname'] if 'classname' in keys else None
+        rv.append(cls.get_class(clname)(dbitem=row))
+    return rv
+
+
+def new_load(cls, cursor):
+    cache = cls.get_db_cache()
+    rv = []
+    for row in cursor.execute(cache['select'] + cache['order']):
+        keys = row.keys()
+        clname = row['classname'] if 'classname' in keys else None
+        rv.append(cls.get_class(clname)(dbitem=row))
+    return rv
+
+
+def keiser_sample(i):
+    return KeiserM3iOutput(
+        time=i, timeR=i, timeRms=i * 1000, timeRAbsms=i * 1000, distance=i * 0.01,
+        distanceR=i * 0.01, calorie=i // 10, speed=31.5, pulse=120, rpm=90,
+        watt=210, incline=8, session=1)
+
+
+def label_sample(i):
+    if i % 2:
+        lf = SimpleFieldFormatter(name=f'L{i}', format_str='%d', fields=['rpm'], example_conf=dict(rpm=60), view=1, orderd=i)
+    else:
+        lf = DoubleFieldFormatter(name=f'L{i}', f1='%d', f2='%d', fields=['rpm', 'rpmMn'], example_conf=dict(rpm=60, rpmMn=55), view=1, orderd=i)
+    return lf
+
+
+def run(n):
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    for cls in (KeiserM3iOutput, SimpleFieldFormatter):
+        db.execute(cls.__create_table_query__)
+    cursor = db.cursor()
+    current_set_single_field = SerializableDBObj._set_single_field
+    for cls, sample in ((KeiserM3iOutput, keiser_sample), (SimpleFieldFormatter, label_sample)):
+        objs = [sample(i) for i in range(n)]
+        told = timeit(lambda: [legacy_insert(o, cursor) for o in objs], 1)
+        db.execute(f'DELETE FROM {cls.__table__}')
+        tnew = timeit(lambda: [new_insert(o, cursor) for o in objs], 1)
+        report(f'{cls.__table__} insert', n, told, tnew)
+        SerializableDBObj._set_single_field = legacy_set_single_field
+        told = timeit(legacy_load, 1, cls, cursor)
+        SerializableDBObj._set_single_field = current_set_single_field
+        tnew = timeit(new_load, 1, cls, cursor)
+        report(f'{cls.__table__} load', n, told, tnew)
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--rows', type=int, help='Rows per table', default=20000)
+    args = parser.parse_args()
+    run(args.rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import argparse
+
+from device.manager.gatt import GattDeviceManager, UuidBundle
+from test.bench import report, timeit
+
+HEART_RATE = 0x180D
+HEART_RATE_MEASUREMENT = 0x2A37
+
+
+class FakeUuid(object):
+    def __init__(self, v):
+        self.v = UuidBundle.get_uuid(v)
+
+    def toString(self):
+        return self.v
+
+
+class FakeService(object):
+    def __init__(self, uuid):
+        self.uuid = FakeUuid(uuid)
+
+    def getUuid(self):
+        return self.uuid
+
+
+class FakeCharacteristic(object):
+    # like the objects able gets from android: a new one for every callback
+    def __init__(self, service, uuid, instance_id, value):
+        self.service = service
+        self.uuid = FakeUuid(uuid)
+        self.instance_id = instance_id
+        self.value = value
+
+    def getService(self):
+        return self.service
+
+    def getUuid(self):
+        return self.uuid
+
+    def getInstanceId(self):
+        return self.instance_id
+
+    def getValue(self):
+        return self.value
+
+
+class Counter(object):
+    def __init__(self):
+        self.n = 0
+
+    def handler(self, characteristic, uuid=None):
+        self.n += 1
+
+
+def dispatch_uuid(notifications, searchdict):
+    for ch in notifications:
+        GattDeviceManager.call_handler_from_characteristic(ch, searchdict)
+
+
+def dispatch_table(notifications, table, searchdict):
+    for ch in notifications:
+        GattDeviceManager.call_handler_from_table(ch, table, searchdict)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--notifications', type=int, help='Notifications', default=200000)
+    args = parser.parse_args()
+    counter = Counter()
+    u = UuidBundle(HEART_RATE, HEART_RATE_MEASUREMENT, counter.handler)
+    searchdict = {u.key(): u}
+    service = FakeService(HEART_RATE)
+    # what on_services_loop does
+    discovered = FakeCharacteristic(service, HEART_RATE_MEASUREMENT, 42, None)
+    table = {GattDeviceManager.get_characteristic_key(discovered): u}
+    # HR with two RR intervals
+    notifications = [FakeCharacteristic(service, HEART_RATE_MEASUREMENT, 42, [0x10, 60 + i % 40, 0x20, 3, 0x30, 3])
+                     for i in range(args.notifications)]
+    told = timeit(dispatch_uuid, 1, notifications, searchdict)
+    tnew = timeit(dispatch_table, 1, notifications, table, searchdict)
+    assert counter.n == 2 * args.notifications
+    report('gatt notification dispatch', args.notifications, told, tnew)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import random
+
+from db.keiser_m3i_output import KeiserM3iOutput
+from device.manager import GenericDeviceManager
+from device.manager.keiser_m3i import KeiserM3iDeviceManager
+from test.bench import report, timeit
+from test.ble.replay_backend import keiser_adv
+from util.const import DI_FIRMWARE, DI_SOFTWARE, DI_SYSTEMID
+
+u8_le = GenericDeviceManager.u8_le
+u16_le = GenericDeviceManager.u16_le
+
+
+def legacy_parse_adv(arr):
+    # KeiserM3iDeviceManager.parse_adv before the struct layouts
+    if len(arr) < 4 or len(arr) > 19:
+        return False
+    index = 0
+    if arr[index] == 2 and arr[index + 1] == 1:
+        index += 2
+    mayor = u8_le(arr, index)
+    index += 1
+    minor = u8_le(arr, index)
+    index += 1
+    if mayor == 0x06 and len(arr) > index + 13:
+        k3 = KeiserM3iOutput()
+        dt = u8_le(arr, index)
+        if dt == 0 or dt >= 128 or dt <= 227:
+            k3.s(DI_FIRMWARE, mayor)
+            k3.s(DI_SOFTWARE, minor)
+            k3.s(DI_SYSTEMID, u8_le(arr, index + 1))
+        k3.s('orpm', u16_le(arr, index + 2))
+        k3.s('opul', u16_le(arr, index + 4))
+        k3.s('owatt', u16_le(arr, index + 6))
+        k3.s('ocal', u16_le(arr, index + 8))
+        time = u8_le(arr, index + 10) * 60
+        time += u8_le(arr, index + 11)
+        k3.s('otime', time)
+        dist = u16_le(arr, index + 12)
+        if (dist & 32768):
+            dist = (dist & 0x7FFF) / 10.0
+        else:
+            dist = dist / 10.0 * 1.60934
+        if minor >= 0x21 and len(arr) > (index + 14):
+            inc = u8_le(arr, index + 14)
+        else:
+            inc = 0
+        k3.s('odist', dist)
+        k3.s('oinc', inc)
+        return k3
+    else:
+        return None
+
+
+def capture(n, bikes, repeats):
+    # every update is broadcast 1 to repeats * 2 times, bikes interleaved
+    adverts = []
+    updates = [0] * bikes
+    while len(adverts) < n:
+        b = random.randrange(bikes)
+        adv = keiser_adv(b + 1, updates[b])
+        updates[b] += 1
+        for _ in range(random.randint(1, repeats * 2 - 1)):
+            adverts.append((b, adv))
+    return adverts[:n]
+
+
+def parse_all_legacy(adverts):
+    for _, adv in adverts:
+        legacy_parse_adv(adv)
+
+
+def parse_all(adverts):
+    for _, adv in adverts:
+        KeiserM3iDeviceManager.parse_adv(adv)
+
+
+def parse_changed(adverts, bikes, stats):
+    # what process_found_device does now
+    last = [None] * bikes
+    for b, adv in adverts:
+        adv = KeiserM3iDeviceManager.adv_bytes(adv)
+        if adv == last[b]:
+            stats['suppressed'] += 1
+            continue
+        last[b] = adv
+        KeiserM3iDeviceManager.parse_adv(adv)
+        stats['samples'] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--adverts', type=int, help='Advertisements in the capture', default=100000)
+    parser.add_argument('-b', '--bikes', type=int, help='Bikes', default=8)
+    parser.add_argument('-r', '--repeats', type=int, help='Average broadcasts of a payload', default=3)
+    args = parser.parse_args()
+    adverts = capture(args.adverts, args.bikes, args.repeats)
+    for _, adv in adverts[:1000]:
+        old = legacy_parse_adv(adv).get_vars()
+        new = KeiserM3iDeviceManager.parse_adv(adv).get_vars()
+        assert old == new, f'{old} != {new}'
+    told = timeit(parse_all_legacy, 1, adverts)
+    tnew = timeit(parse_all, 1, adverts)
+    report('parse_adv', args.adverts, told, tnew)
+    stats = dict(suppressed=0, samples=0)
+    tdedup = timeit(parse_changed, 1, adverts, args.bikes, stats)
+    report('parse_adv + duplicate suppression', args.adverts, told, tdedup)
+    print(f'{args.adverts} adverts: {stats["samples"]} samples {stats["suppressed"]} suppressed '
+          f'({stats["suppressed"] * 100 / args.adverts:.1f}%)')
+
+
+if __name__ == '__main__':
+    main()
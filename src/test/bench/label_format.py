@@ -0,0 +1,169 @@
+import argparse
+
+from db.device import Device
+from db.hrdevice_output import HRDeviceOutput
+from db.keiser_m3i_output import KeiserM3iOutput
+from db.label_formatter import DoubleFieldFormatter
+from device.manager.hrdevice import HRDeviceManager
+from device.manager.keiser_m3i import KeiserM3iDeviceManager
+from test.bench import report, timeit
+from test.bench.sample_memory import hr_sample, keiser_sample
+from util import init_logger
+
+_LOGGER = init_logger(__name__)
+
+
+# LabelFormatter.wrap, set_timeout and get_fields before the compiled templates
+def legacy_wrap(f, stringtowrap, idxtowrap, pref='norm'):
+    sret = ''
+    flagtowrap = 1 << idxtowrap
+    for w in f.wrappers:
+        if w["flag"] & flagtowrap:
+            tag = w["tag"]
+            if tag:
+                val = w["val"]
+                if val is None or isinstance(val, str):
+                    sval = '' if val is None or val == '' else f'={val}'
+                    sret += f'[{tag}{sval}]'
+                elif isinstance(val, dict):
+                    for repid, repstr in val.items():
+                        if not pref or repid.startswith(pref):
+                            repid = repid[len(pref):]
+                            tag = tag.replace(f'%{repid}%', repstr)
+                    sret += tag
+            sret += w["pre"]
+    sret += stringtowrap
+    for w in reversed(f.wrappers):
+        if w["flag"] & flagtowrap:
+            sret += (w["post"] + w["tagend"])
+    return sret
+
+
+def legacy_timeout(f):
+    if f.col and f.colerror:
+        return legacy_wrap(f, f'[color={f.col}]{f.get_pre()}[/color]', 0) +\
+            legacy_wrap(f, f'[color={f.colerror}]{f.timeout}[/color]', 5, pref='error')
+    else:
+        return legacy_wrap(f, f.get_pre(), 0) + legacy_wrap(f, f.timeout, 5, pref='error')
+
+
+def legacy_get_fields(fldnamelst, obj):
+    if not isinstance(obj, object) or obj is not None:
+        rv = []
+        _LOGGER.debug(f'flds={fldnamelst} obj={obj}')
+        for i in fldnamelst:
+            extract_time = False
+            if i.startswith('%t'):
+                extract_time = True
+                i = i[2:]
+            if i in obj:
+                if extract_time:
+                    tm = obj[i]
+                    hrs = tm // 3600
+                    tm -= hrs * 3600
+                    mins = tm // 60
+                    tm -= mins * 60
+                    secs = tm % 60
+                    rv.append(hrs)
+                    rv.append(mins)
+                    rv.append(secs)
+                else:
+                    rv.append(obj[i])
+            else:
+                return None
+        return tuple(rv)
+    else:
+        return None
+
+
+# SimpleFormatter.format and DoubleFormatter.format before the compiled templates
+def legacy_simple(f, *args):
+    s = f.format_str % args
+    if not f.col:
+        return legacy_wrap(f, f.get_pre(), 0) +\
+            legacy_wrap(f, s, 1)
+    else:
+        return legacy_wrap(f, f'[color={f.col}]{f.get_pre()}[/color]', 0) +\
+            legacy_wrap(f, f'[color={f.col}]{s}[/color]', 1)
+
+
+def legacy_double(f, v1, v2):
+    if v1 is None or v2 is None:
+        return legacy_timeout(f)
+    col1 = f.col
+    s1 = f.f1 % v1
+    s2 = f.f2 % v2
+    if v1 is None or v1 == v2:
+        col2 = f.col
+        pre = 'norm'
+    elif v1 > v2:
+        col2 = f.colmax
+        pre = 'max'
+    else:
+        col2 = f.colmin
+        pre = 'min'
+    if not col1 or not col2 or not f.col:
+        return legacy_wrap(f, f.get_pre(), 0) +\
+            legacy_wrap(f, f'{s1}', 1, pref=pre) +\
+            legacy_wrap(f, f'({s2})', 2) +\
+            legacy_wrap(f, f.post, 4)
+    else:
+        return legacy_wrap(f, f'[color={f.col}]{f.get_pre()}[/color]', 0) +\
+            legacy_wrap(f, f'[color={col2}]{s1}[/color] ', 1) +\
+            legacy_wrap(f, f'[color={f.col}]([/color][color={col1}]{s2}[/color][color={f.col}])[/color]', 2) +\
+            legacy_wrap(f, f'[color={f.col}]{f.post}[/color]', 4)
+
+
+def legacy_format(f, fitobj):
+    # SimpleFieldFormatter.format and DoubleFieldFormatter.format
+    flds = legacy_get_fields(f.fields, fitobj)
+    if flds is None:
+        return legacy_timeout(f)
+    elif isinstance(f, DoubleFieldFormatter):
+        return legacy_double(f, *flds)
+    else:
+        return legacy_simple(f, *flds)
+
+
+def format_legacy(formatters, samples):
+    for s in samples:
+        for f in formatters:
+            legacy_format(f, s)
+
+
+def format_compiled(formatters, samples):
+    for s in samples:
+        for f in formatters:
+            f.format(s)
+
+
+def run(name, manager_class, fun, cls, n):
+    device = Device(type=manager_class.__type__, name=name, alias=name, address='00:11:22:33:44:55')
+    formatters = []
+    for f in manager_class.__formatters__.values():
+        if f.type == 'fitobj':
+            f = f.clone()
+            f.set_device(device)
+            formatters.append(f)
+    notification = manager_class.__notification_formatter__.clone()
+    notification.set_device(device)
+    formatters.append(notification)
+    samples = [fun(cls, i) for i in range(n)]
+    for s in samples[:100]:
+        for f in formatters:
+            assert legacy_format(f, s) == f.format(s), f.name
+    told = timeit(format_legacy, 1, formatters, samples)
+    tnew = timeit(format_compiled, 1, formatters, samples)
+    report(f'{name} labels ({len(formatters)} per sample)', n * len(formatters), told, tnew)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--samples', type=int, help='Samples per device', default=20000)
+    args = parser.parse_args()
+    run('keiser', KeiserM3iDeviceManager, keiser_sample, KeiserM3iOutput, args.samples)
+    run('hr', HRDeviceManager, hr_sample, HRDeviceOutput, args.samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import argparse
+
+from db import SerializableDBObj
+from db.hrdevice_output import HRDeviceOutput
+from db.keiser_m3i_output import KeiserM3iOutput
+from test.bench import report, timeit
+from test.bench.sample_memory import hr_sample, keiser_sample
+from util.osc_codec import OSCCodec
+
+
+def osc_size(arg):
+    # OSC string: NUL terminated, padded to 4; OSC blob: size + data, padded to 4
+    if isinstance(arg, bytes):
+        return 4 + (len(arg) + 3) // 4 * 4
+    return (len(arg.encode('utf-8')) + 4) // 4 * 4
+
+
+def run(name, fun, cls, n):
+    samples = [fun(cls, i) for i in range(n)]
+    sender = OSCCodec()
+    receiver = OSCCodec()
+    table = sender.get_table(cls)
+    receiver.add_remote_table(('127.0.0.1', 1), *table.args())
+    told = timeit(lambda: [s.serialize() for s in samples], 1)
+    tnew = timeit(lambda: [sender.encode(s) for s in samples], 1)
+    report(f'{name} encode', n, told, tnew)
+    legacy = [s.serialize() for s in samples]
+    blobs = [sender.encode(s)[1] for s in samples]
+    told = timeit(lambda: [SerializableDBObj.deserialize(s) for s in legacy], 1)
+    tnew = timeit(lambda: [receiver.decode(('127.0.0.1', 1), b) for b in blobs], 1)
+    report(f'{name} decode', n, told, tnew)
+    print(f'{name} bytes/message: old {sum([osc_size(s) for s in legacy]) / n:.1f} '
+          f'new {sum([osc_size(b) for b in blobs]) / n:.1f}')
+    check = receiver.decode(('127.0.0.1', 1), blobs[-1])
+    assert check.get_vars() == SerializableDBObj.deserialize(legacy[-1]).get_vars()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--messages', type=int, help='Messages per class', default=20000)
+    args = parser.parse_args()
+    run('keiser', keiser_sample, KeiserM3iOutput, args.messages)
+    run('hr', hr_sample, HRDeviceOutput, args.messages)
+
+
+if __name__ == '__main__':
+    main()
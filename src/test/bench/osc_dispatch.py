@@ -0,0 +1,88 @@
+import argparse
+import importlib
+import json
+import logging
+import re
+
+from db import SerializableDBObj
+from db.device import Device
+from db.keiser_m3i_output import KeiserM3iOutput
+from test.bench import report, timeit
+from test.bench.sample_memory import keiser_sample
+from util.const import COMMAND_CONNECTION, COMMAND_DEVICEFIT
+from util.osc_comunication import OSCManager
+
+
+def legacy_deserialize(jsons, rv=None):
+    rer = isinstance(jsons, str) and re.search(r'^\$([a-zA-Z0-9,\._]+)~(.+)$', jsons)
+    if rer:
+        dct = json.loads(rer.group(2))
+        if dct:
+            for d, k in dct.copy().items():
+                dct[d] = legacy_deserialize(k, k)
+            classname = rer.group(1).split(',')
+            cl = getattr(importlib.import_module(classname[0]), classname[1])()
+            cl.process_kwargs(dct)
+            return cl
+    return rv
+
+
+class LegacyOSCManager(OSCManager):
+    def deserialize(self, args, client_address=None):
+        return tuple([legacy_deserialize(a, a) for a in args])
+
+    def device_callback(self, client_address, address, *oscs):
+        if address != COMMAND_CONNECTION:
+            logging.getLogger('bench').debug(f'Received cmd={address} cla={client_address} par={str(oscs)}')
+        if address in self.callbacks:
+            item = None
+            if len(oscs) > 0 and isinstance(oscs[0], str) and oscs[0] in self.callbacks[address]:
+                logging.getLogger('bench').debug(f'Found device command (uid={oscs[0]})')
+                item = self.callbacks[address][oscs[0]]
+                pars = oscs[1:]
+            if '' in self.callbacks[address]:
+                item = self.callbacks[address]['']
+                pars = oscs
+            if item:
+                item['f'](*item['a'], *self.deserialize(pars), sender=client_address)
+
+
+def run(n):
+    received = []
+    client_address = ('127.0.0.1', 33218)
+    uid = OSCManager.generate_uid()
+    device = Device(type='keiserm3i', name='M3', alias='M3', address='00:11:22:33:44:55')
+    samples = [keiser_sample(KeiserM3iOutput, i) for i in range(n)]
+    stream = [(device.serialize(), s.serialize(), 3) for s in samples]
+
+    def on_devicefit(device, fitobj, st, sender=None):
+        received.append(fitobj)
+
+    results = dict()
+    for name, cls in (('legacy', LegacyOSCManager), ('new', OSCManager)):
+        oscer = cls()
+        oscer.handle_device(COMMAND_DEVICEFIT, uid, on_devicefit)
+        results[name] = timeit(lambda: [oscer.device_callback(client_address, COMMAND_DEVICEFIT, uid, *m)
+                                        for m in stream], 1)
+    report('device_callback msg', n, results['legacy'], results['new'])
+    oscer = OSCManager()
+    oscer.handle_device(COMMAND_DEVICEFIT, uid, on_devicefit)
+    sender = OSCManager()
+    table = sender.codec.get_table(KeiserM3iOutput)
+    oscer.on_command_codec_table(*table.args(), sender=client_address)
+    stream = [(d, sender.codec.encode(s)[1], st) for (d, _, st), s in zip(stream, samples)]
+    tblob = timeit(lambda: [oscer.device_callback(client_address, COMMAND_DEVICEFIT, uid, *m)
+                            for m in stream], 1)
+    report('device_callback msg (legacy vs codec)', n, results['legacy'], tblob)
+    assert len(received) == 3 * n
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--messages', type=int, help='DEVICEFIT messages', default=20000)
+    args = parser.parse_args()
+    run(args.messages)
+
+
+if __name__ == '__main__':
+    main()
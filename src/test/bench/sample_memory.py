@@ -0,0 +1,114 @@
+import argparse
+import copy
+import gc
+import pickle
+import time
+import tracemalloc
+
+from db import SerializableDBObj
+from db.hrdevice_output import HRDeviceOutput
+from db.keiser_m3i_output import KeiserM3iOutput
+from util.const import DI_BLNAME, DI_FIRMWARE, DI_SOFTWARE, DI_SYSTEMID
+
+
+class LegacyKeiserM3iOutput(SerializableDBObj):
+    __table__ = KeiserM3iOutput.__table__
+    __columns2field__ = KeiserM3iOutput.__columns2field__
+    __columns__ = KeiserM3iOutput.__columns__
+
+
+class LegacyHRDeviceOutput(SerializableDBObj):
+    __table__ = HRDeviceOutput.__table__
+    __columns2field__ = HRDeviceOutput.__columns2field__
+    __columns__ = HRDeviceOutput.__columns__
+
+
+def keiser_sample(cls, i):
+    # same sequence of sets done by parse_adv, the simulator and the manager
+    k3 = cls()
+    k3.s(DI_FIRMWARE, 6)
+    k3.s(DI_SOFTWARE, 0x21)
+    k3.s(DI_SYSTEMID, 3)
+    k3.s('orpm', 900 + i % 100)
+    k3.s('opul', 1200 + i % 50)
+    k3.s('owatt', 200)
+    k3.s('ocal', i // 20)
+    k3.s('otime', i)
+    k3.s('odist', i * 0.01)
+    k3.s('oinc', 8)
+    k3.s('pulseMn', 0.0)
+    k3.s('rpmMn', 0.0)
+    k3.s('speedMn', 0.0)
+    k3.s('wattMn', 0.0)
+    k3.timeRms = i * 1000
+    k3.timeRAbsms = i * 1000
+    k3.timeR = i
+    k3.speed = 31.5
+    k3.distanceR = i * 0.01
+    k3.pulse //= 10
+    k3.rpm //= 10
+    k3.session = 1
+    k3.s('updates', i)
+    k3.s(DI_BLNAME, 'M3')
+    return k3
+
+
+def hr_sample(cls, i):
+    hro = cls()
+    hro.pulse = 120 + i % 30
+    hro.worn = 1
+    hro.joule = 0
+    hro.intervals_conf = [500, 510]
+    hro.s('jouleMn', 0)
+    hro.s('pulseMn', 0)
+    hro.s('timeR', 0)
+    hro.nBeatsR = i * 2
+    hro.pulseMn = 125.0
+    hro.timeRms = i * 1000
+    hro.timeRAbsms = i * 1000
+    hro.timeR = i
+    hro.session = 1
+    hro.s('updates', i)
+    return hro
+
+
+def measure(name, fun, cls, n):
+    gc.collect()
+    start = time.perf_counter()
+    samples = [fun(cls, i) for i in range(n)]
+    elapsed = time.perf_counter() - start
+    del samples
+    gc.collect()
+    tracemalloc.start()
+    samples = [fun(cls, i) for i in range(n)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name}: {n} samples {current / n:.0f} B/sample (peak {peak / 1024:.0f} KiB) {n / elapsed:.0f} samples/s')
+    del samples
+
+
+def check_copies(name, fun, cls):
+    # the process render backend pickles the samples: they must survive it
+    for obj in (cls(), fun(cls, 1234)):
+        expected = obj.get_vars()
+        for cp in (pickle.loads(pickle.dumps(obj)), copy.copy(obj), copy.deepcopy(obj)):
+            assert cp.get_vars() == expected, f'{name}: {cp.get_vars()} != {expected}'
+    print(f'{name}: pickle/copy round trip OK')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-d', '--duration', type=int, help='Session duration (s)', default=3600)
+    parser.add_argument('-r', '--rate', type=float, help='Samples per second', default=4.0)
+    args = parser.parse_args()
+    n = int(args.duration * args.rate)
+    check_copies('keiser compact', keiser_sample, KeiserM3iOutput)
+    check_copies('hr compact', hr_sample, HRDeviceOutput)
+    measure('keiser legacy', keiser_sample, LegacyKeiserM3iOutput, n)
+    measure('keiser compact', keiser_sample, KeiserM3iOutput, n)
+    measure('hr legacy', hr_sample, LegacyHRDeviceOutput, n)
+    measure('hr compact', hr_sample, HRDeviceOutput, n)
+
+
+if __name__ == '__main__':
+    main()
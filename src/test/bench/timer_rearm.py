@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import time
+
+from util.timer import Timer, TimerScheduler
+
+
+class LegacyTimer:
+    # task per timer, as util.timer.Timer used to do
+    def __init__(self, timeout, callback, loop=None):
+        self._timeout = timeout
+        self._callback = callback
+        self.loop = loop
+        self._task = asyncio.ensure_future(self._job(), loop=loop)
+
+    async def _job_cancel(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _job(self):
+        try:
+            if self._timeout:
+                await asyncio.sleep(self._timeout)
+            await self._callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+
+    def cancel(self):
+        if not self._task.done():
+            asyncio.ensure_future(self._job_cancel(), loop=self.loop)
+
+
+async def on_timeout():
+    pass
+
+
+async def rearm_legacy(n):
+    timer = None
+    for _ in range(n):
+        if timer:
+            timer.cancel()
+        timer = LegacyTimer(10, on_timeout)
+        # one notification per loop iteration
+        await asyncio.sleep(0)
+    timer.cancel()
+
+
+async def rearm_new(n):
+    timer = None
+    for _ in range(n):
+        if timer:
+            timer.rearm(10)
+        else:
+            timer = Timer(10, on_timeout)
+        await asyncio.sleep(0)
+    timer.cancel()
+
+
+async def cancel_new(n):
+    # unchanged call sites: cancel and create a new Timer each time
+    timer = None
+    for _ in range(n):
+        if timer:
+            timer.cancel()
+        timer = Timer(10, on_timeout)
+        await asyncio.sleep(0)
+    timer.cancel()
+
+
+def measure(name, fun, n):
+    loop = asyncio.new_event_loop()
+    tasks = [0]
+
+    def task_factory(loop, coro):
+        tasks[0] += 1
+        return asyncio.Task(coro, loop=loop)
+
+    loop.set_task_factory(task_factory)
+    cpu = time.process_time()
+    loop.run_until_complete(fun(n))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    cpu = time.process_time() - cpu
+    stats = TimerScheduler.get(loop).get_stats()
+    loop.close()
+    # the task running fun itself is not counted
+    print(f'{name}: {n} rearms tasks={tasks[0] - 2} cpu={cpu * 1000:.1f}ms '
+          f'({cpu * 1e6 / n:.2f}us/rearm) heap={stats["queued"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-n', '--rearms', type=int, help='Rearms', default=10000)
+    args = parser.parse_args()
+    measure('legacy cancel+Timer', rearm_legacy, args.rearms)
+    measure('cancel+Timer', cancel_new, args.rearms)
+    measure('Timer.rearm', rearm_new, args.rearms)
+
+
+if __name__ == '__main__':
+    main()
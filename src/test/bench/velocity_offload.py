@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import tempfile
+import time
+from os.path import join
+
+from db.device import Device
+from db.keiser_m3i_output import KeiserM3iOutput
+from test.bench.sample_memory import keiser_sample
+from util.velocity_tcp import RenderBackend, TcpClient
+
+HEAVY_TEMPLATE = '''#foreach($a in $aliases)
+#foreach($i in [1..%d])
+$a $i $devs.get($a).state $devs.get($a).fitobj.rpm $util.format("%%.1f", $devs.get($a).fitobj.watt)
+#end
+#end
+'''
+
+
+class Counter(object):
+    def __init__(self):
+        self.writes = 0
+        self.nbytes = 0
+
+    def write_out(self, out):
+        self.writes += 1
+        self.nbytes += len(out)
+
+
+async def probe(latencies, interval, stop):
+    # how late the loop wakes up a coroutine sleeping for interval
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(interval)
+        latencies.append(time.perf_counter() - t - interval)
+
+
+async def feed(devices, rate, duration):
+    n = 0
+    samples = [keiser_sample(KeiserM3iOutput, i) for i in range(int(rate * duration) + 1)]
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for d in devices:
+            TcpClient.format(d, fitobj=samples[n], device=d, state=1)
+        n += 1
+        await asyncio.sleep(1.0 / rate)
+    await asyncio.sleep(0.5)
+    return n * len(devices)
+
+
+async def measure(devices, rate, duration):
+    latencies = []
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(probe(latencies, 0.005, stop))
+    events = await feed(devices, rate, duration)
+    stop.set()
+    await task
+    return events, latencies
+
+
+def run(name, backend, template_file, ndevices, rate, duration):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    TcpClient._GROUPS.clear()
+    TcpClient.reset_templates()
+    TcpClient.set_render_backend(backend, loop=loop)
+    counter = Counter()
+    client = TcpClient(hp=(template_file, 0), template_file=template_file,
+                       loop=loop, write_out=counter.write_out)
+    devices = [Device(type='keiserm3i', name=f'dev{i}', alias=f'dev{i}', address=f'00:11:22:33:44:5{i}')
+               for i in range(ndevices)]
+    events, latencies = loop.run_until_complete(measure(devices, rate, duration))
+    stats = TcpClient._BACKEND.get_stats() if TcpClient._BACKEND else dict()
+    TcpClient.set_render_backend('')
+    client._stop()
+    loop.close()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+    mx = latencies[-1] if latencies else 0
+    print(f'{name}: {events} events {counter.writes} writes loop lag p99 {p99 * 1000:.1f}ms '
+          f'max {mx * 1000:.1f}ms {stats}')
+    assert counter.writes, f'{name}: no output'
+    if backend:
+        # the pool itself rendered (no fall back to the loop)
+        assert stats['done'] and not stats['restarts'], f'{name}: {stats}'
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-d', '--devices', type=int, help='Devices', default=3)
+    parser.add_argument('-l', '--lines', type=int, help='Template lines per device', default=300)
+    parser.add_argument('-r', '--rate', type=float, help='Samples per second per device', default=4.0)
+    parser.add_argument('-t', '--duration', type=float, help='Duration (s)', default=5.0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        template_file = join(tmpdir, 'heavy.vm')
+        with open(template_file, 'w') as f:
+            f.write(HEAVY_TEMPLATE % args.lines)
+        TcpClient._LOADER = None
+        run('loop', '', template_file, args.devices, args.rate, args.duration)
+        for backend in RenderBackend.BACKENDS:
+            run(backend, backend, template_file, args.devices, args.rate, args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import tempfile
+import time
+from os.path import join
+
+from db.device import Device
+from db.keiser_m3i_output import KeiserM3iOutput
+from test.bench.sample_memory import keiser_sample
+from util.velocity_tcp import TcpClient
+
+ALL_TEMPLATE = '''#foreach($a in $aliases)
+$a: $devs.get($a).state $devs.get($a).fitobj.rpm $devs.get($a).fitobj.watt $devs.get($a).fitobj.pulse
+#end
+'''
+
+SINGLE_TEMPLATE = '''$dev0.state $dev0.fitobj.rpm $dev0.fitobj.watt $dev0.fitobj.pulse
+'''
+
+
+class Counter(object):
+    def __init__(self):
+        self.writes = 0
+        self.nbytes = 0
+
+    def write_out(self, out):
+        self.writes += 1
+        self.nbytes += len(out)
+
+
+def legacy_format(clients, devobj, **kwargs):
+    # every client renders its template on every event
+    dictvars = TcpClient.update_namespace(devobj, **kwargs)
+    for c in clients:
+        c._format(dictvars)
+
+
+async def feed(fmt, devices, rate, duration):
+    n = 0
+    samples = [keiser_sample(KeiserM3iOutput, i) for i in range(int(rate * duration) + 1)]
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for d in devices:
+            fmt(d, fitobj=samples[n], device=d, state=1)
+        n += 1
+        await asyncio.sleep(1.0 / rate)
+    await asyncio.sleep(TcpClient.RENDER_MIN_INTERVAL * 2)
+    return n * len(devices)
+
+
+def run(name, legacy, tmpdir, connectors, ndevices, rate, duration):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    TcpClient._GROUPS.clear()
+    TcpClient.reset_templates()
+    counter = Counter()
+    clients = []
+    for i in range(connectors):
+        template_file = join(tmpdir, 'all.vm' if i % 2 == 0 else 'single.vm')
+        clients.append(TcpClient(hp=(template_file, i), template_file=template_file,
+                                 loop=loop, write_out=counter.write_out))
+    devices = [Device(type='keiserm3i', name=f'dev{i}', alias=f'dev{i}', address=f'00:11:22:33:44:5{i}')
+               for i in range(ndevices)]
+    if legacy:
+        def fmt(d, **kwargs):
+            legacy_format(clients, d, **kwargs)
+    else:
+        fmt = TcpClient.format
+    cpu = time.process_time()
+    events = loop.run_until_complete(feed(fmt, devices, rate, duration))
+    cpu = time.process_time() - cpu
+    renders = events * connectors if legacy else sum([g.stats['renders'] for g in TcpClient._GROUPS.values()])
+    for c in clients:
+        c._stop()
+    loop.close()
+    print(f'{name}: {events} events {renders} renders {counter.writes} writes '
+          f'{counter.nbytes} bytes cpu {cpu * 1000:.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-c', '--connectors', type=int, help='Connectors', default=5)
+    parser.add_argument('-d', '--devices', type=int, help='Devices', default=3)
+    parser.add_argument('-r', '--rate', type=float, help='Samples per second per device', default=4.0)
+    parser.add_argument('-t', '--duration', type=float, help='Duration (s)', default=10.0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(join(tmpdir, 'all.vm'), 'w') as f:
+            f.write(ALL_TEMPLATE)
+        with open(join(tmpdir, 'single.vm'), 'w') as f:
+            f.write(SINGLE_TEMPLATE)
+        TcpClient._LOADER = None
+        run('legacy', True, tmpdir, args.connectors, args.devices, args.rate, args.duration)
+        run('grouped', False, tmpdir, args.connectors, args.devices, args.rate, args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+from .replay_backend import main
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import random
+
+from util.bluetooth_dispatcher import ScanMultiplexer
+
+
+def keiser_adv(machine, i):
+    # M3i broadcast: prefix, major, minor, data type, machine id, rpm, pulse,
+    # watt, kcal, minutes, seconds, distance, gear
+    rpm = 700 + (i * 7) % 300
+    pulse = 1200 + i % 400
+    watt = 100 + i % 150
+    dist = 0x8000 | (i // 4)
+    return [2, 1, 0x06, 0x30, 0, machine,
+            rpm & 0xFF, rpm >> 8, pulse & 0xFF, pulse >> 8,
+            watt & 0xFF, watt >> 8, (i // 10) & 0xFF, 0,
+            (i // 60) % 60, i % 60, dist & 0xFF, dist >> 8, 10]
+
+
+def record_keiser(bikes, rate, duration):
+    """Adverts of bikes M3i bikes broadcasting rate times per second.
+
+    Every record is [time, address, name, rssi, advertisement bytes].
+    """
+    records = []
+    for b in range(bikes):
+        address = f'00:11:22:33:{b // 256:02X}:{b % 256:02X}'
+        for i in range(int(rate * duration)):
+            records.append([i / rate + random.random() / rate, address, 'M3i', -60 - b % 30, keiser_adv(b + 1, i)])
+    records.sort(key=lambda r: r[0])
+    return records
+
+
+class ReplayBackend(object):
+    """Fake BLE backend for ScanMultiplexer: replays recorded advertisements.
+
+    Filters on deviceName are applied like the platform scanner does and
+    adverts are reported as the BluetoothDispatcherW does (json device and
+    advertisement).
+    """
+
+    def __init__(self, records, loop=None, speed=1.0):
+        self.records = records
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.speed = speed
+        self.mux = None
+        self.task = None
+        self.origin = None
+        self.scans = 0
+
+    def start_scan(self, scan_settings=None, scan_filters=None):
+        self.scans += 1
+        if self.origin is None:
+            self.origin = self.loop.time()
+        names = None if scan_filters is None else set([f.get('deviceName') for f in scan_filters])
+        self.task = self.loop.create_task(self.replay(names))
+        self.loop.call_soon(self.mux.on_scan_started, True)
+
+    def stop_scan(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.loop.call_soon(self.mux.on_scan_completed)
+
+    async def replay(self, names):
+        # a new scan goes on with the recording: adverts sent while not
+        # scanning are lost
+        skip = (self.loop.time() - self.origin) * self.speed
+        for t, address, name, rssi, adv in self.records:
+            if t < skip:
+                continue
+            wait = self.origin + t / self.speed - self.loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if names is None or name in names:
+                self.mux.on_device(json.dumps(dict(address=address, name=name)), rssi, json.dumps(adv))
+
+
+class Subscriber(object):
+    def __init__(self, address):
+        self.address = address
+        self.adverts = 0
+        self.wrong = 0
+        self.started = 0
+        self.completed = 0
+
+    def on_device(self, device, rssi, advertisement):
+        self.adverts += 1
+        if device['address'] != self.address:
+            self.wrong += 1
+
+    def on_scan_started(self, success):
+        self.started += 1
+
+    def on_scan_completed(self):
+        self.completed += 1
+
+
+async def run(mux, subscribers, duration):
+    for s in subscribers:
+        mux.subscribe(s.address, s.on_device, on_scan_started=s.on_scan_started,
+                      on_scan_completed=s.on_scan_completed, filters=[dict(deviceName='M3i')])
+    await asyncio.sleep(duration / 2)
+    # every bike asks for its periodic rescan at about the same time
+    for s in subscribers:
+        mux.rescan()
+    await asyncio.sleep(duration / 2)
+    for s in subscribers:
+        mux.unsubscribe(s.address)
+    await asyncio.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog=__name__)
+    parser.add_argument('-b', '--bikes', type=int, help='Bikes broadcasting', default=20)
+    parser.add_argument('-s', '--subscribers', type=int, help='Bikes with a device manager', default=10)
+    parser.add_argument('-r', '--rate', type=float, help='Adverts per second per bike', default=4.0)
+    parser.add_argument('-t', '--duration', type=float, help='Duration (s)', default=4.0)
+    parser.add_argument('-f', '--file', help='Recorded adverts (json list of [time, address, name, rssi, bytes])')
+    args = parser.parse_args()
+    if args.file:
+        with open(args.file, 'r') as f:
+            records = json.load(f)
+    else:
+        records = record_keiser(args.bikes, args.rate, args.duration)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    backend = ReplayBackend(records, loop=loop)
+    mux = ScanMultiplexer(backend=backend, loop=loop)
+    mux.RESCAN_MIN_INTERVAL = 0
+    backend.mux = mux
+    addresses = sorted(set([r[1] for r in records]))[:args.subscribers]
+    subscribers = [Subscriber(a) for a in addresses]
+    loop.run_until_complete(run(mux, subscribers, args.duration))
+    loop.close()
+    print(f'backend scans {backend.scans} {mux.get_stats()}')
+    for s in subscribers:
+        print(f'{s.address}: adverts {s.adverts} misrouted {s.wrong} started {s.started} completed {s.completed}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from functools import partial
 
@@ -393,3 +394,188 @@ if platform == 'android':
                              status)
 else:
     BluetoothDispatcher = BluetoothDispatcherW
+
+
+class ScanDispatcher(BluetoothDispatcher):
+    """Dispatcher running the scan of a ScanMultiplexer."""
+
+    def __init__(self, mux, **kwargs):
+        self.mux = mux
+        super(ScanDispatcher, self).__init__(**kwargs)
+
+    def on_device(self, device, rssi, advertisement):
+        self.mux.on_device(device, rssi, advertisement)
+
+    def on_scan_started(self, success):
+        self.mux.on_scan_started(success)
+
+    def on_scan_completed(self):
+        self.mux.on_scan_completed()
+
+
+class ScanMultiplexer(object):
+    """One BLE scan shared by the device managers of a loop.
+
+    Managers subscribe with the address of their device: the scan runs with
+    the union of the subscribers filters while there is at least one
+    subscriber, and every advertisement is routed to the subscriber of its
+    address with a dict lookup. Stopping a subscription does not stop the
+    scan of the others. Rescan requests restart the scan once: requests
+    arriving while it is restarting, or less than RESCAN_MIN_INTERVAL
+    seconds after it (re)started, are merged.
+
+    The backend (a ScanDispatcher by default) must provide start_scan and
+    stop_scan and report to on_device, on_scan_started and on_scan_completed
+    (from any thread).
+
+    Multiplexers are kept by loop: the ones of the closed loops are removed
+    when a new one is created.
+    """
+
+    STATE_IDLE = 0
+    STATE_STARTING = 1
+    STATE_SCANNING = 2
+    STATE_STOPPING = 3
+    RESCAN_MIN_INTERVAL = 60
+    _MULTIPLEXERS = dict()
+
+    def __init__(self, backend=None, loop=None):
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.backend = backend if backend else ScanDispatcher(self)
+        self.subs = dict()
+        self.waiting = set()
+        self.state = ScanMultiplexer.STATE_IDLE
+        self.started = 0
+        self.filters = None
+        self.stats = dict(adverts=0, routed=0, unrouted=0, starts=0, rescans=0, merged=0)
+
+    @staticmethod
+    def get(loop):
+        muxes = ScanMultiplexer._MULTIPLEXERS
+        mux = muxes.get(loop)
+        if mux is None:
+            for lp in [lp for lp in muxes.keys() if lp.is_closed()]:
+                del muxes[lp]
+            mux = muxes[loop] = ScanMultiplexer(loop=loop)
+        return mux
+
+    def get_stats(self):
+        return dict(self.stats, subscribers=len(self.subs), state=self.state)
+
+    def get_filters(self):
+        # None (no filter) wins
+        filters = []
+        for sub in self.subs.values():
+            if sub['filters'] is None:
+                return None
+            for f in sub['filters']:
+                if f not in filters:
+                    filters.append(f)
+        return filters
+
+    def get_settings(self):
+        for sub in self.subs.values():
+            if sub['settings']:
+                return sub['settings']
+        return None
+
+    def subscribe(self, address, on_device, on_scan_started=None, on_scan_completed=None,
+                  settings=None, filters=None):
+        self.subs[address] = dict(on_device=on_device,
+                                  on_scan_started=on_scan_started,
+                                  on_scan_completed=on_scan_completed,
+                                  settings=settings,
+                                  filters=filters)
+        if self.state == ScanMultiplexer.STATE_SCANNING and self.get_filters() == self.filters:
+            if on_scan_started:
+                self.loop.call_soon(on_scan_started, True)
+        else:
+            self.waiting.add(address)
+            if self.state == ScanMultiplexer.STATE_IDLE:
+                self._start()
+            elif self.state == ScanMultiplexer.STATE_SCANNING:
+                # the new filters are not active yet
+                self._restart()
+
+    def unsubscribe(self, address):
+        sub = self.subs.pop(address, None)
+        if not sub:
+            return False
+        self.waiting.discard(address)
+        if sub['on_scan_completed']:
+            self.loop.call_soon(sub['on_scan_completed'])
+        if not self.subs and self.state == ScanMultiplexer.STATE_SCANNING:
+            self._stop()
+        return True
+
+    def rescan(self):
+        if self.state == ScanMultiplexer.STATE_SCANNING and\
+                self.loop.time() - self.started >= self.RESCAN_MIN_INTERVAL:
+            self._restart()
+        else:
+            self.stats['merged'] += 1
+
+    def _start(self):
+        self.state = ScanMultiplexer.STATE_STARTING
+        self.filters = self.get_filters()
+        self.stats['starts'] += 1
+        _LOGGER.info(f'Starting shared scan for {len(self.subs)} subscribers (filters={self.filters})')
+        self.backend.start_scan(self.get_settings(), self.filters)
+
+    def _stop(self):
+        self.state = ScanMultiplexer.STATE_STOPPING
+        self.backend.stop_scan()
+
+    def _restart(self):
+        self.stats['rescans'] += 1
+        self._stop()
+
+    def on_device(self, device, rssi, advertisement):
+        self.loop.call_soon_threadsafe(self.route, device, rssi, advertisement)
+
+    def on_scan_started(self, success):
+        self.loop.call_soon_threadsafe(self.scan_started, success)
+
+    def on_scan_completed(self):
+        self.loop.call_soon_threadsafe(self.scan_completed)
+
+    def route(self, device, rssi, advertisement):
+        self.stats['adverts'] += 1
+        if isinstance(device, str):
+            device = json.loads(device)
+        address = device['address'] if isinstance(device, dict) else device.getAddress()
+        sub = self.subs.get(address)
+        if sub:
+            self.stats['routed'] += 1
+            sub['on_device'](device, rssi, advertisement)
+        else:
+            self.stats['unrouted'] += 1
+
+    def scan_started(self, success):
+        if success:
+            subs = [self.subs[a] for a in self.waiting if a in self.subs]
+            self.state = ScanMultiplexer.STATE_SCANNING
+            self.started = self.loop.time()
+        else:
+            # the scan is gone for every subscriber
+            _LOGGER.warning('Shared scan start failed')
+            subs = list(self.subs.values())
+            self.subs.clear()
+            self.state = ScanMultiplexer.STATE_IDLE
+        self.waiting.clear()
+        for sub in subs:
+            if sub['on_scan_started']:
+                sub['on_scan_started'](success)
+        if self.state == ScanMultiplexer.STATE_SCANNING:
+            if not self.subs:
+                self._stop()
+            elif self.get_filters() != self.filters:
+                self._restart()
+
+    def scan_completed(self):
+        if self.state != ScanMultiplexer.STATE_STOPPING:
+            _LOGGER.info('Shared scan stopped by the backend')
+            self.stats['rescans'] += 1
+        self.state = ScanMultiplexer.STATE_IDLE
+        if self.subs:
+            self._start()
@@ -78,6 +78,8 @@ COMMAND_PRINTMSG = '/printmsg'
 COMMAND_LOGLEVEL = '/loglevel'
 COMMAND_QUERY = '/query'
 COMMAND_SPLIT = '/split'
+COMMAND_CODEC = '/codec'
+COMMAND_CODEC_TABLE = '/codec_table'
 
 COMMAND_WBD_CHARACTERISTICCHANGED = '/wbd_characteristic_changed'
 COMMAND_WBD_CHARACTERISTICREAD = '/wbd_characteristic_read'
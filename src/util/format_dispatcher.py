@@ -0,0 +1,92 @@
+import asyncio
+import traceback
+
+from util import init_logger
+
+_LOGGER = init_logger(__name__)
+
+
+class FormatDispatcher(object):
+    """Rate limited fan-out of format calls to a sink.
+
+    Calls are coalesced per device keeping only the latest value of each
+    keyword (fitobj, state, session, ...) and passed to the sink at most
+    fps times per second. With fps <= 0 every call is passed immediately.
+    keys, when set, is the collection (or a callable returning it) of the
+    keywords the sink is interested in: the other ones are dropped.
+    """
+
+    def __init__(self, fun, fps=0, keys=None, loop=None):
+        self.fun = fun
+        self.keys = keys
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.pending = dict()
+        self.handle = None
+        self.last_flush = 0
+        self.interval = 0
+        self.stats = dict(received=0, dispatched=0, coalesced=0, filtered=0)
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        self.interval = 1.0 / fps if fps and fps > 0 else 0
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        if self.pending:
+            if self.interval:
+                self.schedule()
+            else:
+                self.flush()
+
+    def get_stats(self):
+        return dict(self.stats, pending=len(self.pending))
+
+    def filter(self, kwargs):
+        keys = self.keys() if callable(self.keys) else self.keys
+        if keys is None:
+            return kwargs
+        return {k: v for k, v in kwargs.items() if k in keys}
+
+    def __call__(self, devobj, **kwargs):
+        self.stats['received'] += 1
+        kwargs = self.filter(kwargs)
+        if not kwargs:
+            self.stats['filtered'] += 1
+        elif not self.interval:
+            self.dispatch(devobj, kwargs)
+        else:
+            key = devobj.get_id() if devobj else None
+            el = self.pending.get(key)
+            if el is None:
+                self.pending[key] = [devobj, kwargs]
+            else:
+                self.stats['coalesced'] += 1
+                el[0] = devobj
+                el[1].update(kwargs)
+            if self.handle is None:
+                self.schedule()
+
+    def schedule(self):
+        delay = max(0, self.last_flush + self.interval - self.loop.time())
+        self.handle = self.loop.call_later(delay, self.flush)
+
+    def dispatch(self, devobj, kwargs):
+        self.stats['dispatched'] += 1
+        try:
+            self.fun(devobj, **kwargs)
+        except Exception:
+            _LOGGER.error(f'Format error {traceback.format_exc()}')
+
+    def flush(self):
+        self.handle = None
+        self.last_flush = self.loop.time()
+        pending = self.pending
+        self.pending = dict()
+        for devobj, kwargs in pending.values():
+            self.dispatch(devobj, kwargs)
+
+    def cancel(self):
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        self.pending.clear()
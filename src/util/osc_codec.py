@@ -0,0 +1,139 @@
+import json
+import struct
+
+from db import CompactDBObj, SerializableDBObj
+from util import init_logger
+
+_LOGGER = init_logger(__name__)
+
+
+class CodecTable(object):
+    HEADER = struct.Struct('<HQ')
+
+    def __init__(self, tid, cls, fields):
+        self.tid = tid
+        self.cls = cls
+        self.fullname = cls.fullname()
+        self.fields = tuple([tuple(f) for f in fields])
+        field_set = getattr(cls, '__field_set__', ())
+        self.local = tuple([f in field_set for f, _ in self.fields])
+        self.formats = dict()
+
+    def get_format(self, mask):
+        fmt = self.formats.get(mask)
+        if fmt is None:
+            codes = '<'
+            for i, (_, code) in enumerate(self.fields):
+                if mask & (1 << i):
+                    codes += code
+            fmt = self.formats[mask] = struct.Struct(codes)
+        return fmt
+
+    def args(self):
+        return (self.tid, self.fullname, json.dumps(self.fields))
+
+    def encode(self, obj):
+        mask = 0
+        values = []
+        tail = None
+        for i, (f, code) in enumerate(self.fields):
+            v = getattr(obj, f)
+            if v is not None:
+                if code == 'j':
+                    if tail is None:
+                        tail = dict()
+                    tail[f] = v
+                else:
+                    mask |= 1 << i
+                    values.append(v)
+        extra = obj._extra
+        if extra:
+            if tail is None:
+                tail = dict()
+            tail.update(extra)
+        fmt = self.get_format(mask)
+        blob = self.HEADER.pack(self.tid, mask) + fmt.pack(*values)
+        if tail:
+            blob += json.dumps(tail).encode('utf-8')
+        return blob
+
+    def decode(self, blob):
+        _, mask = self.HEADER.unpack_from(blob, 0)
+        fmt = self.get_format(mask)
+        values = fmt.unpack_from(blob, self.HEADER.size)
+        obj = self.cls()
+        i = 0
+        for b, (f, _) in enumerate(self.fields):
+            if mask & (1 << b):
+                if self.local[b]:
+                    setattr(obj, f, values[i])
+                else:
+                    obj.s(f, values[i])
+                i += 1
+        offset = self.HEADER.size + fmt.size
+        if len(blob) > offset:
+            obj.process_kwargs(json.loads(blob[offset:].decode('utf-8')))
+        obj.rowid = getattr(obj, obj.__id__)
+        return obj
+
+
+class OSCCodec(object):
+    """Binary encoding of CompactDBObj records for the OSC link.
+
+    A record is sent as an OSC blob: table id and null mask, then the
+    present schema fields packed with their struct codes and an optional
+    JSON tail for 'j' fields and extra values. The table (class name and
+    field list) of a class is sent once per peer before the first blob.
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.tables = dict()
+        self.remote_tables = dict()
+        self.classes = dict()
+
+    @staticmethod
+    def can_encode(obj):
+        return isinstance(obj, CompactDBObj) and obj.__fields__
+
+    def get_table(self, cls):
+        table = self.tables.get(cls)
+        if table is None:
+            table = self.tables[cls] = CodecTable(len(self.tables) + 1, cls, cls.__fields__)
+        return table
+
+    def encode(self, obj):
+        table = self.get_table(obj.__class__)
+        try:
+            return table, table.encode(obj)
+        except (struct.error, TypeError, ValueError):
+            _LOGGER.debug('Cannot encode %s', obj, exc_info=True)
+            return table, None
+
+    def get_class(self, fullname):
+        cls = self.classes.get(fullname)
+        if cls is None:
+            cls = self.classes[fullname] = SerializableDBObj.get_class(fullname)
+        return cls
+
+    def add_remote_table(self, client_address, tid, fullname, fields):
+        cls = self.get_class(fullname)
+        if cls is SerializableDBObj:
+            _LOGGER.warning(f'Unknown codec class {fullname}')
+        else:
+            self.remote_tables[(client_address, tid)] = CodecTable(tid, cls, json.loads(fields))
+
+    def forget(self, client_address):
+        for k in list(self.remote_tables.keys()):
+            if k[0] == client_address:
+                del self.remote_tables[k]
+
+    def decode(self, client_address, blob):
+        if len(blob) < CodecTable.HEADER.size:
+            return None
+        tid, _ = CodecTable.HEADER.unpack_from(blob, 0)
+        table = self.remote_tables.get((client_address, tid))
+        if table:
+            return table.decode(blob)
+        return None
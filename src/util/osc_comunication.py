@@ -1,31 +1,50 @@
 import asyncio
+import base64
+from collections import deque
 import json
+import logging
 import random
 import re
 import string
 from functools import partial
 from time import time
 import traceback
+import zlib
 
 from db import SerializableDBObj
 from pythonosc.dispatcher import Dispatcher
 from pythonosc.osc_server import AsyncIOOSCUDPServer
 from pythonosc.udp_client import SimpleUDPClient
-from util.const import COMMAND_CONFIRM, COMMAND_CONNECTION, COMMAND_SPLIT
+from util.const import (COMMAND_CODEC, COMMAND_CODEC_TABLE, COMMAND_CONFIRM,
+                        COMMAND_CONNECTION, COMMAND_DEVICEFIT, COMMAND_SPLIT)
+from util.osc_codec import OSCCodec
 from util.timer import Timer
 from util import init_logger
 
 _LOGGER = init_logger(__name__)
+_SPLIT_RE = re.compile(r'^#([A-Za-z0-9]+):([0-9]+)/([0-9]+)(:z)?#(.*)', re.S)
 
 
 class OSCManager(object):
     PKT_SPLIT = 65000
+    SPLIT_WINDOW = 8
+    SPLIT_RTO = 0.5
+    SPLIT_MAX_RETRY = 10
+    SPLIT_COMPRESS_MIN = 4096
+    SPLIT_STATE_TIMEOUT = 60
+    # the peer sets the chunk count: it is checked before allocating the parts
+    SPLIT_MAX_CHUNKS = 1024
+    CMD_QUEUE_MAX = 1000
+    CMD_QUEUE_BATCH = 64
+    CMD_COALESCE = (COMMAND_DEVICEFIT,)
 
     def __init__(self,
                  hostlisten='127.0.0.1',
                  portlisten=33217,
                  hostconnect=None,
-                 portconnect=None):
+                 portconnect=None,
+                 use_codec=True,
+                 cmd_queue_max=CMD_QUEUE_MAX):
         self.hostlisten = hostlisten
         self.portlisten = portlisten
         self.hostconnect = hostconnect
@@ -37,8 +56,18 @@ class OSCManager(object):
         self.client_connection_sender_timer = None
         self.user_on_connection_timeout = None
         self.connected_hosts = dict()
+        self.hosts_by_conn_from = dict()
         self.callbacks = dict()
-        self.cmd_queue = []
+        self.cmd_queue = deque()
+        self.cmd_queue_max = cmd_queue_max
+        self.cmd_coalesce = dict()
+        self.cmd_event = asyncio.Event()
+        self.cmd_task = None
+        self.cmd_stats = dict(queued=0, dropped=0, coalesced=0, sent=0)
+        self.split_transfers = dict()
+        self.split_incoming = dict()
+        self.split_done = dict()
+        self.codec = OSCCodec() if use_codec else None
 
     @staticmethod
     def generate_uid():
@@ -77,6 +106,11 @@ class OSCManager(object):
                 if self.hostconnect:
                     self.connection_sender_timer_init(0)
                 self.handle(COMMAND_CONNECTION, self.on_command_connection)
+                self.handle(COMMAND_SPLIT, self.on_command_split)
+                self.start_cmd_task(loop)
+                if self.codec:
+                    self.handle(COMMAND_CODEC, self.on_command_codec)
+                    self.handle(COMMAND_CODEC_TABLE, self.on_command_codec_table)
             except Exception:
                 _LOGGER.error(f'OSC post init error {traceback.format_exc()}')
 
@@ -94,14 +128,16 @@ class OSCManager(object):
         if hpstr in self.connected_hosts:
             d = self.connected_hosts[hpstr]
             if d['timer']:
-                d['timer'].cancel()
-            d['timer'] = Timer(intv, partial(self.set_connection_timeout, hp=hp))
+                d['timer'].rearm(intv)
+            else:
+                d['timer'] = Timer(intv, partial(self.set_connection_timeout, hp=hp))
 
     def connection_sender_timer_init(self, intv=2.9):
-        if self.client_connection_sender_timer:
-            self.client_connection_sender_timer.cancel()
         # _LOGGER.debug(f'Rearm timer connect send {intv}')
-        self.client_connection_sender_timer = Timer(intv, self.send_client_command_connection)
+        if self.client_connection_sender_timer:
+            self.client_connection_sender_timer.rearm(intv, self.send_client_command_connection)
+        else:
+            self.client_connection_sender_timer = Timer(intv, self.send_client_command_connection)
 
     def on_connection_timeout(self, hp, timeout):
         if not timeout:
@@ -123,12 +159,19 @@ class OSCManager(object):
                 conn_from=conn_from,
                 timeout=timeout,
                 timer=None,
-                client=SimpleUDPClient(hp[0], hp[1])
+                client=SimpleUDPClient(hp[0], hp[1]),
+                codec=0,
+                codec_tables=set(),
+                codec_reset=0
             )
+            self.hosts_by_conn_from[conn_from] = self.connected_hosts[hpstr]
             rearm_timer = True
         elif not timeout and self.connected_hosts[hpstr]['timeout']:
             self.connected_hosts[hpstr]['timeout'] = False
+            self.hosts_by_conn_from.pop(self.connected_hosts[hpstr]['conn_from'], None)
             self.connected_hosts[hpstr]['conn_from'] = conn_from
+            self.hosts_by_conn_from[conn_from] = self.connected_hosts[hpstr]
+            self.connected_hosts[hpstr]['codec'] = 0
             # _LOGGER.debug('Setting timeout to false')
         else:
             new_connection = False
@@ -138,9 +181,61 @@ class OSCManager(object):
         if send_command:
             # _LOGGER.debug(f'Sending connect command as {"client" if self.hostconnect else "server"} to {hp[0]}:{hp[1]} (port={self.portlisten})')
             self.connected_hosts[hpstr]['client'].send_message(COMMAND_CONNECTION, (self.portlisten,))
+        if new_connection and self.codec:
+            self.send_codec_hello(self.connected_hosts[hpstr])
         if rearm_timer:
             self.connection_handler_timer_init(hp=hp)
 
+    def send_codec_hello(self, d, reply=0):
+        d['codec_tables'] = set()
+        d['codec_reset'] = time()
+        d['client'].send_message(COMMAND_CODEC, (OSCCodec.VERSION, self.portlisten, reply))
+
+    def on_command_codec(self, version, portlisten, reply, sender=None):
+        hpstr = f'{sender[0]}:{portlisten}'
+        if hpstr in self.connected_hosts:
+            d = self.connected_hosts[hpstr]
+            d['codec'] = min(version, OSCCodec.VERSION)
+            d['codec_tables'] = set()
+            self.codec.forget(sender)
+            _LOGGER.info(f'Codec v{d["codec"]} enabled for {hpstr} (reply={reply})')
+            if not reply:
+                self.send_codec_hello(d, reply=1)
+
+    def on_command_codec_table(self, tid, fullname, fields, sender=None):
+        self.codec.add_remote_table(sender, tid, fullname, fields)
+
+    def codec_reset_request(self, client_address):
+        d = self.hosts_by_conn_from.get(client_address)
+        if d and time() - d['codec_reset'] >= 1:
+            _LOGGER.info(f'Unknown codec table from {client_address}: requesting reset')
+            self.send_codec_hello(d)
+
+    def encode_args(self, args, objs, d):
+        if objs is None:
+            return args
+        args = list(args)
+        blobs = objs['blobs']
+        serialized = objs['serialized']
+        for i, s in enumerate(args):
+            if isinstance(s, SerializableDBObj):
+                blob = None
+                if d['codec'] and self.codec.can_encode(s):
+                    if i in blobs:
+                        table, blob = blobs[i]
+                    else:
+                        table, blob = blobs[i] = self.codec.encode(s)
+                    if blob is not None and table.tid not in d['codec_tables']:
+                        d['client'].send_message(COMMAND_CODEC_TABLE, table.args())
+                        d['codec_tables'].add(table.tid)
+                if blob is not None:
+                    args[i] = blob
+                elif i in serialized:
+                    args[i] = serialized[i]
+                else:
+                    args[i] = serialized[i] = s.serialize()
+        return tuple(args)
+
     async def set_connection_timeout(self, hp=None):
         hpstr = f'{hp[0]}:{hp[1]}'
         if hpstr in self.connected_hosts:
@@ -151,81 +246,68 @@ class OSCManager(object):
                 else:
                     notifytimeout = False
             else:
+                self.hosts_by_conn_from.pop(self.connected_hosts[hpstr]['conn_from'], None)
                 del self.connected_hosts[hpstr]
             if notifytimeout:
                 self.on_connection_timeout(hp, True)
                 _LOGGER.info(f'Connection to {hp[0]}:{hp[1]} lost')
 
-    def deserialize(self, args):
+    def deserialize(self, args, client_address=None):
         if len(args) == 1 and args[0] == '()':
             return tuple()
         args = list(args)
         for i, s in enumerate(args):
-            args[i] = SerializableDBObj.deserialize(args[i], args[i])
+            if isinstance(s, bytes) and self.codec:
+                args[i] = self.codec.decode(client_address, s)
+                if args[i] is None:
+                    self.codec_reset_request(client_address)
+                    return None
+            else:
+                args[i] = SerializableDBObj.deserialize(s, s)
         return tuple(args)
 
     def device_callback(self, client_address, address, *oscs):
-        if address != COMMAND_CONNECTION:
+        if address != COMMAND_CONNECTION and _LOGGER.isEnabledFor(logging.DEBUG):
             _LOGGER.debug(f'Received cmd={address} cla={client_address} par={str(oscs)}')
-        warn = True
         uid = ''
-        if address in self.callbacks:
-            item = None
-            if len(oscs) > 0 and isinstance(oscs[0], str) and oscs[0] in self.callbacks[address]:
-                _LOGGER.debug(f'Found device command (uid={oscs[0]})')
-                item = self.callbacks[address][oscs[0]]
-                uid = oscs[0]
-                pars = oscs[1:]
-                warn = False
-            if '' in self.callbacks[address]:
-                item = self.callbacks[address]['']
-                uid = ''
+        item = None
+        handlers = self.callbacks.get(address)
+        if handlers:
+            # a global handler (uid='') takes precedence over the device one
+            item = handlers.get('')
+            if item:
                 pars = oscs
-                warn = False
+            elif oscs and isinstance(oscs[0], str):
+                item = handlers.get(oscs[0])
+                if item:
+                    uid = oscs[0]
+                    pars = oscs[1:]
             if item:
-                if not isinstance(item['split'], bool) and address != COMMAND_SPLIT:
+                if item['split']:
                     if not pars or not isinstance(pars[0], str):
                         return
-                    mo = re.search(r'^#([0-9]+)/([0-9]+)#(.*)', pars[0])
-                    if mo:
-                        n1 = int(mo.group(1))
-                        n2 = int(mo.group(2))
-                        n3 = item['split']
-                        if n1 == n3 + 1 or n1 == n3 or n1 == 1:
-                            item['split'] = n1
-                            if n1 == 1:
-                                item['strsplit'] = mo.group(3)
-                            elif n1 == n3 + 1:
-                                item['strsplit'] += mo.group(3)
-                            self.send(COMMAND_SPLIT, n1, n2, uid=uid)
-                            if n1 != n2 and item['t']:
-                                item['t'].cancel()
-                                item['t'] = Timer(30,
-                                                  partial(self.unhandle_by_timer, address, uid))
-                        else:
-                            return
-                        if n1 != n2:
-                            return
-                        else:
-                            item['split'] = 0
-                            pars = tuple(json.loads(item['strsplit']))
-                    else:
-                        _LOGGER.warning('String is not splitted when split expected')
+                    pars = self.receive_split(client_address, address, uid, item, pars[0])
+                    if pars is None:
                         return
                 if item['t']:
-                    _LOGGER.debug(f'Cancelling unhandle timer add={address} uid={uid}')
+                    _LOGGER.debug('Cancelling unhandle timer add=%s uid=%s', address, uid)
                     item['t'].cancel()
                     self.unhandle_device(address, uid)
                 try:
                     fixedpars = item['a'] if address != COMMAND_CONNECTION else (client_address,) + item['a']
-                    item['f'](*fixedpars, *self.deserialize(pars), sender=client_address)
+                    dpars = self.deserialize(pars, client_address)
+                    if dpars is not None:
+                        item['f'](*fixedpars, *dpars, sender=client_address)
                 except Exception:
-                    _LOGGER.error(f'Handler({fixedpars}, {pars} [{self.deserialize(pars)}]) error {traceback.format_exc()}')
-        if warn:
-            _LOGGER.warning(f'Handler not found for {address} (uid={uid}) ({self.callbacks})')
+                    _LOGGER.error(f'Handler({fixedpars}, {pars}) error {traceback.format_exc()}')
+        if not item:
+            if self.ack_split_done(client_address, oscs):
+                return
+            _LOGGER.warning(f'Handler not found for {address} (uid={oscs[0] if oscs else uid}) '
+                            f'({list(handlers.keys()) if handlers else None})')
 
     def call_confirm_callback(self, *args, confirm_callback=None, confirm_params=(), timeout=False, uid='', sender=None):
-        _LOGGER.debug(f'Calling confirm_callback with cp={confirm_params} args={args}')
+        _LOGGER.debug('Calling confirm_callback with cp=%s args=%s', confirm_params, args)
         self.unhandle_device(COMMAND_CONFIRM, uid)
         confirm_callback(*confirm_params, *args, timeout=timeout)
 
@@ -254,96 +336,273 @@ class OSCManager(object):
         if self.client_connection_sender_timer:
             self.client_connection_sender_timer.cancel()
             self.client_connection_sender_timer = None
+        for _, x in self.split_transfers.items():
+            if x['timer']:
+                x['timer'].cancel()
+        self.split_transfers = dict()
         self.user_on_connection_timeout = None
+        if self.cmd_task:
+            self.drain_cmd_queue()
+            self.cmd_task.cancel()
+            self.cmd_task = None
 
-    def process_cmd_queue(self):
-        if len(self.cmd_queue):
-            hpstr = f'{self.hostconnect}:{self.portconnect}'
-            if not self.hostconnect or (hpstr in self.connected_hosts and not self.connected_hosts[hpstr]['timeout']):
-                el = self.cmd_queue.pop(0)
-                args = ('()',) if not el['args'] else el['args']
-                if 'handles' in el:
-                    for p in el['handles']:
-                        self.handle_device(p['address'],
-                                           p['uid'],
-                                           p['callback'],
-                                           *p['args'],
-                                           **p['kwargs'],
-                                           last_sent=time())
-                for _, d in self.connected_hosts.items():
-                    # if el['address'] != COMMAND_CONNECTION:
-                    #     _LOGGER.debug(f'Maybe Sending {el["dest"]} = {hpstr}')
-                    if not el['dest'] or d['conn_from'] == el['dest']:
-                        if el['address'] != COMMAND_CONNECTION:
-                            _LOGGER.debug(f'Sending[{d["hp"][0]}:{d["hp"][1]}] {el["address"]} -> {args}')
-                        d['client'].send_message(el['address'], args)
-                self.process_cmd_queue()
-
-    def call_split_callback(self, *args, timeout=False, uid='', item=None, last_sent=0, sender=None):
-        idx = 0 if not uid else 1
-        timeout = timeout or item['splits'] != args[idx + 1] or item['split'] != args[idx + 0]
-        return self.send_split(
-                       retry=item['retry'],
-                       uid=uid,
-                       last_sent=last_sent,
-                       strsplit=item['strsplit'],
-                       split=item['split'],
-                       splits=item['splits'],
-                       currentsplit='' if not timeout else item['currentsplit'],
-                       sendto=item['sendto'],
-                       dest=item['dest'])
-
-    def send_split(self,
-                   retry=-1,
-                   uid='',
-                   strsplit='',
-                   split=0,
-                   splits=0,
-                   last_sent=0,
-                   currentsplit='',
-                   sendto=COMMAND_CONFIRM,
-                   dest=None,
-                   handles=None):
-        if not currentsplit:
-            split = split + 1
-            if split > splits:
-                return False
-            retry = 0
-            currentsplit = f'#{split}/{splits}#{strsplit[0:OSCManager.PKT_SPLIT]}'
-            strsplit = strsplit[OSCManager.PKT_SPLIT:]
+    def start_cmd_task(self, loop):
+        if not self.cmd_task:
+            self.cmd_task = loop.create_task(self.cmd_queue_loop())
+            self.cmd_event.set()
+
+    def get_cmd_stats(self):
+        return dict(self.cmd_stats, depth=len(self.cmd_queue))
+
+    def enqueue_cmd(self, el, coalesce_key=None):
+        if coalesce_key:
+            old = self.cmd_coalesce.get(coalesce_key)
+            if old is not None:
+                # still waiting to be sent: just send the newest args instead
+                old['args'] = el['args']
+                old['objs'] = el['objs']
+                self.cmd_stats['coalesced'] += 1
+                return
+            el['ckey'] = coalesce_key
+            self.cmd_coalesce[coalesce_key] = el
+        if len(self.cmd_queue) >= self.cmd_queue_max:
+            # stale device data goes first: control commands (confirms,
+            # state changes) are dropped only when there is none left
+            dropped = self.pop_cmd_coalescible()
+            if dropped is None:
+                if self.is_cmd_coalescible(el):
+                    dropped = el
+                    self.forget_cmd(el)
+                else:
+                    dropped = self.pop_cmd()
+            self.cmd_stats['dropped'] += 1
+            # the sender of a dropped command still gets its confirm timeout
+            self.register_cmd_handles(dropped)
+            _LOGGER.debug('Command queue full: dropping %s', dropped['address'])
+            if dropped is el:
+                return
+        self.cmd_queue.append(el)
+        self.cmd_stats['queued'] += 1
+
+    def is_cmd_coalescible(self, el):
+        return el['address'] in self.CMD_COALESCE and not el['handles']
+
+    def forget_cmd(self, el):
+        ckey = el.get('ckey')
+        if ckey and self.cmd_coalesce.get(ckey) is el:
+            del self.cmd_coalesce[ckey]
+
+    def pop_cmd(self):
+        el = self.cmd_queue.popleft()
+        self.forget_cmd(el)
+        return el
+
+    def pop_cmd_coalescible(self):
+        for i, el in enumerate(self.cmd_queue):
+            if self.is_cmd_coalescible(el):
+                del self.cmd_queue[i]
+                self.forget_cmd(el)
+                return el
+        return None
+
+    def register_cmd_handles(self, el):
+        for p in el['handles']:
+            self.handle_device(p['address'],
+                               p['uid'],
+                               p['callback'],
+                               *p['args'],
+                               **p['kwargs'])
+
+    def can_send(self):
+        if not self.hostconnect:
+            return True
+        d = self.connected_hosts.get(f'{self.hostconnect}:{self.portconnect}')
+        return d is not None and not d['timeout']
+
+    def send_cmd(self, el):
+        args = ('()',) if not el['args'] else el['args']
+        self.register_cmd_handles(el)
+        if el['dest']:
+            d = self.hosts_by_conn_from.get(el['dest'])
+            hosts = (d,) if d else ()
         else:
-            retry = retry + 1
-            _LOGGER.info(f'Timeout detected passed = {time()-last_sent} Split {split} / {splits} Retry {retry}')
-            if retry >= 10:
-                return False
-        args = [uid, currentsplit] if uid else [currentsplit]
-        item = dict(timeout=0.5 * (retry + 1),
-                    retry=retry,
-                    do_split=True,
-                    split=split,
-                    dest=dest,
-                    strsplit=strsplit,
-                    currentsplit=currentsplit,
-                    splits=splits,
-                    sendto=sendto)
-        if handles is None:
-            handles = []
-        handles.append(dict(
-                    address=COMMAND_SPLIT,
-                    uid=uid,
-                    args=(),
-                    callback=partial(self.call_split_callback,
-                                     uid=uid,
-                                     item=item),
-                    kwargs=item))
-        self.cmd_queue.append(dict(
-            address=sendto,
+            hosts = self.connected_hosts.values()
+        for d in hosts:
+            if el['address'] != COMMAND_CONNECTION:
+                _LOGGER.debug('Sending[%s:%s] %s -> %s', d["hp"][0], d["hp"][1], el["address"], args)
+            d['client'].send_message(el['address'], self.encode_args(args, el['objs'], d))
+        self.cmd_stats['sent'] += 1
+
+    def drain_cmd_queue(self, limit=-1):
+        n = 0
+        while self.cmd_queue and n != limit and self.can_send():
+            el = self.pop_cmd()
+            try:
+                self.send_cmd(el)
+            except Exception:
+                _LOGGER.error(f'Send error ({el["address"]}): {traceback.format_exc()}')
+            n += 1
+        return n
+
+    async def cmd_queue_loop(self):
+        while True:
+            await self.cmd_event.wait()
+            self.cmd_event.clear()
+            while self.drain_cmd_queue(OSCManager.CMD_QUEUE_BATCH) == OSCManager.CMD_QUEUE_BATCH:
+                await asyncio.sleep(0)
+
+    def process_cmd_queue(self):
+        self.cmd_event.set()
+
+    def prune_split_state(self):
+        now = time()
+        for k, v in list(self.split_incoming.items()):
+            if now - v['t'] > OSCManager.SPLIT_STATE_TIMEOUT:
+                _LOGGER.warning(f'Dropping incomplete transfer {k[1]} ({v["missing"]}/{len(v["parts"])} missing)')
+                del self.split_incoming[k]
+        for k, t in list(self.split_done.items()):
+            if now - t > OSCManager.SPLIT_STATE_TIMEOUT:
+                del self.split_done[k]
+
+    def ack_split_done(self, client_address, oscs):
+        # a retransmitted chunk of a completed transfer, whose handler may be
+        # gone already: the sender still needs the ack (it was lost)
+        chunk = oscs[-1] if oscs else None
+        if isinstance(chunk, str) and chunk[0:1] == '#':
+            mo = _SPLIT_RE.search(chunk)
+            if mo and (client_address, mo.group(1)) in self.split_done:
+                self.send(COMMAND_SPLIT, mo.group(1), int(mo.group(2)), int(mo.group(3)), dest=client_address)
+                return True
+        return False
+
+    def receive_split(self, client_address, address, uid, item, chunk):
+        mo = _SPLIT_RE.search(chunk)
+        if not mo:
+            _LOGGER.warning('String is not splitted when split expected')
+            return None
+        tid = mo.group(1)
+        n1 = int(mo.group(2))
+        n2 = int(mo.group(3))
+        if n2 < 1 or n2 > OSCManager.SPLIT_MAX_CHUNKS:
+            _LOGGER.warning(f'Invalid chunk count {n2} for transfer {tid}')
+            return None
+        key = (client_address, tid)
+        self.send(COMMAND_SPLIT, tid, n1, n2, dest=client_address)
+        if key in self.split_done:
+            return None
+        tr = self.split_incoming.get(key)
+        if tr is None:
+            self.prune_split_state()
+            tr = self.split_incoming[key] = dict(parts=[None] * n2, missing=n2, z=bool(mo.group(4)), t=time())
+        parts = tr['parts']
+        if n1 < 1 or n1 > len(parts) or parts[n1 - 1] is not None:
+            return None
+        parts[n1 - 1] = mo.group(5)
+        tr['missing'] -= 1
+        tr['t'] = time()
+        if tr['missing']:
+            if item['t']:
+                item['t'].cancel()
+                item['t'] = Timer(30, partial(self.unhandle_by_timer, address, uid))
+            return None
+        del self.split_incoming[key]
+        self.split_done[key] = time()
+        strsplit = ''.join(parts)
+        if tr['z']:
+            strsplit = zlib.decompress(base64.b64decode(strsplit)).decode('utf-8')
+        return tuple(json.loads(strsplit))
+
+    def send_split(self, address, strsplit, uid='', dest=None, handles=None):
+        z = ''
+        if len(strsplit) >= OSCManager.SPLIT_COMPRESS_MIN:
+            compressed = base64.b64encode(zlib.compress(strsplit.encode('utf-8'))).decode('ascii')
+            if len(compressed) < len(strsplit):
+                strsplit = compressed
+                z = ':z'
+        n1 = len(strsplit)
+        n2 = max(1, n1 // OSCManager.PKT_SPLIT + (1 if n1 % OSCManager.PKT_SPLIT else 0))
+        tid = self.generate_uid()[0:8]
+        chunks = []
+        for i in range(n2):
+            chunks.append(f'#{tid}:{i + 1}/{n2}{z}#{strsplit[i * OSCManager.PKT_SPLIT:(i + 1) * OSCManager.PKT_SPLIT]}')
+        self.split_transfers[tid] = dict(
+            address=address,
+            uid=uid,
             dest=dest,
-            args=tuple(args),
-            handles=handles
+            chunks=chunks,
+            sent=[0] * n2,
+            acked=[False] * n2,
+            nacked=0,
+            next=0,
+            retry=0,
+            handles=handles,
+            timer=None)
+        _LOGGER.debug('Split transfer %s: %d chars in %d chunks', tid, n1, n2)
+        self.split_send_window(tid)
+        return True
+
+    def split_send_chunk(self, tr, idx):
+        args = (tr['uid'], tr['chunks'][idx]) if tr['uid'] else (tr['chunks'][idx],)
+        handles = tr['handles']
+        tr['handles'] = None
+        tr['sent'][idx] = time()
+        self.enqueue_cmd(dict(
+            address=tr['address'],
+            dest=tr['dest'],
+            args=args,
+            objs=None,
+            handles=handles or []
         ))
+
+    def split_send_window(self, tid):
+        tr = self.split_transfers[tid]
+        inflight = tr['next'] - tr['nacked']
+        while tr['next'] < len(tr['chunks']) and inflight < OSCManager.SPLIT_WINDOW:
+            if not tr['acked'][tr['next']]:
+                self.split_send_chunk(tr, tr['next'])
+                inflight += 1
+            tr['next'] += 1
+        if not tr['timer']:
+            tr['timer'] = Timer(OSCManager.SPLIT_RTO, partial(self.split_retransmit, tid))
+        self.process_cmd_queue()
+
+    def on_command_split(self, tid, n1, n2, *args, sender=None):
+        tr = self.split_transfers.get(tid)
+        if not tr or n2 != len(tr['chunks']) or n1 < 1 or n1 > n2:
+            return
+        if not tr['acked'][n1 - 1]:
+            tr['acked'][n1 - 1] = True
+            tr['nacked'] += 1
+            tr['retry'] = 0
+            if tr['nacked'] == n2:
+                if tr['timer']:
+                    tr['timer'].cancel()
+                del self.split_transfers[tid]
+                _LOGGER.debug('Split transfer %s completed', tid)
+            else:
+                self.split_send_window(tid)
+
+    async def split_retransmit(self, tid):
+        tr = self.split_transfers.get(tid)
+        if not tr:
+            return
+        tr['timer'] = None
+        tr['retry'] += 1
+        if tr['retry'] > OSCManager.SPLIT_MAX_RETRY:
+            _LOGGER.warning(f'Split transfer {tid} aborted ({tr["nacked"]}/{len(tr["chunks"])} acked)')
+            del self.split_transfers[tid]
+            return
+        now = time()
+        rto = OSCManager.SPLIT_RTO * tr['retry']
+        resent = 0
+        for i in range(tr['next']):
+            if not tr['acked'][i] and now - tr['sent'][i] >= rto:
+                self.split_send_chunk(tr, i)
+                resent += 1
+        if resent:
+            _LOGGER.info(f'Split transfer {tid}: resending {resent} chunks (retry {tr["retry"]})')
+        tr['timer'] = Timer(OSCManager.SPLIT_RTO, partial(self.split_retransmit, tid))
         self.process_cmd_queue()
-        return True
 
     def send(self, address, *args, confirm_callback=None, confirm_params=(), do_split=False, timeout=-1, uid='', dest=None):
         if confirm_callback:
@@ -361,27 +620,32 @@ class OSCManager(object):
         else:
             handles = []
         args = list(args)
+        # objects are encoded when the command is sent, as the binary codec
+        # depends on the destination: objs caches, by argument index, the
+        # codec (table, blob) pairs and the legacy serializations
+        objs = None
         for i, s in enumerate(args):
             if isinstance(s, SerializableDBObj):
-                args[i] = s.serialize()
+                if do_split:
+                    args[i] = s.serialize()
+                else:
+                    objs = dict(blobs=dict(), serialized=dict())
         if do_split:
-            strsplit = json.dumps(args[(1 if uid else 0):])
-            n1 = len(strsplit)
-            n2 = n1 // OSCManager.PKT_SPLIT + (1 if n1 % OSCManager.PKT_SPLIT else 0)
             self.send_split(
+                address,
+                json.dumps(args[(1 if uid else 0):]),
                 uid=uid,
                 dest=dest,
-                strsplit=strsplit,
-                splits=n2,
-                sendto=address,
                 handles=handles)
         else:
-            self.cmd_queue.append(dict(
+            coalesce = uid and not handles and address in self.CMD_COALESCE
+            self.enqueue_cmd(dict(
                 dest=dest,
                 address=address,
                 args=tuple(args),
+                objs=objs,
                 handles=handles
-            ))
+            ), coalesce_key=(address, uid, dest) if coalesce else None)
             self.process_cmd_queue()
 
     async def unhandle_by_timer(self, address, uid):
@@ -390,41 +654,31 @@ class OSCManager(object):
             item = self.callbacks[address][uid]
             del self.callbacks[address][uid]
             try:
-                if 'last_sent' in item:
-                    kwargs = dict(last_sent=item['last_sent'])
-                else:
-                    kwargs = dict()
-                item['f'](*item['a'], timeout=True, **kwargs)
+                item['f'](*item['a'], timeout=True)
             except Exception:
                 _LOGGER.error(f'Handler error {traceback.format_exc()}')
             _LOGGER.debug(f'Handler exited add={address}, uid={uid}')
 
     # def some_callback(address: str, *osc_arguments: List[Any]) -> None:
     # def some_callback(address: str, fixed_argument: List[Any], *osc_arguments: List[Any]) -> None:
-    def handle_device(self, address, uid, callback, *args, timeout=-1, do_split=False, **kwargs):
+    def handle_device(self, address, uid, callback, *args, timeout=-1, do_split=False):
         self.unhandle_device(address, uid)
         d = self.callbacks[address] if address in self.callbacks else dict()
         if timeout > 0:
             t = Timer(timeout, partial(self.unhandle_by_timer, address, uid))
         else:
             t = None
-        if do_split:
-            if address == COMMAND_SPLIT:
-                kwargs = dict(**kwargs)
-            else:
-                kwargs = dict(split=0, strsplit='')
-        else:
-            kwargs = dict(split=False)
+        kwargs = dict(split=do_split)
         d[uid] = dict(f=callback, a=args, t=t, **kwargs)
         self.callbacks[address] = d
-        _LOGGER.debug(f'Handle Added add={address}, uid={uid} timeout={timeout} result={self.callbacks}')
+        _LOGGER.debug('Handle Added add=%s, uid=%s timeout=%s result=%s', address, uid, timeout, self.callbacks)
 
     def unhandle_device(self, address, uid):
         if address in self.callbacks and uid in self.callbacks[address]:
             if self.callbacks[address][uid]['t']:
                 self.callbacks[address][uid]['t'].cancel()
             del self.callbacks[address][uid]
-            _LOGGER.debug(f'Handle removed add={address}, uid={uid} result={self.callbacks}')
+            _LOGGER.debug('Handle removed add=%s, uid=%s result=%s', address, uid, self.callbacks)
 
     def handle(self, address, callback, *args, timeout=-1, do_split=False):
         self.handle_device(address, '', callback, *args, timeout=timeout, do_split=do_split)
@@ -0,0 +1,101 @@
+import asyncio
+import traceback
+from collections import deque
+
+from util import init_logger
+
+_LOGGER = init_logger(__name__)
+
+
+class SamplePipeline(object):
+    """Bounded FIFO of device samples processed in order by one consumer task.
+
+    When the queue is full the new sample either pushes out the oldest one
+    (POLICY_DROP_OLDEST) or is merged into the latest queued one with the
+    merge callable (POLICY_MERGE). Depth and lag (time spent in the queue)
+    are tracked in stats.
+    """
+
+    POLICY_DROP_OLDEST = 'drop_oldest'
+    POLICY_MERGE = 'merge'
+    MAXLEN = 32
+
+    def __init__(self, consumer, maxlen=MAXLEN, policy=POLICY_DROP_OLDEST, merge=None, name='', loop=None):
+        self.consumer = consumer
+        self.maxlen = maxlen
+        self.policy = policy if merge or policy != SamplePipeline.POLICY_MERGE else SamplePipeline.POLICY_DROP_OLDEST
+        self.merge = merge
+        self.name = name
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.queue = deque()
+        self.event = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.task = None
+        self.overflowing = False
+        self.stats = dict(queued=0, processed=0, dropped=0, merged=0, errors=0,
+                          max_depth=0, lag=0.0, max_lag=0.0)
+
+    def get_stats(self):
+        return dict(self.stats, depth=len(self.queue))
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, obj):
+        queue = self.queue
+        stats = self.stats
+        stats['queued'] += 1
+        if len(queue) >= self.maxlen:
+            if not self.overflowing:
+                self.overflowing = True
+                _LOGGER.warning(f'Pipeline {self.name} is falling behind ({self.policy}): {self.get_stats()}')
+            if self.policy == SamplePipeline.POLICY_MERGE:
+                # keep the arrival time of the older sample: lag is measured from there
+                arrival, last = queue[-1]
+                queue[-1] = (arrival, self.merge(last, obj))
+                stats['merged'] += 1
+                return
+            queue.popleft()
+            stats['dropped'] += 1
+        queue.append((self.loop.time(), obj))
+        if len(queue) > stats['max_depth']:
+            stats['max_depth'] = len(queue)
+        self.idle.clear()
+        self.event.set()
+        if not self.task:
+            self.task = self.loop.create_task(self.run())
+
+    async def run(self):
+        queue = self.queue
+        stats = self.stats
+        while True:
+            while queue:
+                arrival, obj = queue.popleft()
+                lag = self.loop.time() - arrival
+                stats['lag'] = lag
+                if lag > stats['max_lag']:
+                    stats['max_lag'] = lag
+                try:
+                    await self.consumer(obj)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    stats['errors'] += 1
+                    _LOGGER.error(f'Pipeline {self.name} error: {traceback.format_exc()}')
+                stats['processed'] += 1
+            self.overflowing = False
+            self.event.clear()
+            self.idle.set()
+            await self.event.wait()
+
+    async def drain(self):
+        if self.task:
+            await self.idle.wait()
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.queue.clear()
+        self.idle.set()
@@ -1,39 +1,175 @@
 import asyncio
 from functools import partial
+from heapq import heapify, heappop, heappush
+from itertools import count
+
+
+class TimerScheduler:
+    """Deadline heap shared by all the Timer objects of a loop.
+
+    A single loop.call_at handle is armed for the earliest deadline. Heap
+    entries are checked lazily: moving a deadline forward (rearm) only
+    updates the timer and the entry is pushed again when it expires,
+    cancelled timers are dropped when their entry is popped (or when they
+    are the majority of the heap).
+
+    Schedulers are kept by loop: the ones of the closed loops (which they
+    reference, with their timers) are removed when a new one is created.
+    """
+
+    RESOLUTION = 0.001
+    COMPACT_MIN = 256
+    _SCHEDULERS = dict()
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.heap = []
+        self.counter = count()
+        self.handle = None
+        self.handle_when = 0
+        self.dead = 0
+        self.stats = dict(scheduled=0, fired=0, tasks=0)
+
+    @staticmethod
+    def get(loop):
+        scheds = TimerScheduler._SCHEDULERS
+        sched = scheds.get(loop)
+        if sched is None:
+            for lp in [lp for lp in scheds.keys() if lp.is_closed()]:
+                del scheds[lp]
+            sched = scheds[loop] = TimerScheduler(loop)
+        return sched
+
+    def get_stats(self):
+        return dict(self.stats, queued=len(self.heap))
+
+    def schedule(self, timer, when):
+        entry = timer._entry
+        if entry is not None and timer._deadline is None:
+            self.dead -= 1
+        timer._deadline = when
+        if entry is None or when < entry[0]:
+            self.stats['scheduled'] += 1
+            entry = timer._entry = (when, next(self.counter), timer)
+            heappush(self.heap, entry)
+            if self.handle is None or when < self.handle_when:
+                if self.handle:
+                    self.handle.cancel()
+                self.handle_when = when
+                self.handle = self.loop.call_at(when, self.run)
+
+    def unschedule(self, timer):
+        if timer._deadline is not None:
+            timer._deadline = None
+            if timer._entry is not None:
+                self.dead += 1
+                if self.dead >= self.COMPACT_MIN and self.dead * 2 > len(self.heap):
+                    self.compact()
+
+    def compact(self):
+        heap = []
+        for entry in self.heap:
+            timer = entry[2]
+            if timer._entry is entry:
+                if timer._deadline is None:
+                    timer._entry = None
+                else:
+                    heap.append(entry)
+        heapify(heap)
+        self.heap = heap
+        self.dead = 0
+
+    def run(self):
+        self.handle = None
+        heap = self.heap
+        now = self.loop.time() + self.RESOLUTION
+        while heap and heap[0][0] <= now:
+            entry = heappop(heap)
+            timer = entry[2]
+            if timer._entry is not entry:
+                continue
+            timer._entry = None
+            when = timer._deadline
+            if when is None:
+                self.dead -= 1
+                continue
+            elif when > now:
+                timer._entry = (when, next(self.counter), timer)
+                heappush(heap, timer._entry)
+            else:
+                timer._deadline = None
+                self.stats['fired'] += 1
+                timer._fire()
+        if heap and (self.handle is None or heap[0][0] < self.handle_when):
+            # callbacks may have armed the handle for a later deadline
+            if self.handle:
+                self.handle.cancel()
+            self.handle_when = heap[0][0]
+            self.handle = self.loop.call_at(self.handle_when, self.run)
 
 
 class Timer:
     def __init__(self, timeout, callback, loop=None):
         self._timeout = timeout
         self._callback = callback
-        self.loop = loop
-        self._task = asyncio.ensure_future(self._job(), loop=loop)
-        fname = callback.__name__ if not isinstance(callback, partial) else callback.func.__name__
-        self._task.name = f'_timer_{fname}'
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self._task = None
+        self._deadline = None
+        self._entry = None
+        self._scheduler = TimerScheduler.get(self.loop)
+        self.rearm()
 
     @staticmethod
     def task_is_timer(task):
         return hasattr(task, 'name') and task.name.startswith('_timer_')
 
-    async def _job_cancel(self):
-        self._task.cancel()
-        try:
-            await self._task
-        except asyncio.CancelledError:
-            pass
+    def rearm(self, timeout=None, callback=None):
+        """Restart the timer (optionally with a new timeout and callback).
+
+        Does not allocate when the new deadline is not before the queued one.
+        """
+        if timeout is not None:
+            self._timeout = timeout
+        if callback is not None:
+            self._callback = callback
+        self._scheduler.schedule(self, self.loop.time() + (self._timeout or 0))
+
+    def is_armed(self):
+        return self._deadline is not None
+
+    def _fire(self):
+        callback = self._callback
+        if asyncio.iscoroutinefunction(callback):
+            # the coroutine is created by the task, like the callback was awaited by it
+            self._start_task(callback, None)
+        else:
+            try:
+                rv = callback()
+            except Exception:
+                return
+            if asyncio.isfuture(rv) or asyncio.iscoroutine(rv):
+                self._start_task(callback, rv)
+
+    def _start_task(self, callback, awaitable):
+        self._scheduler.stats['tasks'] += 1
+        self._task = asyncio.ensure_future(self._job(callback, awaitable), loop=self.loop)
+        fname = callback.__name__ if not isinstance(callback, partial) else callback.func.__name__
+        self._task.name = f'_timer_{fname}'
 
-    async def _job(self):
+    async def _job(self, callback, awaitable):
         try:
-            if self._timeout:
-                await asyncio.sleep(self._timeout)
-            await self._callback()
-            # self._task.set_result(0)
+            await (callback() if awaitable is None else awaitable)
         except asyncio.CancelledError:
             raise
         except Exception:
-            # self._task.set_result(ex)
             pass
 
     def cancel(self):
-        if not self._task.done():
-            asyncio.ensure_future(self._job_cancel(), loop=self.loop)
+        self._scheduler.unschedule(self)
+        task = self._task
+        if task and not task.done():
+            if task is asyncio.current_task(self.loop):
+                # the callback is cancelling its own timer: let it go on until its next await
+                self.loop.call_soon(task.cancel)
+            else:
+                task.cancel()
@@ -0,0 +1,97 @@
+class VersionedNamespace(object):
+    """Namespace merged by the Velocity templates.
+
+    Every top level name has a change counter (versions) and the namespace
+    has a global one (version). Device sub-namespaces ($<alias> and
+    $devs.<alias>), devs and aliases are never modified in place: an update
+    replaces them, so the dict returned by snapshot() does not change under
+    a render that holds it. The top level dict is copied only on the first
+    write after a snapshot (copy on write). The default values (modules,
+    classes, strings) are shared and never copied.
+
+    The template namespaces (vm_var) are owned by the templates, which
+    write to them while merging: they are the same objects in every
+    snapshot. The renders done by a RenderBackend work on a copy, which is
+    written back with update().
+    """
+
+    def __init__(self, defaults):
+        self.defaults = defaults
+        self.vars = None
+        self.versions = dict()
+        self.version = 0
+        self.shared = False
+        self.reset()
+
+    def reset(self, vm_vars=()):
+        dest = dict(self.defaults)
+        dest['devs'] = dict()
+        dest['aliases'] = []
+        dest['macros'] = dict()
+        for vm_var in vm_vars:
+            dest[vm_var] = dict(macro=0)
+        self.vars = dest
+        self.shared = False
+        self.versions.clear()
+        self.version += 1
+
+    def __getitem__(self, key):
+        return self.vars[key]
+
+    def __contains__(self, key):
+        return key in self.vars
+
+    def get(self, key, default=None):
+        return self.vars.get(key, default)
+
+    def __repr__(self):
+        return repr(self.vars)
+
+    def snapshot(self):
+        self.shared = True
+        return self.vars
+
+    def _own(self):
+        if self.shared:
+            self.vars = dict(self.vars)
+            self.shared = False
+        return self.vars
+
+    def touch(self, *keys):
+        versions = self.versions
+        for k in keys:
+            versions[k] = versions.get(k, 0) + 1
+        self.version += 1
+
+    def get_versions_key(self, reads):
+        if reads is None:
+            return self.version
+        versions = self.versions
+        return tuple([versions.get(k, 0) for k in reads])
+
+    def update(self, **kwargs):
+        v = self._own()
+        for key, value in kwargs.items():
+            v[key] = value
+        self.touch(*kwargs.keys())
+
+    def set_var(self, vm_var, **kwargs):
+        if vm_var not in self.vars:
+            self._own()[vm_var] = dict(**kwargs)
+        return self.vars[vm_var]
+
+    def update_device(self, alias, **kwargs):
+        v = self._own()
+        old = v.get(alias)
+        if old is None:
+            v['aliases'] = v['aliases'] + [alias]
+            dev = dict(**kwargs)
+            self.touch('aliases')
+        else:
+            dev = dict(old)
+            dev.update(kwargs)
+        v[alias] = dev
+        devs = v['devs'] = dict(v['devs'])
+        devs[alias] = dev
+        self.touch(alias, 'devs')
+        return dev
@@ -1,13 +1,18 @@
 import asyncio
+import pickle
 import re
+import struct
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from functools import partial
 from os.path import basename, dirname
 
 from airspeed import CachingFileLoader
-from util import init_logger, deep_clone
+from util import init_logger
 import util.const
 from util.timer import Timer
+from util.velocity_namespace import VersionedNamespace
 
 _LOGGER = init_logger(__name__)
 
@@ -27,14 +32,397 @@ class VelocityUtils(object):
         return '%d:%02d:%02d' % (hrs, mins, secs)
 
 
+class RecordCollector(object):
+    """$out in templates: collects the output records of a render.
+
+    $out.emit(...) adds a record (the arguments joined as strings) and
+    $out.set_framing('len'|'line') selects how records are framed on the
+    network: 4 bytes big endian length prefix or newline terminated.
+    Without framing records are written as they are.
+    """
+
+    FRAMING_LEN = 'len'
+    FRAMING_LINE = 'line'
+    _LEN = struct.Struct('>I')
+
+    def __init__(self):
+        self.records = []
+        self.framing = None
+
+    def emit(self, *args):
+        self.records.append(''.join([str(a) for a in args]))
+        return ''
+
+    def set_framing(self, framing):
+        self.framing = framing
+        return ''
+
+    @staticmethod
+    def frame(records, framing=None):
+        if framing == RecordCollector.FRAMING_LEN:
+            out = []
+            for r in records:
+                b = r.encode()
+                out.append(RecordCollector._LEN.pack(len(b)))
+                out.append(b)
+            return out
+        elif framing == RecordCollector.FRAMING_LINE:
+            return [r.encode() + b'\n' for r in records]
+        else:
+            return [r.encode() for r in records]
+
+
+class TemplateGroup(object):
+    """Clients using the same template file.
+
+    The template is rendered once for all of them, and only when one of the
+    namespace names it references has changed (or a client was added).
+    Renders closer than TcpClient.RENDER_MIN_INTERVAL are deferred.
+    """
+
+    _VAR_RE = re.compile(r'\$!?\{?([A-Za-z_][A-Za-z0-9_\-]*)')
+    _NESTED_RE = re.compile(r'#\{?(parse|include|evaluate|define)\b')
+
+    def __init__(self, template_file, template, vm_var, loop):
+        self.template_file = template_file
+        self.template = template
+        self.vm_var = vm_var
+        self.loop = loop
+        self.clients = []
+        self.reads = self.get_template_reads(template_file)
+        self.versions = None
+        self.last_render = 0
+        self.handle = None
+        self.stats = dict(renders=0, skipped=0, deferred=0)
+        self.markers = None
+        self.markers_re = None
+        self.inflight = None
+        self.pending = None
+
+    @staticmethod
+    def get_template_reads(template_file):
+        # names the template references: None when it can read anything
+        try:
+            with open(template_file, 'r') as f:
+                src = f.read()
+        except Exception:
+            return None
+        if TemplateGroup._NESTED_RE.search(src):
+            return None
+        return tuple(set(TemplateGroup._VAR_RE.findall(src)))
+
+    def add(self, client):
+        if client not in self.clients:
+            self.clients.append(client)
+            self.versions = None
+
+    def remove(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+
+    def get_versions_key(self):
+        return TcpClient._NAMESPACE.get_versions_key(self.reads)
+
+    def format(self, dct):
+        key = self.get_versions_key()
+        if key == self.versions:
+            self.stats['skipped'] += 1
+        elif not self.handle:
+            wait = self.last_render + TcpClient.RENDER_MIN_INTERVAL - self.loop.time()
+            if wait > 0:
+                self.stats['deferred'] += 1
+                self.handle = self.loop.call_later(wait, self.render_deferred)
+            else:
+                self.render(dct, key)
+
+    def render_deferred(self):
+        self.handle = None
+        key = self.get_versions_key()
+        if key != self.versions:
+            self.render(TcpClient._NAMESPACE.snapshot(), key)
+
+    def render(self, dct, key):
+        self.versions = key
+        self.last_render = self.loop.time()
+        if [c for c in self.clients if not c.stopped]:
+            self.stats['renders'] += 1
+            if TcpClient._BACKEND:
+                self.render_offload(TcpClient._BACKEND.snapshot(dct, self.reads, self.vm_var))
+            else:
+                self.write(*self.merge(dct))
+
+    def render_offload(self, snapshot):
+        # one render in the worker and at most one pending snapshot: a newer
+        # snapshot replaces the pending one or the queued render
+        backend = TcpClient._BACKEND
+        if self.inflight:
+            if self.inflight.cancel():
+                backend.stats['cancelled'] += 1
+            else:
+                if self.pending:
+                    backend.stats['superseded'] += 1
+                self.pending = snapshot
+                return
+        self.inflight = backend.submit(self, snapshot)
+        if not self.inflight:
+            # the backend cannot render now: do it on the loop
+            self.write(*self.merge(TcpClient._NAMESPACE.snapshot()))
+
+    def render_done(self, future):
+        if future is not self.inflight:
+            return
+        self.inflight = None
+        rv = TcpClient._BACKEND.result(future)
+        if rv:
+            records, framing, myvars = rv
+            self.update_vars(myvars)
+            self.write(records, framing)
+        else:
+            # render lost: the next format renders again
+            self.versions = None
+        if self.pending and TcpClient._BACKEND:
+            snapshot = self.pending
+            self.pending = None
+            self.render_offload(snapshot)
+
+    def update_vars(self, myvars):
+        # the worker rendered a copy of the template namespace: the changes
+        # go back through the namespace, so that its version is bumped and
+        # the snapshots already handed out are not modified
+        ns = TcpClient._NAMESPACE
+        old = ns.get(self.vm_var)
+        if old != myvars:
+            uptodate = self.get_versions_key() == self.versions
+            ns.update(**{self.vm_var: dict(old, **myvars) if old else dict(myvars)})
+            if uptodate:
+                # the template wrote those values itself: no need to render again
+                self.versions = self.get_versions_key()
+
+    def write(self, records, framing):
+        if records:
+            text = None
+            framed = None
+            for c in self.clients:
+                if c.stopped:
+                    continue
+                elif c.network:
+                    if framed is None:
+                        framed = RecordCollector.frame(records, framing)
+                    c.write_records(framed)
+                else:
+                    if text is None:
+                        text = ''.join(records)
+                    c.write_out(text)
+
+    def get_markers_re(self, stastr, stostr):
+        if self.markers != (stastr, stostr):
+            self.markers = (stastr, stostr)
+            self.markers_re = re.compile(f'(?:{stastr})[\\n\\r]*(.*?)(?:{stostr})[\\n\\r]*', re.DOTALL)
+        return self.markers_re
+
+    def merge(self, dct):
+        """Render the template: returns the list of records and their framing.
+
+        Records are the $out.emit calls or, when there are none, the
+        segments between the stastr and stostr markers (if the template set
+        them) or the whole output.
+        """
+        records = []
+        collector = RecordCollector()
+        if self.template:
+            try:
+                _LOGGER.debug(f'Merging {self.vm_var} with {dct}')
+                dct['out'] = collector
+                out = self.template.merge(dct, loader=TcpClient._LOADER)
+                myvars = dct[self.vm_var]
+                if collector.records:
+                    records = collector.records
+                elif 'stastr' in myvars and 'stostr' in myvars:
+                    records = self.get_markers_re(myvars['stastr'], myvars['stostr']).findall(out)
+                elif out:
+                    records = [out]
+            except Exception:
+                _LOGGER.error(f'VTL error {traceback.format_exc()}')
+            finally:
+                dct.pop('out', None)
+        return records, collector.framing
+
+
+_WORKER_GROUPS = dict()
+
+
+def render_snapshot(template_file, vm_var, snapshot):
+    """Render a namespace snapshot in a RenderBackend worker.
+
+    Returns the records, their framing and the template namespace (vm_var)
+    as the template left it.
+    """
+    group = _WORKER_GROUPS.get(template_file)
+    if group is None:
+        if TcpClient._LOADER is None:
+            TcpClient._LOADER = CachingFileLoader(dirname(template_file))
+        template = TcpClient._LOADER.load_template(template_file)
+        group = _WORKER_GROUPS[template_file] = TemplateGroup(template_file, template, vm_var, None)
+    for k in RenderBackend.STATIC_VARS:
+        snapshot[k] = TcpClient._DEFAULT_VARS[k]
+    records, framing = group.merge(snapshot)
+    return records, framing, snapshot.get(vm_var, dict())
+
+
+class RenderBackend(object):
+    """Renders templates in a thread or process pool instead of the event loop.
+
+    Every render gets a snapshot of the namespace names the template reads:
+    dicts and lists are copied (one level) so the loop can keep updating
+    the namespace. For the process pool the values that cannot be pickled
+    and unpickled back (e.g. the device managers) are left out of the
+    snapshot. Modules and classes of the default namespace are set again in
+    the worker.
+
+    A broken process pool (a worker died) is replaced, at most MAX_RESTARTS
+    times: after that submit returns None and the templates are rendered
+    on the loop.
+    """
+
+    BACKEND_THREAD = 'thread'
+    BACKEND_PROCESS = 'process'
+    BACKENDS = (BACKEND_THREAD, BACKEND_PROCESS)
+    STATIC_VARS = ('const', 'util', 'logger')
+    MAX_RESTARTS = 3
+
+    def __init__(self, kind, workers=1, loop=None):
+        self.kind = kind
+        self.workers = workers
+        self.loop = loop if loop else asyncio.get_event_loop()
+        self.executor = self.new_executor()
+        self.picklable = dict()
+        self.stats = dict(submitted=0, done=0, cancelled=0, superseded=0, errors=0, restarts=0,
+                          latency=0.0, max_latency=0.0)
+
+    def new_executor(self):
+        if self.kind == RenderBackend.BACKEND_PROCESS:
+            return ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='velocity')
+
+    def restart(self):
+        self.executor.shutdown(wait=False)
+        if self.stats['restarts'] < RenderBackend.MAX_RESTARTS:
+            self.stats['restarts'] += 1
+            _LOGGER.warning(f'Render pool broken: restarting it ({self.stats["restarts"]}/{RenderBackend.MAX_RESTARTS})')
+            self.executor = self.new_executor()
+        else:
+            _LOGGER.error('Render pool broken too many times: rendering on the loop')
+            self.executor = None
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    def is_picklable(self, value):
+        tp = type(value)
+        if tp is dict:
+            return all([self.is_picklable(v) for v in value.values()])
+        elif tp is list or tp is tuple:
+            return all([self.is_picklable(v) for v in value])
+        rv = self.picklable.get(tp)
+        if rv is None:
+            try:
+                # objects that pickle but do not unpickle would kill the worker
+                pickle.loads(pickle.dumps(value))
+                rv = True
+            except Exception:
+                _LOGGER.info(f'{tp.__name__} objects are not sent to the render processes')
+                rv = False
+            self.picklable[tp] = rv
+        return rv
+
+    def copy_value(self, value):
+        tp = type(value)
+        if self.kind == RenderBackend.BACKEND_THREAD:
+            if tp is dict:
+                return dict(value)
+            elif tp is list:
+                return list(value)
+            return value
+        elif tp is dict:
+            return {k: v for k, v in value.items() if self.is_picklable(v)}
+        elif tp is list:
+            return list(value) if self.is_picklable(value) else []
+        return value if self.is_picklable(value) else None
+
+    def snapshot(self, dct, reads, vm_var):
+        aliases = dct.get('aliases', [])
+        if reads is None:
+            names = set(dct.keys())
+        else:
+            names = set(reads)
+            names.add(vm_var)
+            if 'devs' in names:
+                names.update(aliases)
+        snapshot = dict()
+        for k in names:
+            if k in dct and k not in RenderBackend.STATIC_VARS and k != 'devs':
+                snapshot[k] = self.copy_value(dct[k])
+        if 'devs' in names:
+            # same objects as $<alias>
+            snapshot['devs'] = {a: snapshot[a] for a in aliases if a in snapshot}
+        return snapshot
+
+    def submit(self, group, snapshot):
+        if not self.executor:
+            return None
+        try:
+            future = self.executor.submit(render_snapshot, group.template_file, group.vm_var, snapshot)
+        except BrokenProcessPool:
+            self.restart()
+            return None
+        self.stats['submitted'] += 1
+        future.executor = self.executor
+        future.submitted = self.loop.time()
+        future.add_done_callback(lambda f: self.loop.call_soon_threadsafe(group.render_done, f))
+        return future
+
+    def result(self, future):
+        if future.cancelled():
+            return None
+        stats = self.stats
+        latency = self.loop.time() - future.submitted
+        stats['latency'] = latency
+        if latency > stats['max_latency']:
+            stats['max_latency'] = latency
+        try:
+            rv = future.result()
+            stats['done'] += 1
+            return rv
+        except BrokenProcessPool:
+            stats['errors'] += 1
+            # the other futures of the same pool fail too: one restart
+            if future.executor is self.executor:
+                self.restart()
+            return None
+        except Exception:
+            stats['errors'] += 1
+            _LOGGER.error(f'Render error {traceback.format_exc()}')
+            return None
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+
+
 class TcpClient(asyncio.Protocol):
     RECONNECT_INTERVAL = 5.0
+    RENDER_MIN_INTERVAL = 0.1
+    # transport buffer above which a connector is considered stalled
+    WRITE_BUFFER_HIGH = 64 * 1024
     _STASTR = '_________sta_________'
     _STOSTR = '_________sto_________'
     _OPEN_CLIENTS = dict()
     _LOCK = asyncio.Lock()
     _LOADER = None
     _TIMEOUTS = dict()
+    _GROUPS = dict()
+    _BACKEND = None
     _DEFAULT_VARS = dict(const=util.const,
                          devs=dict(),
                          util=VelocityUtils,
@@ -43,16 +431,27 @@ class TcpClient(asyncio.Protocol):
                          macros=dict(),
                          logger=_LOGGER,
                          aliases=[])
-    _VARS = deep_clone(_DEFAULT_VARS)
+    _NAMESPACE = VersionedNamespace(_DEFAULT_VARS)
 
     @staticmethod
     def reset_templates():
-        dest = deep_clone(TcpClient._DEFAULT_VARS)
-        for _, tcp in TcpClient._OPEN_CLIENTS.copy().items():
-            if tcp['obj']:
-                dest[tcp['obj'].vm_var] = dict(macro=0)
-        TcpClient._VARS = dest
-        _LOGGER.info(f'New dict is {TcpClient._VARS}')
+        TcpClient._NAMESPACE.reset([tcp['obj'].vm_var for tcp in TcpClient._OPEN_CLIENTS.copy().values() if tcp['obj']])
+        for group in TcpClient._GROUPS.values():
+            group.versions = None
+        _LOGGER.info(f'New dict is {TcpClient._NAMESPACE}')
+
+    @staticmethod
+    def set_render_backend(kind, workers=1, loop=None):
+        """Render in a thread or process pool (kind in RenderBackend.BACKENDS) or on the loop (kind empty)."""
+        if TcpClient._BACKEND:
+            TcpClient._BACKEND.shutdown()
+            TcpClient._BACKEND = None
+        for group in TcpClient._GROUPS.values():
+            group.inflight = None
+            group.pending = None
+        if kind:
+            _LOGGER.info(f'Rendering templates with {workers} {kind} workers')
+            TcpClient._BACKEND = RenderBackend(kind, workers=workers, loop=loop)
 
     @staticmethod
     async def set_open_clients(hp, dct, action=None):
@@ -73,8 +472,7 @@ class TcpClient(asyncio.Protocol):
         if TcpClient._LOADER is None:
             dir = dirname(template_file)
             TcpClient._LOADER = CachingFileLoader(dir)
-        if vm_var not in TcpClient._VARS:
-            TcpClient._VARS[vm_var] = dict(macro=0, **kwargs)
+        TcpClient._NAMESPACE.set_var(vm_var, macro=0, **kwargs)
         return TcpClient._LOADER.load_template(template_file)
 
     def __init__(self,
@@ -93,76 +491,113 @@ class TcpClient(asyncio.Protocol):
         self.template = TcpClient.load_template(template_file, self.vm_var, **kwargs)
         self.stopped = False
         self.stop_event = asyncio.Event()
+        self.network = write_out is None
         self.write_out = write_out if write_out else self._network_write
+        self.paused = False
+        self.pending = None
+        self.write_stats = dict(writes=0, bytes=0, dropped=0, pending_bytes=0,
+                                latency=0.0, max_latency=0.0, paused=0)
+        self.group = TcpClient.get_group(template_file, self.template, self.vm_var, loop)
+        self.group.add(self)
         Timer(0, partial(TcpClient.set_open_clients, hp, dict(obj=self)))
         super(TcpClient, self).__init__()
 
     def get_var(self, v):
         if v is None:
-            return self._VARS[self.vm_var]
+            return self._NAMESPACE[self.vm_var]
         else:
-            return self._VARS[self.vm_var].get(v)
+            return self._NAMESPACE[self.vm_var].get(v)
+
+    @staticmethod
+    def get_group(template_file, template, vm_var, loop):
+        group = TcpClient._GROUPS.get(template_file)
+        if group is None:
+            group = TcpClient._GROUPS[template_file] = TemplateGroup(template_file, template, vm_var, loop)
+        return group
+
+    @staticmethod
+    def touch(*keys):
+        TcpClient._NAMESPACE.touch(*keys)
 
     @staticmethod
     def set_timeout(alias):
-        TcpClient._VARS[alias]['fitobj'] = None
+        if alias in TcpClient._NAMESPACE:
+            TcpClient._NAMESPACE.update_device(alias, fitobj=None)
 
     @staticmethod
     def update_namespace(devobj, **kwargs):
-        v = TcpClient._VARS
-        alias = None
         if devobj:
             alias = devobj.get_alias()
-            if alias not in v:
-                v[alias] = dict()
-                v['devs'][alias] = v[alias]
-                TcpClient._VARS['aliases'].append(alias)
-            v = v[alias]
-        for key, value in kwargs.items():
-            if key == 'fitobj' and alias:
+            if 'fitobj' in kwargs:
                 if alias in TcpClient._TIMEOUTS:
-                    TcpClient._TIMEOUTS[alias].cancel()
-                TcpClient._TIMEOUTS[alias] = Timer(5, partial(TcpClient.set_timeout, alias))
-            v[key] = value
-        return TcpClient._VARS
+                    TcpClient._TIMEOUTS[alias].rearm()
+                else:
+                    TcpClient._TIMEOUTS[alias] = Timer(5, partial(TcpClient.set_timeout, alias))
+            TcpClient._NAMESPACE.update_device(alias, **kwargs)
+        else:
+            TcpClient._NAMESPACE.update(**kwargs)
+        return TcpClient._NAMESPACE.snapshot()
 
     @staticmethod
     def format(devobj, **kwargs):
         dictvars = TcpClient.update_namespace(devobj, **kwargs)
-        for _, tcp in TcpClient._OPEN_CLIENTS.copy().items():
-            if tcp['obj']:
-                tcp['obj']._format(dictvars)
+        for group in TcpClient._GROUPS.values():
+            if group.clients:
+                group.format(dictvars)
         return dictvars
 
     def _format(self, dct):
         if not self.stopped:
-            rv = ''
-            if self.template:
-                try:
-                    _LOGGER.debug(f'Merging {self.vm_var} with {dct}')
-                    out = self.template.merge(dct, loader=self._LOADER)
-                    if 'stastr' in dct[self.vm_var] and 'stostr' in dct[self.vm_var]:
-                        stastr = dct[self.vm_var]['stastr']
-                        stostr = dct[self.vm_var]['stostr']
-                        while True:
-                            mo = re.search(stastr + r'[\n\r]*', out)
-                            if mo:
-                                out = out[mo.end():]
-                            else:
-                                break
-                            mo = re.search(stostr + r'[\n\r]*', out)
-                            if mo:
-                                rv += out[:mo.start()]
-                                out = out[mo.end():]
-                            else:
-                                break
-                    else:
-                        rv = out
-                except Exception:
-                    _LOGGER.error(f'VTL error {traceback.format_exc()}')
-                # self._VARS[self.vm_var] = 1
-            if rv:
-                self.write_out(rv)
+            records, framing = self.group.merge(dct)
+            if records:
+                if self.network:
+                    self.write_records(RecordCollector.frame(records, framing))
+                else:
+                    self.write_out(''.join(records))
+
+    def write_records(self, framed):
+        # latest wins: while the peer is not reading, only the most recent
+        # output is kept and sent when the transport resumes
+        if self.transport:
+            if self.paused or self.transport.get_write_buffer_size() > self.WRITE_BUFFER_HIGH:
+                stats = self.write_stats
+                if self.pending:
+                    stats['dropped'] += 1
+                    self.pending = (framed, self.pending[1])
+                else:
+                    self.pending = (framed, self.loop.time())
+                stats['pending_bytes'] = sum([len(b) for b in framed])
+            else:
+                self._write_framed(framed, None)
+
+    def _write_framed(self, framed, since):
+        stats = self.write_stats
+        self.transport.writelines(framed)
+        stats['writes'] += 1
+        stats['bytes'] += sum([len(b) for b in framed])
+        if since is not None:
+            latency = self.loop.time() - since
+            stats['latency'] = latency
+            if latency > stats['max_latency']:
+                stats['max_latency'] = latency
+
+    def get_write_stats(self):
+        return dict(self.write_stats,
+                    buffer=self.transport.get_write_buffer_size() if self.transport else 0)
+
+    def pause_writing(self):
+        _LOGGER.debug(f'Pause writing to {self.hp[0]}:{self.hp[1]}')
+        self.paused = True
+        self.write_stats['paused'] += 1
+
+    def resume_writing(self):
+        _LOGGER.debug(f'Resume writing to {self.hp[0]}:{self.hp[1]}')
+        self.paused = False
+        if self.pending and self.transport:
+            framed, since = self.pending
+            self.pending = None
+            self.write_stats['pending_bytes'] = 0
+            self._write_framed(framed, since)
 
     def _network_write(self, out):
         if self.transport:
@@ -170,6 +605,10 @@ class TcpClient(asyncio.Protocol):
 
     def connection_made(self, transport):
         self.transport = transport
+        self.paused = False
+        self.pending = None
+        transport.set_write_buffer_limits(high=self.WRITE_BUFFER_HIGH)
+        self.group.versions = None
         _LOGGER.info(f'Connection to {self.hp[0]}:{self.hp[1]} estabilished')
 
     def data_received(self, data):
@@ -181,6 +620,7 @@ class TcpClient(asyncio.Protocol):
     def _stop(self):
         _LOGGER.info('Stop called')
         self.stopped = True
+        self.group.remove(self)
         if self.transport:
             try:
                 self.transport.close()
@@ -274,4 +714,5 @@ class TcpClient(asyncio.Protocol):
 
     def connection_lost(self, exc):
         self.transport = None
+        self.group.remove(self)
         Timer(0, partial(TcpClient.set_open_clients, self.hp, None, self.on_connection_lost_done))